@@ -3,12 +3,23 @@ import os
 from logging.config import dictConfig
 
 import werkzeug
-from flask import Flask, render_template, session, g, request
+from flask import Flask, render_template, session, g, request, url_for
 
 from application.db import get_db
+from application.cache import get_cache
 from application.auth import login_required
-from application.helpers import render_404
-from application.tasks import scrape_movie_command, scrape_home_movies_command
+from application.helpers import render_404, env_config
+from application.leaderboard import leaderboard_page, total_scored_quizzes, backfill_leaderboard_command
+from application.tasks import scrape_movie_command, scrape_home_movies_command, benchmark_parser_command
+from application.crawler import crawl_command
+from application.benchmark import benchmark_command
+from application.synthetic import seed_synthetic_command
+from application.loadtest import load_test_command
+from application.slowlog import slow_queries_command
+from application.expiry import sweep_expired_command
+from application.refresh import refresh_catalog_command
+from application.catalog import build_catalog_snapshot_command
+from application.question_bank import refill_question_bank_command, question_bank_stats_command
 
 dictConfig({
     'version': 1,
@@ -27,26 +38,76 @@ dictConfig({
 })
 
 
+# optional settings, each one can be overridden by an environment variable of the same name
+DEFAULT_CONFIG = {
+    'LEADERBOARD_COUNT_TTL': 30,
+    'LEADERBOARD_PAGE_WINDOW': 2,
+    'CATALOG_DATABASE': None,
+    'CATALOG_SNAPSHOT': None,
+    'CATALOG_SNAPSHOT_CHECK_SECONDS': 5,
+    'QUESTION_BANK_ENABLED': False,
+    'QUESTION_BANK_LOW_WATER': 50,
+    'QUESTION_BANK_HIGH_WATER': 200,
+    'QUIZ_EAGER_GENERATION': False,
+    'SQLITE_POOL': True,
+    'SQLITE_JOURNAL_MODE': 'wal',
+    'SQLITE_SYNCHRONOUS': 'normal',
+    'SQLITE_CACHE_SIZE': -16000,
+    'SQLITE_MMAP_SIZE': 268435456,
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_TEMP_STORE': 'memory',
+    'SQLITE_CACHED_STATEMENTS': 256,
+    'USER_CACHE_SIZE': 10000,
+    'USER_CACHE_TTL': 60,
+    'QUIZ_CACHE_SIZE': 10000,
+    'QUIZ_CACHE_TTL': 30,
+    'SCORE_CACHE_SIZE': 1000,
+    'SCORE_CACHE_TTL': 3600,
+    'SCRAPE_BASE_URL': 'https://www.imdb.com',
+    'SCRAPE_CONCURRENCY': 8,
+    'SCRAPE_RATE_LIMIT': 4.0,
+    'SCRAPE_TIMEOUT': 10.0,
+    'SCRAPE_RETRIES': 3,
+    'SCRAPE_BACKOFF': 0.5,
+    'SCRAPE_CACHE_DIR': None,
+    'SCRAPE_CACHE_TTL': 86400,
+    'SCRAPE_CACHE_MAX_BYTES': 1 << 30,
+    'SCRAPE_PARSE_WORKERS': 0,
+    'INGEST_BATCH_SIZE': 200,
+    'CRAWL_MAX_DEPTH': 2,
+    'CRAWL_MAX_PAGES': 1000,
+    'REFRESH_BATCH_SIZE': 50,
+    'REFRESH_MIN_AGE': 7 * 24 * 3600,
+    'METRICS_ENABLED': False,
+    'METRICS_TOKEN': None,
+    'SLOW_QUERY_LOG': None,
+    'SLOW_QUERY_MS': 100,
+}
+
+
 def create_app(test_config=None):
     app = Flask(__name__)
     db_path = os.path.join(os.path.dirname(__file__), "db.sqlite")
+    app.config.from_mapping(DEFAULT_CONFIG)
 
     if test_config is None:
         app.config.from_mapping(
             SECRET_KEY=os.environ.get("SECRET_KEY"),
             DATABASE=db_path,
             ACTIVATION_FILE=os.environ.get("ACTIVATION_FILE"),
-            DATETIME_FORMAT=os.environ.get("DATETIME_FORMAT"),
             QUESTION_TIMEOUT_SECONDS=int(os.environ.get("QUESTION_TIMEOUT_SECONDS")),
             QUIZ_TIMEOUT_SECONDS=int(os.environ.get("QUIZ_TIMEOUT_SECONDS")),
             PAGE_SIZE=int(os.environ.get("PAGE_SIZE"))
         )
+        app.config.from_mapping(env_config(DEFAULT_CONFIG))
 
     else:
         app.config.from_mapping(test_config)
 
-    from . import db
+    from . import db, cache, metrics
     db.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
 
     from . import auth, quiz
     app.register_blueprint(auth.bp)
@@ -54,6 +115,18 @@ def create_app(test_config=None):
 
     app.cli.add_command(scrape_movie_command)
     app.cli.add_command(scrape_home_movies_command)
+    app.cli.add_command(benchmark_parser_command)
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(seed_synthetic_command)
+    app.cli.add_command(load_test_command)
+    app.cli.add_command(slow_queries_command)
+    app.cli.add_command(crawl_command)
+    app.cli.add_command(refresh_catalog_command)
+    app.cli.add_command(sweep_expired_command)
+    app.cli.add_command(backfill_leaderboard_command)
+    app.cli.add_command(build_catalog_snapshot_command)
+    app.cli.add_command(refill_question_bank_command)
+    app.cli.add_command(question_bank_stats_command)
 
     @app.before_request
     def load_logged_in_user():
@@ -62,9 +135,14 @@ def create_app(test_config=None):
         if user_id is None:
             g.user = None
         else:
-            g.user = (
-                get_db().execute("SELECT * FROM user WHERE id = ?", (user_id,)).fetchone()
-            )
+            user_cache = get_cache('user')
+            g.user = user_cache.get(user_id)
+            if g.user is None:
+                g.user = (
+                    get_db().execute("SELECT * FROM user WHERE id = ?", (user_id,)).fetchone()
+                )
+                if g.user is not None:
+                    user_cache.set(user_id, g.user)
 
     @app.errorhandler(werkzeug.exceptions.BadRequest)
     @app.errorhandler(werkzeug.exceptions.NotFound)
@@ -87,23 +165,21 @@ def create_app(test_config=None):
             except Exception:
                 page = 1
         db = get_db()
-        leaderboards = db.execute(
-            "SELECT user.username, quiz_state.id as quiz_id, "
-            "SUM(CASE WHEN question_option.is_correct THEN 1 ELSE 0 END) AS score "
-            "FROM user "
-            "INNER JOIN quiz_state on user.id=quiz_state.user_id "
-            "INNER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id "
-            "LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id "
-            "WHERE quiz_state.locked = 1 "
-            "GROUP BY user.id, quiz_state.id "
-            "ORDER BY score DESC "
-            F"LIMIT {app.config['PAGE_SIZE']} OFFSET {(page - 1) * app.config['PAGE_SIZE']}").fetchall()
-
-        total_quizes = db.execute("SELECT COUNT(*) AS total from quiz_state WHERE locked = 1").fetchone()['total']
-        total_pages = total_quizes // app.config['PAGE_SIZE']
-        if total_quizes % app.config['PAGE_SIZE']:
+        page_size = app.config['PAGE_SIZE']
+        leaderboard = leaderboard_page(db, page_size, page=page, cursor=request.args.get('cursor'),
+                                       window=app.config['LEADERBOARD_PAGE_WINDOW'])
+
+        total_quizes = total_scored_quizzes(db, ttl=app.config['LEADERBOARD_COUNT_TTL'])
+        total_pages = total_quizes // page_size
+        if total_quizes % page_size:
             total_pages += 1
 
-        return render_template("home.html", leaderboards=leaderboards, offset=page - 1, total_pages=total_pages)
+        pages = [(no, url_for('home', cursor=token) if token else url_for('home', page=no))
+                 for no, token in leaderboard['pages']]
+        page_urls = dict(pages)
+        return render_template("home.html", leaderboards=leaderboard['rows'], offset=leaderboard['page'] - 1,
+                               pages=pages, total_pages=total_pages,
+                               previous_url=page_urls.get(leaderboard['page'] - 1),
+                               next_url=page_urls.get(leaderboard['page'] + 1))
 
     return app
@@ -12,10 +12,12 @@ from flask import (
     session,
     url_for,
     current_app,
+    jsonify,
 )
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from application.db import get_db
+from application.cache import get_cache
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -101,6 +103,9 @@ def activate_username(username):
             db = get_db()
             db.execute("UPDATE user SET is_activated = ? WHERE username = ?", (True, username))
             db.commit()
+            user = db.execute("SELECT id FROM user WHERE username = ?", (username,)).fetchone()
+            if user is not None:
+                get_cache('user').delete(user['id'])
             flash("User activated", category='success')
             return redirect(url_for("auth.login"))
 
@@ -154,3 +159,14 @@ def login_required(view):
         return view(**kwargs)
 
     return wrapped_view
+
+
+def api_login_required(view):
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if g.user is None:
+            return jsonify(error="login required"), 401
+
+        return view(**kwargs)
+
+    return wrapped_view
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import statistics
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from application.db import get_db, get_pool, init_db
+from application.synthetic import bulk_writes, generate_catalog, generate_quizzes, generate_users
+from application.questions import rating_options, general_field_options, movie_detail_options
+
+BENCHMARK_USER = ('benchmark', 'benchmark')
+LEADERBOARD_USERS = 100
+LEADERBOARD_QUIZZES = 1000
+
+
+def _summary(timings):
+    """
+        milliseconds summary of a list of timings in seconds
+    """
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'mean_ms': statistics.mean(timings) * 1000,
+    }
+
+
+def _timed(timings, name, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings.setdefault(name, []).append(time.perf_counter() - started)
+    return result
+
+
+def _seed_benchmark_db(db, size, seed):
+    """
+        the synthetic catalog plus an activated benchmark user among synthetic players of a page of quizzes for
+        the leaderboard
+    """
+    with bulk_writes(db):
+        generate_catalog(db, size, seed=seed)
+        generate_users(db, LEADERBOARD_USERS, seed=seed)
+        username, password = BENCHMARK_USER
+        db.execute("INSERT INTO user (username, password, is_activated) VALUES (?, ?, 1)",
+                   (username, generate_password_hash(password)))
+        generate_quizzes(db, LEADERBOARD_QUIZZES, seed=seed)
+        db.commit()
+
+
+def benchmark_app(config, workdir, size, seed=0):
+    """
+        an app over the benchmark database of `size` movies, built in workdir once and reused by later runs
+
+        - the catalog is always read from this sqlite file, a configured CATALOG_SNAPSHOT or CATALOG_DATABASE
+          describes another database
+    """
+    from application import create_app
+
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, 'catalog-%s-%s.sqlite' % (size, seed))
+    app = create_app(dict(config, DATABASE=path, CATALOG_DATABASE=None, CATALOG_SNAPSHOT=None, TESTING=False,
+                          SECRET_KEY=config.get('SECRET_KEY') or 'benchmark'))
+    with app.app_context():
+        db = get_db()
+        try:
+            ready = db.execute("SELECT COUNT(*) FROM user WHERE username = ?", BENCHMARK_USER[:1]).fetchone()[0]
+        except Exception:
+            ready = False
+        if not ready:
+            init_db()
+            _seed_benchmark_db(db, size, seed)
+    return app
+
+
+def _answer_option(db, quiz_id):
+    row = db.execute("SELECT question_option.id FROM quiz_question INNER JOIN question_option "
+                     "ON quiz_question.id = question_option.question_id "
+                     "WHERE quiz_question.quiz_id = ? AND quiz_question.locked = 0 "
+                     "ORDER BY quiz_question.id, question_option.id LIMIT 1", (quiz_id,)).fetchone()
+    return row and row['id']
+
+
+def _create_quiz(client):
+    response = client.get('/quiz/create')
+    assert response.status_code == 302, "Could not create a quiz: %s" % response.status
+    quiz_url = response.headers['Location']
+    client.get(quiz_url)
+    return int(quiz_url.rstrip('/').split('/')[-2]), quiz_url
+
+
+def benchmark_catalog(app, iterations=50):
+    """
+        times question generation, option sampling and the home and question pages against the app database
+
+        - the generated questions are rolled back, the pages are requested as the benchmark user through the test
+          client, answering the current question and starting a new quiz once the last one is answered
+        - returns {name: summary} with the median, 95th percentile and mean milliseconds of every timed call
+    """
+    from application.quiz import _generate_random_question
+
+    timings = {}
+    with app.app_context():
+        db = get_db()
+        movie = db.execute("SELECT * FROM movie ORDER BY id LIMIT 1 OFFSET ?",
+                           (db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] // 2,)).fetchone()
+        actors = [row['value'] for row in db.execute(
+            "SELECT value FROM movie_detail WHERE movie_id = ? AND key = 'actor'", (movie['id'],))]
+        for _ in range(iterations):
+            _timed(timings, 'rating_options', rating_options, '%.1f' % movie['rating'])
+            _timed(timings, 'general_field_options', general_field_options, 'released_date', movie['released_date'])
+            _timed(timings, 'movie_detail_options', movie_detail_options, 'actor', *actors)
+            _timed(timings, '_generate_random_question', _generate_random_question, db, 0, 2)
+            db.rollback()
+
+    client = app.test_client()
+    username, password = BENCHMARK_USER
+    client.post('/auth/login', data={'username': username, 'password': password})
+    quiz_id, quiz_url = _create_quiz(client)
+    for _ in range(iterations):
+        response = _timed(timings, 'home', client.get, '/')
+        assert response.status_code == 200, "GET / failed: %s" % response.status
+        response = _timed(timings, 'question_get', client.get, quiz_url)
+        assert response.status_code == 200, "GET %s failed: %s" % (quiz_url, response.status)
+        with app.app_context():
+            answer = _answer_option(get_db(), quiz_id)
+        response = _timed(timings, 'question_post', client.post, quiz_url, data={'answer': answer})
+        assert response.status_code in (200, 302), "POST %s failed: %s" % (quiz_url, response.status)
+        if response.status_code == 302:
+            quiz_id, quiz_url = _create_quiz(client)
+    return {name: _summary(values) for name, values in timings.items()}
+
+
+def compare_results(current, baseline, threshold=0.2):
+    """
+        the timings of current whose median is more than threshold (0.2 = 20%) slower than in the baseline
+
+        - returns a list of (catalog size, name, baseline median ms, current median ms)
+    """
+    regressions = []
+    for size, results in sorted(current['results'].items()):
+        for name, summary in sorted(results.items()):
+            base = baseline['results'].get(size, {}).get(name)
+            if base is not None and summary['median_ms'] > base['median_ms'] * (1 + threshold):
+                regressions.append((size, name, base['median_ms'], summary['median_ms']))
+    return regressions
+
+
+@click.command("benchmark")
+@click.option('--sizes', default='1000,100000,1000000', help='comma separated numbers of movies of each catalog')
+@click.option('--iterations', default=50, help='timed runs of each call per catalog')
+@click.option('--workdir', default=None,
+              help='directory of the generated catalogs, defaults to application/storage/benchmarks')
+@click.option('--seed', default=0, help='seed of the synthetic catalogs')
+@click.option('--output', default=None, help='json file the results are written to')
+@click.option('--baseline', default=None, help='json results of a previous run to compare with')
+@click.option('--threshold', default=0.2, help='allowed median slowdown against the baseline, 0.2 = 20%')
+@with_appcontext
+def benchmark_command(sizes, iterations, workdir, seed, output, baseline, threshold):
+    """
+        times question generation, option sampling, the leaderboard and the question pages on synthetic catalogs
+
+        $ flask benchmark --sizes 1000,100000 --output benchmark.json
+
+        _fails when a median is more than 20% slower than in the baseline_
+        $ flask benchmark --baseline benchmark.json
+    """
+    workdir = workdir or os.path.join(current_app.root_path, 'storage', 'benchmarks')
+    current = {'iterations': iterations, 'results': {}}
+    for size in [int(size) for size in sizes.split(',') if size.strip()]:
+        started = time.monotonic()
+        app = benchmark_app(current_app.config, workdir, size, seed=seed)
+        click.echo("Catalog of %s movies ready in %.1fs." % (size, time.monotonic() - started))
+        try:
+            results = benchmark_catalog(app, iterations=iterations)
+        finally:
+            get_pool(app).close()
+        current['results'][str(size)] = results
+        for name, summary in sorted(results.items()):
+            click.echo("%10s %-28s median %8.3fms  p95 %8.3fms  mean %8.3fms" % (
+                size, name, summary['median_ms'], summary['p95_ms'], summary['mean_ms']))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_results(current, json.load(f), threshold=threshold)
+        for size, name, base, now in regressions:
+            click.echo("%10s %-28s %.3fms -> %.3fms (+%.0f%%)" % (size, name, base, now, (now / base - 1) * 100))
+        if regressions:
+            raise click.ClickException("%s timings regressed by more than %.0f%%." % (len(regressions),
+                                                                                      threshold * 100))
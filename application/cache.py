@@ -0,0 +1,67 @@
+import time
+import threading
+
+from collections import OrderedDict
+from flask import current_app
+
+
+class LRUCache:
+    """
+        thread-safe LRU mapping whose entries expire ttl seconds after being set, a ttl of 0 disables it
+
+        - lives in the process memory, every worker process has its own copy
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def get_cache(name):
+    return current_app.extensions['caches'][name]
+
+
+def init_app(app):
+    app.extensions['caches'] = {
+        'user': LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL']),
+        'quiz': LRUCache(app.config['QUIZ_CACHE_SIZE'], app.config['QUIZ_CACHE_TTL']),
+        'score': LRUCache(app.config['SCORE_CACHE_SIZE'], app.config['SCORE_CACHE_TTL']),
+    }
@@ -0,0 +1,346 @@
+import os
+import mmap
+import time
+import array
+import bisect
+import random
+import struct
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import get_db
+from application.sampling import (
+    DRAWS_PER_VALUE,
+    RANKED_FIELDS,
+    random_movie,
+    sample_movie_values,
+    sample_detail_values,
+    sample_ranked_movies,
+    shared_detail_movie,
+    sample_unrelated_movies,
+)
+
+MAGIC = b'MQCATLG2'
+HEADER = struct.Struct('<8sQI')
+SECTION = struct.Struct('<24sQQc7x')
+ALIGNMENT = 8
+
+DETAIL_KEYS = ('actor', 'creator', 'director', 'genre')
+POOLED_FIELDS = ('name', 'description', 'released_date')
+# detail keys with a value -> movies inverted index, for the questions about movies sharing a value
+INVERTED_KEYS = ('actor', 'director')
+
+_snapshots = {}
+
+
+class SqliteCatalog:
+    """
+        catalog reads served straight from the sqlite database
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def random_movie(self):
+        return random_movie(self.db)
+
+    def movie_details(self, movie_id, key):
+        rows = self.db.execute("SELECT value FROM movie_detail WHERE movie_id = ? AND key = ? ORDER BY value",
+                               (movie_id, key)).fetchall()
+        return [row['value'] for row in rows]
+
+    def sample_movie_values(self, field, exclude, k):
+        return sample_movie_values(self.db, field, exclude, k)
+
+    def sample_detail_values(self, key, excludes, k):
+        return sample_detail_values(self.db, key, excludes, k)
+
+    def sample_ranked_movies(self, field, movie, below, k):
+        return sample_ranked_movies(self.db, field, movie[field], below, k)
+
+    def shared_detail_movie(self, key, movie_id):
+        return shared_detail_movie(self.db, key, movie_id)
+
+    def sample_unrelated_movies(self, key, movie_id, k):
+        return sample_unrelated_movies(self.db, key, movie_id, k)
+
+
+class CatalogSnapshot:
+    """
+        read-only catalog compiled by build_snapshot and memory-mapped from disk
+
+        file layout (little endian):
+            header      magic, build id, number of sections
+            sections    name, offset, byte length and array typecode of each section
+            data        8-byte aligned arrays
+
+        every string is interned once in the `strings` blob (`string_off` holds the offsets), movie columns
+        are arrays indexed by the position of the movie in the sorted `movie_id` array, the details of each
+        key are stored as `<key>_off` (per movie offsets) into `<key>_val`, and `<field>_pool` /
+        `<key>_pool` hold the distinct values used to sample distractors.
+
+        for the cross-movie questions, `<field>_order` lists the movies sorted on a ranked field with, per movie,
+        the rank of the first equal one (`<field>_below`) and of the first greater one (`<field>_above`), and
+        `<key>_movies_off` / `<key>_movies_val` list the movies of every `<key>_pool` value (inverted index).
+
+        the pages are shared by every process mapping the same file, eg. pre-forked gunicorn workers
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.build_id, count = HEADER.unpack_from(self._mmap, 0)
+        assert magic == MAGIC, "%s is not a catalog snapshot" % path
+        buffer = memoryview(self._mmap)
+        self.sections = {}
+        for i in range(count):
+            name, offset, length, typecode = SECTION.unpack_from(self._mmap, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b'\0').decode()] = buffer[offset: offset + length].cast(typecode.decode())
+        self.movie_ids = self.sections['movie_id']
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def _string(self, string_id):
+        offsets = self.sections['string_off']
+        return bytes(self.sections['strings'][offsets[string_id]: offsets[string_id + 1]]).decode('utf8')
+
+    def movie_at(self, index):
+        return {
+            'id': self.movie_ids[index],
+            'name': self._string(self.sections['name'][index]),
+            'description': self._string(self.sections['description'][index]),
+            'released_date': self._string(self.sections['released_date'][index]),
+            'rating': self.sections['rating'][index],
+        }
+
+    def random_movie(self):
+        if not len(self):
+            return None
+        return self.movie_at(random.randrange(len(self)))
+
+    def _index(self, movie_id):
+        index = bisect.bisect_left(self.movie_ids, movie_id)
+        if index == len(self) or self.movie_ids[index] != movie_id:
+            return None
+        return index
+
+    def _name(self, index):
+        return self._string(self.sections['name'][index])
+
+    def _detail_ids(self, key, index):
+        offsets = self.sections['%s_off' % key]
+        return self.sections['%s_val' % key][offsets[index]: offsets[index + 1]]
+
+    def movie_details(self, movie_id, key):
+        index = self._index(movie_id)
+        if index is None:
+            return []
+        return [self._string(value) for value in self._detail_ids(key, index)]
+
+    def _sample_pool(self, pool, excludes, k):
+        values = []
+        if len(pool) > k * DRAWS_PER_VALUE:
+            for _ in range(k * DRAWS_PER_VALUE):
+                value = self._string(pool[random.randrange(len(pool))])
+                if value not in excludes and value not in values:
+                    values.append(value)
+                    if len(values) == k:
+                        return values
+        candidates = [value for value in (self._string(i) for i in pool) if value not in excludes]
+        return random.sample(candidates, min(k, len(candidates)))
+
+    def sample_movie_values(self, field, exclude, k):
+        return self._sample_pool(self.sections['%s_pool' % field], (exclude,), k)
+
+    def sample_detail_values(self, key, excludes, k):
+        return self._sample_pool(self.sections['%s_pool' % key], excludes, k)
+
+    def sample_ranked_movies(self, field, movie, below, k):
+        index = self._index(movie['id'])
+        if index is None:
+            return []
+        if below:
+            start, end = 0, self.sections['%s_below' % field][index]
+        else:
+            start, end = self.sections['%s_above' % field][index], len(self)
+        order = self.sections['%s_order' % field]
+        return [self._name(order[rank]) for rank in random.sample(range(start, end), min(k, end - start))]
+
+    def shared_detail_movie(self, key, movie_id):
+        index = self._index(movie_id)
+        if index is None:
+            return None
+        pool, offsets = self.sections['%s_pool' % key], self.sections['%s_movies_off' % key]
+        movies = self.sections['%s_movies_val' % key]
+        # like the sqlite catalog: the values in random order, a random other movie of the first shared one
+        values = list(set(self._detail_ids(key, index)))
+        random.shuffle(values)
+        for value in values:
+            position = bisect.bisect_left(pool, value)
+            start, end = offsets[position], offsets[position + 1]
+            if end - start > 1:
+                draw = random.randrange(start, end - 1)
+                return self._name(movies[end - 1] if movies[draw] == index else movies[draw])
+        return None
+
+    def sample_unrelated_movies(self, key, movie_id, k):
+        index = self._index(movie_id)
+        values = set(self._detail_ids(key, index)) if index is not None else set()
+        names = []
+        for _ in range(k * DRAWS_PER_VALUE if len(self) else 0):
+            other = random.randrange(len(self))
+            if values.isdisjoint(self._detail_ids(key, other)):
+                name = self._name(other)
+                if name not in names:
+                    names.append(name)
+                    if len(names) == k:
+                        break
+        return names
+
+
+def build_snapshot(db, path):
+    """
+        compiles the movie catalog into a snapshot file, written next to path and atomically renamed over it
+    """
+    strings, string_ids = [], {}
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value.encode('utf8'))
+        return string_ids[value]
+
+    sections = {'movie_id': array.array('q'), 'rating': array.array('d')}
+    ranked = {field: [] for field in RANKED_FIELDS}
+    for field in POOLED_FIELDS:
+        sections[field] = array.array('i')
+    for movie in db.execute("SELECT id, name, description, released_date, rating FROM movie ORDER BY id"):
+        sections['movie_id'].append(movie['id'])
+        sections['rating'].append(movie['rating'])
+        for field in POOLED_FIELDS:
+            sections[field].append(intern(str(movie[field])))
+        for field in RANKED_FIELDS:
+            ranked[field].append(movie[field])
+    for field in POOLED_FIELDS:
+        sections['%s_pool' % field] = array.array('i', sorted(set(sections[field])))
+    for field, values in ranked.items():
+        order = sorted(range(len(values)), key=values.__getitem__)
+        below, above = array.array('i', bytes(4 * len(values))), array.array('i', bytes(4 * len(values)))
+        first = 0
+        for rank, index in enumerate(order):
+            if values[index] != values[order[first]]:
+                first = rank
+            below[index] = first
+        following = len(order)
+        for rank in reversed(range(len(order))):
+            if rank + 1 < len(order) and values[order[rank]] != values[order[rank + 1]]:
+                following = rank + 1
+            above[order[rank]] = following
+        sections['%s_order' % field] = array.array('i', order)
+        sections['%s_below' % field] = below
+        sections['%s_above' % field] = above
+
+    positions = {movie_id: i for i, movie_id in enumerate(sections['movie_id'])}
+    for key in DETAIL_KEYS:
+        per_movie = [[] for _ in positions]
+        rows = db.execute("SELECT movie_id, value FROM movie_detail WHERE key = ? ORDER BY movie_id, value", (key,))
+        for row in rows:
+            if row['movie_id'] in positions:
+                per_movie[positions[row['movie_id']]].append(intern(row['value']))
+        offsets, values = array.array('q', [0]), array.array('i')
+        for movie_values in per_movie:
+            values.extend(movie_values)
+            offsets.append(len(values))
+        sections['%s_off' % key] = offsets
+        sections['%s_val' % key] = values
+        sections['%s_pool' % key] = array.array('i', sorted(set(values)))
+        if key in INVERTED_KEYS:
+            pool_positions = {value: i for i, value in enumerate(sections['%s_pool' % key])}
+            postings = [[] for _ in pool_positions]
+            for index in range(len(per_movie)):
+                for value in set(values[offsets[index]: offsets[index + 1]]):
+                    postings[pool_positions[value]].append(index)
+            movies_offsets, movies = array.array('q', [0]), array.array('i')
+            for posting in postings:
+                movies.extend(posting)
+                movies_offsets.append(len(movies))
+            sections['%s_movies_off' % key] = movies_offsets
+            sections['%s_movies_val' % key] = movies
+
+    string_offsets = array.array('q', [0])
+    for value in strings:
+        string_offsets.append(string_offsets[-1] + len(value))
+    sections['string_off'] = string_offsets
+    sections['strings'] = array.array('B', b''.join(strings))
+
+    table_size = HEADER.size + len(sections) * SECTION.size
+    offset = table_size + -table_size % ALIGNMENT
+    table, layout = [], []
+    for name, data in sections.items():
+        length = len(data) * data.itemsize
+        table.append(SECTION.pack(name.encode(), offset, length, data.typecode.encode()))
+        layout.append((offset, data))
+        offset += length + -length % ALIGNMENT
+
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, time.time_ns(), len(sections)))
+        f.write(b''.join(table))
+        for data_offset, data in layout:
+            f.write(b'\0' * (data_offset - f.tell()))
+            data.tofile(f)
+    os.replace(tmp_path, path)
+    return len(sections['movie_id'])
+
+
+def load_snapshot(path, check_interval=5):
+    """
+        returns the snapshot mapped from path, re-mapping it when a new file replaced it
+
+        - the file is stat-ed at most once every check_interval seconds per process
+    """
+    now = time.monotonic()
+    cached = _snapshots.get(path)
+    if cached is not None and cached[0] > now:
+        return cached[2]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _snapshots.pop(path, None)
+        return None
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if cached is not None and cached[1] == version:
+        snapshot = cached[2]
+    else:
+        snapshot = CatalogSnapshot(path)
+    _snapshots[path] = (now + check_interval, version, snapshot)
+    return snapshot
+
+
+def get_catalog():
+    path = current_app.config['CATALOG_SNAPSHOT']
+    if path:
+        snapshot = load_snapshot(path, current_app.config['CATALOG_SNAPSHOT_CHECK_SECONDS'])
+        if snapshot is not None:
+            return snapshot
+    return SqliteCatalog(get_db())
+
+
+@click.command("build-catalog-snapshot")
+@click.option('--output', default=None, help='snapshot file path, defaults to the CATALOG_SNAPSHOT setting')
+@with_appcontext
+def build_catalog_snapshot_command(output):
+    """
+        compiles the movie catalog into a memory-mapped snapshot used for question generation
+
+        $ flask build-catalog-snapshot --output application/storage/catalog.snapshot
+    """
+    path = output or current_app.config['CATALOG_SNAPSHOT']
+    if not path:
+        raise click.UsageError("Pass --output or set CATALOG_SNAPSHOT.")
+    total = build_snapshot(get_db(), path)
+    click.echo("Catalog snapshot with %s movies written to %s." % (total, path))
@@ -0,0 +1,120 @@
+import time
+import click
+
+from collections import Counter
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import catalog_writer
+from application.ingest import ingest_movies, title_id
+from application.parsing import canonical_movie_links, parse_movie_page, parse_movies_list
+from application.scraper import Fetcher
+from application.tasks import exception_handler, get_response
+
+PENDING, CRAWLED, FAILED = 0, 1, 2
+
+
+def enqueue(db, urls, depth):
+    """
+        adds the urls not seen yet to the frontier, the unique url index of crawl_frontier is the seen set
+    """
+    cursor = db.executemany("INSERT OR IGNORE INTO crawl_frontier (url, depth) VALUES (?, ?)",
+                            [(url, depth) for url in urls])
+    return cursor.rowcount
+
+
+@exception_handler
+def _crawl_page(url, fetcher):
+    """
+        returns (movie data or None, canonical movie links) of the page
+    """
+    page = get_response('%s/%s' % (fetcher.base_url, url.lstrip('/')), fetcher=fetcher).text
+    movie_data = None
+    if url.startswith('title/'):
+        movie_data = parse_movie_page(page, url)
+    return movie_data, canonical_movie_links(parse_movies_list(page))
+
+
+def crawl(db, fetcher, seeds=(), max_depth=2, max_pages=1000, batch_size=200):
+    """
+        breadth first crawl from the seed links, following the movie links of every page up to max_depth
+
+        - movie links are canonicalized to 'title/<imdb id>/' so a title is crawled once whatever its ?ref_= suffix
+        - the frontier lives in the crawl_frontier table and is checkpointed with every batch of pages, a crawl
+          called again without seeds (or with the same ones) resumes from the pending pages of the previous one
+        - at most max_pages pages are downloaded per call, the movies found are ingested with ingest_movies
+        - returns a Counter of crawled, failed and discovered pages and of the ingest results
+    """
+    summary = Counter()
+    enqueue(db, seeds, 0)
+    db.commit()
+    while summary['crawled'] + summary['failed'] < max_pages:
+        limit = min(batch_size, max_pages - summary['crawled'] - summary['failed'])
+        rows = db.execute("SELECT id, url, depth FROM crawl_frontier WHERE status = ? ORDER BY depth, id LIMIT ?",
+                          (PENDING, limit)).fetchall()
+        if not rows:
+            break
+        depths = {row['url']: (row['id'], row['depth']) for row in rows}
+        statuses, movies, discovered = [], [], []
+        for url, result in fetcher.map(_crawl_page, list(depths)):
+            page_id, depth = depths[url]
+            if result is None:
+                statuses.append((FAILED, page_id))
+                summary['failed'] += 1
+                continue
+            statuses.append((CRAWLED, page_id))
+            summary['crawled'] += 1
+            movie_data, links = result
+            if movie_data is not None:
+                movies.append(movie_data)
+            if depth < max_depth:
+                discovered.append((links, depth + 1))
+        # written once the batch is downloaded, so the write lock is not held while the pages are downloading.
+        # committed together with the movies of these pages, an interrupted batch is crawled again on resume
+        for links, depth in discovered:
+            summary['discovered'] += enqueue(db, links, depth)
+        db.executemany("UPDATE crawl_frontier SET status = ? WHERE id = ?", statuses)
+        summary.update(ingest_movies(db, movies, batch_size=batch_size))
+        db.commit()
+    summary['pending'] = db.execute("SELECT COUNT(*) FROM crawl_frontier WHERE status = ?", (PENDING,)).fetchone()[0]
+    return summary
+
+
+@click.command("crawl")
+@click.option('--link', 'links', multiple=True, help='seed link(s), eg. /chart/top/, defaults to the home page')
+@click.option('--depth', default=None, type=int, help='links followed from the seeds, defaults to CRAWL_MAX_DEPTH')
+@click.option('--max-pages', default=None, type=int, help='pages downloaded by this run, defaults to CRAWL_MAX_PAGES')
+@click.option('--restart', is_flag=True, help='forget the frontier of the previous crawl')
+@click.option('--retry-failed', is_flag=True, help='crawl the pages that failed in previous runs again')
+@click.option('--offline', is_flag=True, help='serve every page from the response cache only')
+@with_appcontext
+def crawl_command(links, depth, max_pages, restart, retry_failed, offline):
+    """
+        breadth first crawl of imdb movie pages, populating the database with the movies found
+
+        $ flask crawl --link '/search/title/?groups=top_250&sort=user_rating' --depth 2 --max-pages 50000
+
+        _an interrupted crawl resumes where it stopped_
+        $ flask crawl
+    """
+    if offline and not current_app.config['SCRAPE_CACHE_DIR']:
+        raise click.UsageError("--offline needs SCRAPE_CACHE_DIR")
+    started = time.monotonic()
+    config = current_app.config
+    with catalog_writer() as db:
+        if restart:
+            db.execute("DELETE FROM crawl_frontier")
+        if retry_failed:
+            db.execute("UPDATE crawl_frontier SET status = ? WHERE status = ?", (PENDING, FAILED))
+        db.commit()
+        if not links and not db.execute("SELECT 1 FROM crawl_frontier LIMIT 1").fetchone():
+            links = ('/',)
+        seeds = [link if title_id(link) is None else canonical_movie_links([link])[0] for link in links]
+
+        summary = crawl(db, Fetcher.from_config(config, offline=offline), seeds,
+                        max_depth=config['CRAWL_MAX_DEPTH'] if depth is None else depth,
+                        max_pages=max_pages or config['CRAWL_MAX_PAGES'], batch_size=config['INGEST_BATCH_SIZE'])
+    click.echo("%s pages crawled in %.1fs, %s failed, %s new links, %s pending: "
+               "%s movies inserted, %s updated, %s unchanged" % (
+                   summary['crawled'], time.monotonic() - started, summary['failed'], summary['discovered'],
+                   summary['pending'], summary['inserted'], summary['updated'], summary['unchanged']))
@@ -1,18 +1,188 @@
 import os
+import fcntl
+import shutil
+import weakref
+import threading
+import contextlib
+import urllib.parse
 
 import click
 import sqlite3
 
+from collections import Counter
+
 from flask import current_app, g
 from flask.cli import with_appcontext
 
+from application.metrics import TracedConnection, count_statement
+from application.slowlog import SlowQueryLog
+
+# tables of the movie catalog, kept in the CATALOG_DATABASE file when it is set
+CATALOG_TABLES = ('movie', 'movie_detail', 'movie_source', 'crawl_frontier', 'refresh_state')
+
+
+def catalog_uri(path, immutable=False):
+    """
+        read-only sqlite uri of a database file, immutable ones are read without any locking
+    """
+    return 'file:%s?mode=ro%s' % (urllib.parse.quote(os.path.abspath(path)), '&immutable=1' if immutable else '')
+
+
+class _ThreadConnection:
+    """
+        thread-local holder of the pooled connection of one thread, finalized when the thread exits
+    """
+
+    def __init__(self, connection):
+        self.pid = os.getpid()
+        self.connection = connection
+
+
+class ConnectionPool:
+    """
+        keeps one open sqlite connection per thread and reuses it across requests
+
+        - every connection is opened with the SQLITE_* pragmas of the app config and keeps its own prepared
+          statement cache (SQLITE_CACHED_STATEMENTS)
+        - connections inherited through fork() are never reused, the child opens its own
+        - the connection of a thread is closed when the thread exits (its thread-local holder is finalized)
+        - with SQLITE_POOL disabled a connection is opened per request and closed on teardown
+        - with SLOW_QUERY_LOG set, the statements slower than SLOW_QUERY_MS are logged there (see slowlog.py)
+        - with CATALOG_DATABASE set, the catalog file is attached read-only as `catalog` and attached again when
+          catalog_writer swapped a new one in, the unqualified catalog tables resolve to it
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._stats = Counter()
+        self._catalogs = {}
+        self.slow_query_log = None
+        if config["SLOW_QUERY_LOG"]:
+            self.slow_query_log = SlowQueryLog(config["SLOW_QUERY_LOG"], config["SLOW_QUERY_MS"])
+
+    def _connect(self):
+        config = self.config
+        connection = sqlite3.connect(
+            config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+            cached_statements=config["SQLITE_CACHED_STATEMENTS"], uri=True,
+            factory=TracedConnection if config["METRICS_ENABLED"] or self.slow_query_log else sqlite3.Connection
+        )
+        connection.row_factory = sqlite3.Row
+        if config["METRICS_ENABLED"]:
+            connection.set_trace_callback(count_statement)
+        if self.slow_query_log is not None:
+            connection.slow_query_log = self.slow_query_log
+        connection.execute("PRAGMA busy_timeout = %d" % int(config["SQLITE_BUSY_TIMEOUT"]))
+        if config["SQLITE_JOURNAL_MODE"]:
+            connection.execute("PRAGMA journal_mode = %s" % config["SQLITE_JOURNAL_MODE"])
+        connection.execute("PRAGMA synchronous = %s" % config["SQLITE_SYNCHRONOUS"])
+        connection.execute("PRAGMA cache_size = %d" % int(config["SQLITE_CACHE_SIZE"]))
+        connection.execute("PRAGMA mmap_size = %d" % int(config["SQLITE_MMAP_SIZE"]))
+        connection.execute("PRAGMA temp_store = %s" % config["SQLITE_TEMP_STORE"])
+        with self._lock:
+            self._stats["opened"] += 1
+            self._connections.append(connection)
+        return connection
+
+    def attach_catalog(self, connection):
+        """
+            attaches the current CATALOG_DATABASE file to the connection, unless it is already the attached one
+
+            - the file is opened immutable: it is never written in place, a new catalog replaces it
+            - a connection in a transaction or reading the old catalog keeps it until its next acquire
+        """
+        path = self.config["CATALOG_DATABASE"]
+        if not path or connection.in_transaction:
+            return
+        try:
+            stat = os.stat(path)
+            identity = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            identity = None
+        attached = self._catalogs.get(connection)
+        if attached == identity:
+            return
+        try:
+            if attached is not None:
+                connection.execute("DETACH DATABASE catalog")
+                self._catalogs[connection] = None
+            if identity is not None:
+                connection.execute("ATTACH DATABASE ? AS catalog", (catalog_uri(path, immutable=True),))
+                connection.execute("PRAGMA catalog.mmap_size = %d" % int(self.config["SQLITE_MMAP_SIZE"]))
+                self._catalogs[connection] = identity
+        except sqlite3.DatabaseError as err:
+            # the next acquire retries, the connection has no catalog attached in between
+            current_app.logger.error("Attaching the catalog %s failed: %s", path, err)
+            raise
+
+    def detach_catalog(self, connection):
+        if self._catalogs.pop(connection, None) is not None:
+            connection.execute("DETACH DATABASE catalog")
+
+    def acquire(self):
+        if not self.config["SQLITE_POOL"]:
+            connection = self._connect()
+        else:
+            holder = getattr(self._local, "holder", None)
+            if holder is None or holder.pid != os.getpid():
+                holder = self._local.holder = _ThreadConnection(self._connect())
+                weakref.finalize(holder, self._thread_exited, holder.connection, holder.pid)
+            else:
+                with self._lock:
+                    self._stats["reused"] += 1
+            connection = holder.connection
+        self.attach_catalog(connection)
+        return connection
+
+    def release(self, connection):
+        if self.slow_query_log is not None:
+            connection.flush_slow_queries()
+        if not self.config["SQLITE_POOL"]:
+            self._discard(connection)
+            return
+        if connection.in_transaction:
+            connection.rollback()
+
+    def _thread_exited(self, connection, pid):
+        # a connection inherited through fork() is left to the parent process
+        if pid == os.getpid():
+            self._discard(connection)
+
+    def _discard(self, connection):
+        with self._lock:
+            if connection not in self._connections:
+                return
+            self._stats["closed"] += 1
+            self._connections.remove(connection)
+            self._catalogs.pop(connection, None)
+        connection.close()
+
+    def close(self):
+        """closes every connection opened by this process"""
+        self._local = threading.local()
+        for connection in list(self._connections):
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "opened": self._stats["opened"],
+                "reused": self._stats["reused"],
+                "closed": self._stats["closed"],
+                "open": len(self._connections),
+            }
+
+
+def get_pool(app=None):
+    return (app or current_app).extensions["sqlite_pool"]
+
 
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
 
     return g.db
 
@@ -21,14 +191,195 @@ def close_db(e=None):
     db = g.pop("db", None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+
+def _replace_file(staging, path):
+    """
+        durably moves the complete staging database over path, readers keep the file they opened
+    """
+    with open(staging, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(staging, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def _reattach(connection):
+    if connection is not None:
+        get_pool().attach_catalog(connection)
+
+
+@contextlib.contextmanager
+def catalog_writer(publish=True):
+    """
+        connection the catalog tables are written through, its pending transaction is committed at the end
+
+        - single database: the app connection
+        - with CATALOG_DATABASE: a connection to a staging copy of the catalog file, with the quiz database
+          attached read-only, which atomically replaces the catalog file once the block completes. writers are
+          serialized by a lock file, the staging copy of a failed or interrupted writer is resumed by the next one
+        - the staging copy is a full copy of the catalog file, made by the first writer after each replace: with
+          publish=False the committed staging copy is kept for the next writers instead, until publish_catalog()
+    """
+    path = current_app.config["CATALOG_DATABASE"]
+    if not path:
+        db = get_db()
+        yield db
+        db.commit()
+        return
+    staging = path + '.staging'
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(staging):
+            assert os.path.exists(path), "No catalog in %s, run flask split-catalog" % path
+            shutil.copyfile(path, staging + '.tmp')
+            os.replace(staging + '.tmp', staging)
+        connection = sqlite3.connect(staging, detect_types=sqlite3.PARSE_DECLTYPES, uri=True)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode = DELETE")
+            connection.execute("PRAGMA busy_timeout = %d" % int(current_app.config["SQLITE_BUSY_TIMEOUT"]))
+            connection.execute("ATTACH DATABASE ? AS quiz", (catalog_uri(current_app.config["DATABASE"]),))
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+        if not publish:
+            return
+        _replace_file(staging, path)
+    _reattach(g.get("db"))
+
+
+def publish_catalog():
+    """
+        replaces the catalog file with the staging copy kept by catalog_writer(publish=False), if any
+    """
+    path = current_app.config["CATALOG_DATABASE"]
+    if not path:
+        return
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path + '.staging'):
+            return
+        _replace_file(path + '.staging', path)
+    _reattach(g.get("db"))
+
+
+def is_catalog_split(db):
+    """
+        whether the catalog tables live in the CATALOG_DATABASE file rather than in the quiz database
+    """
+    return bool(current_app.config["CATALOG_DATABASE"]) and db.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'movie'").fetchone() is None
+
+
+def split_catalog(db, path):
+    """
+        moves the catalog tables of the quiz database, with their indexes and schema version, to a new catalog file
+        replacing the one at path, returns the number of movies moved
+    """
+    db.commit()
+    staging = path + '.staging'
+    if os.path.exists(staging):
+        os.unlink(staging)
+    tables = ', '.join('?' * len(CATALOG_TABLES))
+    schema = [row[0] for row in db.execute(
+        "SELECT sql FROM main.sqlite_master WHERE tbl_name IN (%s) AND sql IS NOT NULL "
+        "ORDER BY type = 'index', rowid" % tables, CATALOG_TABLES)]
+    catalog = sqlite3.connect(staging, uri=True)
+    try:
+        catalog.executescript(';\n'.join(schema))
+        catalog.execute("ATTACH DATABASE ? AS quiz", (catalog_uri(current_app.config["DATABASE"]),))
+        for table in CATALOG_TABLES:
+            catalog.execute('INSERT INTO main."%s" SELECT * FROM quiz."%s"' % (table, table))
+        movies = catalog.execute("SELECT COUNT(*) FROM main.movie").fetchone()[0]
+        catalog.execute("PRAGMA main.user_version = %d" % schema_version(db))
+        catalog.commit()
+    finally:
+        catalog.close()
+    _replace_file(staging, path)
+    for table in CATALOG_TABLES:
+        db.execute('DROP TABLE main."%s"' % table)
+    db.commit()
+    get_pool().attach_catalog(db)
+    return movies
+
+
+def _migrations():
+    """
+        numbered sql files in the migrations directory, eg. 0002_hot_path_indexes.sql is schema version 2
+
+        - returns (version, name, database) tuples, database is 'catalog' for the migrations of the catalog tables,
+          whose first line is `-- database: catalog`, and 'main' for the others
+    """
+    migrations_dir = os.path.join(current_app.root_path, "migrations")
+    migrations = []
+    for name in sorted(os.listdir(migrations_dir)):
+        if name.endswith(".sql"):
+            with open(os.path.join(migrations_dir, name)) as f:
+                first_line = f.readline().strip()
+            database = first_line.split(":", 1)[1].strip() if first_line.startswith("-- database:") else "main"
+            migrations.append((int(name.split("_", 1)[0]), name, database))
+    return migrations
+
+
+def schema_version(db, database="main"):
+    return db.execute("PRAGMA %s.user_version" % database).fetchone()[0]
+
+
+def _apply_migrations(db, migrations):
+    version = schema_version(db)
+    for migration_version, name, _ in migrations:
+        if migration_version <= version:
+            continue
+        with current_app.open_resource(os.path.join("migrations", name)) as f:
+            script = f.read().decode("utf8")
+        try:
+            db.executescript("BEGIN;\n%s\nPRAGMA user_version = %d;\nCOMMIT;" % (script, migration_version))
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        version = migration_version
+    return version
+
+
+def upgrade_db():
+    """
+        applies every pending migration, each one in its own transaction, and returns the new schema version
+
+        - with the catalog in its own file, the catalog migrations are applied to it through catalog_writer and the
+          others to the quiz database, each file keeps its own schema version
+    """
+    db = get_db()
+    migrations = _migrations()
+    if not is_catalog_split(db):
+        return _apply_migrations(db, migrations)
+    version = _apply_migrations(db, [migration for migration in migrations if migration[2] != "catalog"])
+    catalog_migrations = [migration for migration in migrations if migration[2] == "catalog"]
+    if any(migration[0] > schema_version(db, "catalog") for migration in catalog_migrations):
+        with catalog_writer() as catalog:
+            _apply_migrations(catalog, catalog_migrations)
+    return version
 
 
 def init_db():
     db = get_db()
+    get_pool().detach_catalog(db)
+    tables = [row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        db.execute('DROP TABLE IF EXISTS "%s"' % table)
+    db.execute("PRAGMA user_version = 0")
 
     with current_app.open_resource("schema.sql") as f:
         db.executescript(f.read().decode("utf8"))
+    upgrade_db()
+    if current_app.config["CATALOG_DATABASE"]:
+        split_catalog(db, current_app.config["CATALOG_DATABASE"])
 
 
 @click.command("init-db")
@@ -39,10 +390,37 @@ def init_db_command():
     click.echo("Initialized the database.")
 
 
+@click.command("db-upgrade")
+@with_appcontext
+def upgrade_db_command():
+    """Apply pending schema migrations without touching existing data."""
+    version = upgrade_db()
+    click.echo("Database schema is at version %s." % version)
+
+
+@click.command("split-catalog")
+@with_appcontext
+def split_catalog_command():
+    """Move the movie catalog tables of the database to the CATALOG_DATABASE file."""
+    path = current_app.config["CATALOG_DATABASE"]
+    if not path:
+        raise click.UsageError("Set CATALOG_DATABASE to the catalog file first.")
+    db = get_db()
+    if is_catalog_split(db):
+        click.echo("The catalog is already in %s." % path)
+        return
+    upgrade_db()
+    movies = split_catalog(db, path)
+    click.echo("Moved the catalog of %s movies to %s." % (movies, path))
+
+
 def init_app(app):
+    app.extensions["sqlite_pool"] = ConnectionPool(app.config)
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
-    if not os.path.exists(os.path.join(app.root_path, 'db.sqlite')):
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(split_catalog_command)
+    if not os.path.exists(app.config['DATABASE']):
         with app.app_context():
             init_db()
             print("Initialized the database.")
@@ -0,0 +1,69 @@
+import time
+import click
+
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import get_db
+from application.leaderboard import record_quiz_scores
+
+# record_quiz_scores takes the quiz ids as sql parameters, stay well below the sqlite variable limit
+SCORE_CHUNK = 500
+
+
+def epoch_now():
+    return int(time.time())
+
+
+def quiz_cutoff(now=None):
+    """quizzes created at or before this epoch are expired"""
+    return (epoch_now() if now is None else now) - current_app.config['QUIZ_TIMEOUT_SECONDS']
+
+
+def question_cutoff(now=None):
+    """activated questions created at or before this epoch are expired"""
+    return (epoch_now() if now is None else now) - current_app.config['QUESTION_TIMEOUT_SECONDS']
+
+
+def sweep_expired(db, now=None):
+    """
+        locks every expired quiz and question in one indexed UPDATE each and records the scores of the
+        locked quizzes, all in one transaction
+
+        - an expired question is only locked, the quiz moves on to its next question when it is shown again
+        - returns (locked quizzes, locked questions)
+    """
+    now = epoch_now() if now is None else now
+    try:
+        quiz_ids = [row['id'] for row in db.execute(
+            "SELECT id FROM quiz_state WHERE locked = 0 AND created_at <= ?", (quiz_cutoff(now),))]
+        db.execute("UPDATE quiz_state SET locked = 1 WHERE locked = 0 AND created_at <= ?", (quiz_cutoff(now),))
+        for i in range(0, len(quiz_ids), SCORE_CHUNK):
+            record_quiz_scores(db, *quiz_ids[i: i + SCORE_CHUNK])
+        questions = db.execute("UPDATE quiz_question SET locked = 1 WHERE locked = 0 AND activated = 1 "
+                               "AND created_at <= ?", (question_cutoff(now),)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(quiz_ids), questions
+
+
+@click.command("sweep-expired")
+@click.option('--loop', is_flag=True, help='keep sweeping every --interval seconds')
+@click.option('--interval', default=10.0, help='seconds between two sweeps in --loop mode')
+@with_appcontext
+def sweep_expired_command(loop, interval):
+    """
+        locks expired quizzes and questions so the leaderboard does not wait for their owner to come back
+
+        $ flask sweep-expired --loop
+    """
+    db = get_db()
+    while True:
+        quizzes, questions = sweep_expired(db)
+        if quizzes or questions:
+            click.echo("Locked %s quizzes and %s questions." % (quizzes, questions))
+        if not loop:
+            break
+        time.sleep(interval)
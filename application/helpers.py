@@ -1,5 +1,53 @@
-from flask import render_template
+import os
+import hashlib
+import datetime
+
+from flask import render_template, request, session, make_response, current_app
+from werkzeug.http import is_resource_modified
 
 
 def render_404():
     return render_template('404.html'), 404
+
+
+def conditional_response(etag, render, last_modified=None):
+    """
+        answers 304 Not Modified when the browser already has this version of the page, else calls render()
+
+        - etag: any string identifying the version, hashed into the ETag header
+        - last_modified: epoch seconds, the page is unchanged since then
+        - pages rendered with pending flash messages are neither validated nor tagged, the messages are shown once
+    """
+    if '_flashes' in session:
+        return make_response(render())
+    etag = hashlib.sha1(etag.encode('utf8')).hexdigest()[:20]
+    if last_modified is not None:
+        last_modified = datetime.datetime.utcfromtimestamp(last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def env_config(defaults):
+    """
+        reads optional settings from environment variables of the same name,
+        coercing each value to the type of its default
+    """
+    config = {}
+    for key, default in defaults.items():
+        if key not in os.environ:
+            continue
+        value = os.environ[key]
+        if isinstance(default, bool):
+            config[key] = value.strip().lower() in ('1', 'true', 'yes', 'on')
+        elif default is None:
+            config[key] = value
+        else:
+            config[key] = type(default)(value)
+    return config
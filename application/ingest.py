@@ -0,0 +1,152 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+TITLE_ID_REGEX = re.compile(r'tt\d+')
+MOVIE_FIELDS = ('name', 'description', 'released_date', 'rating')
+
+
+def title_id(link):
+    """
+        imdb title id of a movie link or url, eg. tt2398149 for 'title/tt2398149/?ref_=ttls_li_tt'
+    """
+    match = TITLE_ID_REGEX.search(link or '')
+    return match.group(0) if match else None
+
+
+def _normalized(movie_data):
+    general = dict(movie_data['general'])
+    general['rating'] = round(float(general['rating']), 1)
+    return general, sorted(set(tuple(detail) for detail in movie_data['movie_detail']))
+
+
+def content_hash(general, details):
+    payload = json.dumps([[general[field] for field in MOVIE_FIELDS], details], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf8')).hexdigest()
+
+
+def _existing_movies(db, batch):
+    """
+        movie rows of the batch already in the database, by imdb id, or by name for movies stored before their
+        imdb id was recorded
+    """
+    imdb_ids = [imdb_id for imdb_id, _, _ in batch]
+    rows = db.execute(
+        "SELECT movie.*, movie_source.imdb_id, movie_source.content_hash FROM movie_source "
+        "INNER JOIN movie ON movie.id = movie_source.movie_id WHERE movie_source.imdb_id IN (%s)"
+        % ', '.join('?' * len(imdb_ids)), imdb_ids
+    ).fetchall()
+    by_imdb_id = {row['imdb_id']: row for row in rows}
+
+    names = [general['name'] for imdb_id, general, _ in batch if imdb_id not in by_imdb_id]
+    by_name = {}
+    if names:
+        rows = db.execute(
+            "SELECT movie.*, NULL AS imdb_id, NULL AS content_hash FROM movie "
+            "LEFT JOIN movie_source ON movie.id = movie_source.movie_id "
+            "WHERE movie.name IN (%s) AND movie_source.movie_id IS NULL" % ', '.join('?' * len(names)), names
+        ).fetchall()
+        by_name = {row['name']: row for row in rows}
+    return {imdb_id: by_imdb_id.get(imdb_id) or by_name.get(general['name']) for imdb_id, general, _ in batch}
+
+
+def _insert_details(db, movie_id, details):
+    db.executemany("INSERT INTO movie_detail (movie_id, key, value) VALUES (?, ?, ?)",
+                   [(movie_id, key, value) for key, value in details])
+
+
+def _ingest_movie(db, imdb_id, general, details, movie):
+    """
+        writes one movie and returns 'inserted', 'updated' or 'unchanged'
+    """
+    digest = content_hash(general, details)
+    values = [general[field] for field in MOVIE_FIELDS]
+    if movie is None:
+        cursor = db.execute("INSERT INTO movie (name, description, released_date, rating) VALUES (?, ?, ?, ?)",
+                            values)
+        _insert_details(db, cursor.lastrowid, details)
+        db.execute("INSERT INTO movie_source (movie_id, imdb_id, content_hash) VALUES (?, ?, ?)",
+                   (cursor.lastrowid, imdb_id, digest))
+        return 'inserted'
+    if movie['content_hash'] == digest:
+        return 'unchanged'
+
+    changed = False
+    if [movie[field] for field in MOVIE_FIELDS] != values:
+        db.execute("UPDATE movie SET name = ?, description = ?, released_date = ?, rating = ? WHERE id = ?",
+                   (*values, movie['id']))
+        changed = True
+    stored = db.execute("SELECT key, value FROM movie_detail WHERE movie_id = ?", (movie['id'],)).fetchall()
+    if sorted(tuple(row) for row in stored) != details:
+        db.execute("DELETE FROM movie_detail WHERE movie_id = ?", (movie['id'],))
+        _insert_details(db, movie['id'], details)
+        changed = True
+    db.execute(
+        "INSERT INTO movie_source (movie_id, imdb_id, content_hash) VALUES (?, ?, ?) "
+        "ON CONFLICT(movie_id) DO UPDATE SET imdb_id = excluded.imdb_id, content_hash = excluded.content_hash",
+        (movie['id'], imdb_id, digest)
+    )
+    return 'updated' if changed else 'unchanged'
+
+
+def _ingest_batch(db, batch, summary):
+    existing = _existing_movies(db, batch)
+    try:
+        for imdb_id, general, details in batch:
+            try:
+                summary[_ingest_movie(db, imdb_id, general, details, existing[imdb_id])] += 1
+            except sqlite3.IntegrityError as err:
+                # eg. a renamed title clashing with the name of another movie, its first statement failed
+                # so nothing of it was written
+                logger.warning("Skipping %s %s: %s", imdb_id, general['name'], err)
+                summary['failed'] += 1
+        mark_scraped(db, [imdb_id for imdb_id, _, _ in batch])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def mark_scraped(db, imdb_ids, scraped_at=None):
+    scraped_at = int(time.time()) if scraped_at is None else scraped_at
+    db.executemany("UPDATE movie_source SET scraped_at = ? WHERE imdb_id = ?",
+                   [(scraped_at, imdb_id) for imdb_id in imdb_ids])
+
+
+def ingest_movies(db, movies, batch_size=200):
+    """
+        upserts a stream of scraped movie data (as returned by tasks._scrape_movie_data) into the catalog
+
+        - movies are matched on their imdb title id, later duplicates of a title in the stream are ignored
+        - the movie and movie_detail rows of a title whose scraped content did not change since its last ingestion
+          are not written, otherwise the movie row is updated and its movie_detail rows replaced when they differ
+        - every batch_size movies are written in one transaction, along with their scraped_at time
+        - returns a Counter of inserted, updated, unchanged, duplicate and failed movies
+    """
+    summary = Counter()
+    seen = set()
+    batch = []
+    for movie_data in movies:
+        imdb_id = movie_data['general'].get('imdb_id')
+        if not imdb_id:
+            logger.warning("Skipping %s without an imdb title id.", movie_data['general']['name'])
+            summary['failed'] += 1
+            continue
+        if imdb_id in seen:
+            summary['duplicate'] += 1
+            continue
+        seen.add(imdb_id)
+        batch.append((imdb_id, *_normalized(movie_data)))
+        if len(batch) >= batch_size:
+            _ingest_batch(db, batch, summary)
+            batch = []
+    if batch:
+        _ingest_batch(db, batch, summary)
+    return summary
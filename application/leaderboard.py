@@ -0,0 +1,169 @@
+import time
+import click
+
+from flask import current_app
+from flask.cli import with_appcontext
+from itsdangerous import URLSafeSerializer
+
+from application.db import get_db
+
+
+def record_quiz_scores(db, *quiz_ids):
+    """
+        materializes the final score of the given locked quizzes into quiz_score
+
+        - must be called in the same transaction that locks the quizzes
+    """
+    if not quiz_ids:
+        return
+    placeholders = ", ".join("?" * len(quiz_ids))
+    db.execute(
+        "INSERT OR REPLACE INTO quiz_score (quiz_id, user_id, score) "
+        "SELECT quiz_state.id, quiz_state.user_id, COALESCE(SUM(question_option.is_correct), 0) "
+        "FROM quiz_state "
+        "LEFT OUTER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id "
+        "LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id "
+        "AND question_option.question_id = quiz_question.id "
+        F"WHERE quiz_state.id IN ({placeholders}) AND quiz_state.locked = 1 "
+        "GROUP BY quiz_state.id",
+        quiz_ids)
+
+
+LEADERBOARD_SELECT = (
+    "SELECT user.username, quiz_score.quiz_id, quiz_score.score "
+    "FROM quiz_score "
+    "INNER JOIN user on user.id=quiz_score.user_id "
+)
+
+_total_cache = {}
+
+
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='leaderboard-cursor')
+
+
+def encode_cursor(page, boundary):
+    """
+        page: page number the cursor opens
+        boundary: last leaderboard row of the previous page
+    """
+    return _cursor_serializer().dumps([page, boundary['score'], boundary['quiz_id']])
+
+
+def decode_cursor(token):
+    try:
+        page, score, quiz_id = _cursor_serializer().loads(token)
+        assert isinstance(page, int) and page > 1
+    except Exception:
+        return None
+    return page, {'score': score, 'quiz_id': quiz_id}
+
+
+def _rows_after(db, boundary, limit):
+    if boundary is None:
+        return db.execute(LEADERBOARD_SELECT + "ORDER BY quiz_score.score DESC, quiz_score.quiz_id LIMIT ?",
+                          (limit,)).fetchall()
+    return db.execute(
+        LEADERBOARD_SELECT +
+        "WHERE quiz_score.score <= ? AND (quiz_score.score < ? OR quiz_score.quiz_id > ?) "
+        "ORDER BY quiz_score.score DESC, quiz_score.quiz_id LIMIT ?",
+        (boundary['score'], boundary['score'], boundary['quiz_id'], limit)).fetchall()
+
+
+def _rows_before(db, boundary, limit):
+    return db.execute(
+        LEADERBOARD_SELECT +
+        "WHERE quiz_score.score >= ? AND (quiz_score.score > ? OR quiz_score.quiz_id < ?) "
+        "ORDER BY quiz_score.score, quiz_score.quiz_id DESC LIMIT ?",
+        (boundary['score'], boundary['score'], boundary['quiz_id'], limit)).fetchall()
+
+
+def _boundary_at_offset(db, offset):
+    return db.execute(LEADERBOARD_SELECT + "ORDER BY quiz_score.score DESC, quiz_score.quiz_id LIMIT 1 OFFSET ?",
+                      (offset,)).fetchone()
+
+
+def leaderboard_page(db, page_size, page=1, cursor=None, window=2):
+    """
+        seeks one leaderboard page keyed on (score, quiz_id)
+
+        - cursor: opaque token produced by encode_cursor, preferred over page
+        - page: plain page number, resolved with a single OFFSET lookup (kept for old ?page= links)
+        - window: number of page links generated on each side of the current page
+
+        cost depends on page_size and window only, never on how deep the page is
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is not None:
+        page, boundary = decoded
+    elif page > 1:
+        boundary = _boundary_at_offset(db, (page - 1) * page_size - 1)
+        if boundary is None:
+            page = 1
+    else:
+        page, boundary = 1, None
+
+    if page == 1:
+        boundary = None
+
+    ahead = _rows_after(db, boundary, page_size * (window + 1))
+    rows = ahead[:page_size]
+    pages = [(page, cursor if decoded else None)]
+    for k in range(1, window + 1):
+        if len(ahead) > k * page_size:
+            pages.append((page + k, encode_cursor(page + k, ahead[k * page_size - 1])))
+
+    if boundary is not None:
+        behind = [boundary] + _rows_before(db, boundary, window * page_size)
+        for k in range(1, window + 1):
+            if page - k == 1:
+                pages.insert(0, (1, None))
+                break
+            if len(behind) <= k * page_size:
+                break
+            pages.insert(0, (page - k, encode_cursor(page - k, behind[k * page_size])))
+
+    return {'rows': rows, 'page': page, 'pages': pages}
+
+
+def total_scored_quizzes(db, ttl=0):
+    """
+        counts the leaderboard entries, cached per database for ttl seconds
+    """
+    key = current_app.config['DATABASE']
+    now = time.monotonic()
+    cached = _total_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    total = db.execute("SELECT COUNT(*) AS total FROM quiz_score").fetchone()['total']
+    if ttl:
+        _total_cache[key] = (now + ttl, total)
+    return total
+
+
+def backfill_leaderboard(db):
+    db.execute("DELETE FROM quiz_score")
+    db.execute(
+        "INSERT INTO quiz_score (quiz_id, user_id, score) "
+        "SELECT quiz_state.id, quiz_state.user_id, COALESCE(SUM(question_option.is_correct), 0) "
+        "FROM quiz_state "
+        "LEFT OUTER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id "
+        "LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id "
+        "AND question_option.question_id = quiz_question.id "
+        "WHERE quiz_state.locked = 1 "
+        "GROUP BY quiz_state.id")
+    db.commit()
+    _total_cache.pop(current_app.config['DATABASE'], None)
+    return total_scored_quizzes(db)
+
+
+@click.command("backfill-leaderboard")
+@with_appcontext
+def backfill_leaderboard_command():
+    """
+        rebuilds the quiz_score leaderboard table from every locked quiz
+
+        $ flask backfill-leaderboard
+    """
+    total = backfill_leaderboard(get_db())
+    click.echo("Leaderboard rebuilt with %s quizzes." % total)
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import shutil
+import logging
+import sqlite3
+import tempfile
+import threading
+
+import click
+from collections import Counter
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import get_pool
+from application.auth import get_activation_file
+
+ANSWER_REGEX = re.compile(r'name="answer"[^>]*?\svalue="(\d+)"')
+ERROR_PAGE = b'Some error occurred in the server'
+ENDPOINTS = ('register', 'activate', 'login', 'create_quiz', 'question_get', 'question_post', 'score')
+
+
+class UserStopped(Exception):
+    pass
+
+
+def _percentile(timings, q):
+    return timings[min(len(timings) - 1, int(len(timings) * q))] if timings else 0.0
+
+
+class LoadStats(logging.Handler):
+    """
+        thread-safe latencies and errors per endpoint of a load test
+
+        - installed as a handler of the app logger, it counts the sqlite errors the app logs while serving the
+          endpoint the calling virtual user is requesting, eg. 'database is locked'
+    """
+
+    def __init__(self, timeout):
+        super().__init__(level=logging.ERROR)
+        self.timeout = timeout
+        self.timings = {}
+        self.errors = Counter()
+        self.locked = Counter()
+        self.timeouts = Counter()
+        self.quizzes = 0
+        self._endpoint = threading.local()
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        err = record.exc_info[1] if record.exc_info else None
+        if isinstance(err, sqlite3.OperationalError) and 'locked' in str(err):
+            with self._lock:
+                self.locked[getattr(self._endpoint, 'name', None)] += 1
+
+    def request(self, endpoint, send, *args, **kwargs):
+        """
+            sends one request and records its latency, an error page or an unexpected status counts as an error
+        """
+        self._endpoint.name = endpoint
+        started = time.perf_counter()
+        try:
+            response = send(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._endpoint.name = None
+        failed = response.status_code >= 400 or ERROR_PAGE in response.data
+        with self._lock:
+            self.timings.setdefault(endpoint, []).append(elapsed)
+            if failed:
+                self.errors[endpoint] += 1
+            if self.timeout and elapsed > self.timeout:
+                self.timeouts[endpoint] += 1
+        return response, failed
+
+    def quiz_completed(self):
+        with self._lock:
+            self.quizzes += 1
+
+    def report(self, duration):
+        with self._lock:
+            endpoints = {}
+            for endpoint in ENDPOINTS:
+                timings = sorted(self.timings.get(endpoint, []))
+                endpoints[endpoint] = {
+                    'requests': len(timings),
+                    'errors': self.errors[endpoint],
+                    'locked': self.locked[endpoint],
+                    'timeouts': self.timeouts[endpoint],
+                    'p50_ms': _percentile(timings, 0.5) * 1000,
+                    'p95_ms': _percentile(timings, 0.95) * 1000,
+                    'p99_ms': _percentile(timings, 0.99) * 1000,
+                }
+            requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+            return {
+                'duration_seconds': duration,
+                'requests': requests,
+                'requests_per_second': requests / duration if duration else 0.0,
+                'quizzes': self.quizzes,
+                'quizzes_per_second': self.quizzes / duration if duration else 0.0,
+                'locked': sum(self.locked.values()),
+                'endpoints': endpoints,
+            }
+
+
+class VirtualUser(threading.Thread):
+    """
+        one user of the load test with its own session: register, activate, login, then take `quizzes` quizzes
+        (create, answer the 10 questions, score) with a random think time around `think` seconds between requests
+
+        - the run stops at the first failed request of the user or once `deadline` is passed
+    """
+
+    def __init__(self, app, stats, username, quizzes=1, think=0.0, deadline=None, seed=None):
+        super().__init__(daemon=True)
+        self.app = app
+        self.stats = stats
+        self.username = username
+        self.quizzes = quizzes
+        self.think = think
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.client = app.test_client()
+
+    def _send(self, endpoint, method, url, **kwargs):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise UserStopped
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+        response, failed = self.stats.request(endpoint, getattr(self.client, method), url, **kwargs)
+        if failed:
+            raise UserStopped
+        return response
+
+    def _activate(self):
+        # every registration overwrites the shared activation code, retry with the current one
+        for _ in range(5):
+            with open(self.activation_file) as f:
+                code = f.read()
+            response = self._send('activate', 'post', '/auth/activate/%s' % self.username, data={'activation': code})
+            if response.status_code == 302:
+                return
+        raise UserStopped
+
+    def _take_quiz(self):
+        response = self._send('create_quiz', 'get', '/quiz/create')
+        quiz_url = response.headers.get('Location')
+        if response.status_code != 302 or '/question' not in quiz_url:
+            raise UserStopped
+        response = self._send('question_get', 'get', quiz_url)
+        while True:
+            location = response.headers.get('Location', '')
+            if response.status_code == 200:
+                options = ANSWER_REGEX.findall(response.get_data(as_text=True))
+                response = self._send('question_post', 'post', quiz_url,
+                                      data={'answer': self.rng.choice(options)} if options else {})
+            elif response.status_code == 302 and '/question' in location:
+                # an expired question, the question page moves on to the next one
+                response = self._send('question_get', 'get', location)
+            else:
+                break
+        score_url = response.headers.get('Location', '')
+        if '/score' not in score_url:
+            raise UserStopped
+        self._send('score', 'get', score_url)
+        self.stats.quiz_completed()
+
+    def run(self):
+        password = 'load-%s' % self.username
+        with self.app.app_context():
+            self.activation_file = get_activation_file()
+        try:
+            self._send('register', 'post', '/auth/register', data={'username': self.username, 'password': password})
+            self._activate()
+            self._send('login', 'post', '/auth/login', data={'username': self.username, 'password': password})
+            for _ in range(self.quizzes):
+                self._take_quiz()
+        except UserStopped:
+            pass
+
+
+def run_load(app, users, quizzes=1, think=0.0, timeout=None, duration=None, ramp_up=0.0, seed=0):
+    """
+        runs `users` virtual users concurrently against the app, each one in its own thread through the test client,
+        so every request goes through the whole WSGI app and its connection pool in this process
+
+        - the users are registered as load-<run>-<n> in the app database, `ramp_up` seconds apart in total
+        - requests slower than `timeout` seconds are counted as timeouts, `duration` seconds stops every user
+        - returns the LoadStats report
+    """
+    stats = LoadStats(timeout)
+    app.logger.addHandler(stats)
+    run = uuid.uuid4().hex[:8]
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    try:
+        threads = []
+        for number in range(users):
+            thread = VirtualUser(app, stats, 'load-%s-%s' % (run, number), quizzes=quizzes, think=think,
+                                 deadline=deadline, seed=seed + number)
+            thread.start()
+            threads.append(thread)
+            if ramp_up and users > 1:
+                time.sleep(ramp_up / (users - 1))
+        for thread in threads:
+            thread.join()
+    finally:
+        app.logger.removeHandler(stats)
+    return stats.report(time.monotonic() - started)
+
+
+@click.command("load-test")
+@click.option('--users', default=20, help='concurrent virtual users')
+@click.option('--quizzes', default=1, help='quizzes taken by each user')
+@click.option('--think', default=0.0, help='mean think time between two requests of a user, in seconds')
+@click.option('--timeout', default=1.0, help='requests slower than this many seconds are counted as timeouts')
+@click.option('--busy-timeout', default=None, type=int, help='overrides SQLITE_BUSY_TIMEOUT (ms) for the run')
+@click.option('--duration', default=None, type=float, help='stops every user after this many seconds')
+@click.option('--database', default=None, help='sqlite file to run against instead of the configured DATABASE')
+@click.option('--ramp-up', default=0.0, help='seconds over which the users are started')
+@click.option('--output', default=None, help='json file the report is written to')
+@with_appcontext
+def load_test_command(users, quizzes, think, timeout, busy_timeout, database, duration, ramp_up, output):
+    """
+        simulates many users taking quizzes at once against the configured database and reports throughput,
+        latency percentiles per endpoint and 'database is locked' errors
+
+        _the virtual users and their quizzes are written to the database, use a copy or a synthetic one_
+        _their activation codes are written to a temporary ACTIVATION_FILE, not the configured one_
+        $ flask load-test --database /tmp/load.sqlite --users 50 --quizzes 2 --think 0.2
+    """
+    from application import create_app
+
+    config = current_app.config
+    activation_dir = tempfile.mkdtemp(prefix='load-test-')
+    app = create_app(dict(config, **{
+        'SQLITE_BUSY_TIMEOUT': config['SQLITE_BUSY_TIMEOUT'] if busy_timeout is None else busy_timeout,
+        'DATABASE': database or config['DATABASE'],
+        'ACTIVATION_FILE': os.path.join(activation_dir, 'activation-code.txt'),
+    }))
+    try:
+        report = run_load(app, users, quizzes=quizzes, think=think, timeout=timeout, duration=duration,
+                          ramp_up=ramp_up)
+    finally:
+        get_pool(app).close()
+        shutil.rmtree(activation_dir, ignore_errors=True)
+
+    click.echo("%s requests in %.1fs: %.1f requests/s, %s quizzes (%.2f/s), %s 'database is locked' errors" % (
+        report['requests'], report['duration_seconds'], report['requests_per_second'], report['quizzes'],
+        report['quizzes_per_second'], report['locked']))
+    click.echo("%-14s %8s %7s %7s %9s %9s %9s %9s" % ('endpoint', 'requests', 'errors', 'locked', 'timeouts',
+                                                      'p50 ms', 'p95 ms', 'p99 ms'))
+    for endpoint, summary in report['endpoints'].items():
+        click.echo("%-14s %8s %7s %7s %9s %9.1f %9.1f %9.1f" % (
+            endpoint, summary['requests'], summary['errors'], summary['locked'], summary['timeouts'],
+            summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,334 @@
+import hmac
+import time
+import sqlite3
+import functools
+import threading
+from collections import deque
+
+from flask import g, request, current_app, has_app_context
+
+from application.slowlog import call_site
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = ('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for key, value in labels)
+    return '{%s}' % ','.join(escaped)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+        thread-safe counters and histograms of this process, rendered in the prometheus text format
+
+        - every app of a process (gunicorn worker, cli command) has its own registry in app.extensions, like the
+          caches
+        - nothing is recorded while `enabled` is False, which is the case unless METRICS_ENABLED is set
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                     'sum': 0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, gauges=()):
+        """
+            the metrics as prometheus text, plus the (name, labels dict, value) gauges given
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(histogram, counts=list(histogram['counts'])))
+                                for key, histogram in self._histograms.items())
+        gauges = sorted(((name, tuple(sorted(labels.items()))), value) for name, labels, value in gauges)
+        typed = set()
+        for kind, samples in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in samples:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append('# TYPE %s %s' % (name, kind))
+                lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s histogram' % name)
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (name, _labels(labels + (('le', _number(bound)),)), cumulative))
+            lines.append('%s_bucket%s %s' % (name, _labels(labels + (('le', '+Inf'),)), histogram['count']))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), _number(histogram['sum'])))
+            lines.append('%s_count%s %s' % (name, _labels(labels), histogram['count']))
+        return ''.join(line + '\n' for line in lines)
+
+
+# recording outside of an app context, never enabled
+_disabled_registry = MetricsRegistry()
+
+
+def get_registry():
+    """
+        the metrics registry of the current app, a disabled one outside of an app context
+    """
+    if not has_app_context():
+        return _disabled_registry
+    return current_app.extensions.get('metrics', _disabled_registry)
+
+
+def timed(name, **labels):
+    """
+        decorator observing the duration of every call in the `name` histogram
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            registry = get_registry()
+            if not registry.enabled:
+                return f(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+# sql statements and time of the current thread since reset_sql_totals, ie. of the request it is serving
+_sql = threading.local()
+
+
+def reset_sql_totals():
+    _sql.statements = 0
+    _sql.seconds = 0.0
+
+
+def sql_totals():
+    return getattr(_sql, 'statements', 0), getattr(_sql, 'seconds', 0.0)
+
+
+def count_statement(statement):
+    """sqlite trace callback, called for every statement the connection runs"""
+    _sql.statements = getattr(_sql, 'statements', 0) + 1
+
+
+def _sql_timed(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _sql.seconds = getattr(_sql, 'seconds', 0.0) + time.perf_counter() - started
+    return wrapper
+
+
+class TracedCursor(sqlite3.Cursor):
+    """
+        cursor adding the time spent running its statements and stepping through their rows to the thread totals
+
+        - with a slow query log on the connection, a statement is timed until its rows are exhausted, the cursor
+          runs another one or is released, and logged when slower than the threshold
+    """
+    _query = None
+
+    def _run(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            _sql.seconds = getattr(_sql, 'seconds', 0.0) + elapsed
+            if self._query is not None:
+                self._query[-1] += elapsed
+
+    def _start(self, kind, sql, parameters):
+        self._finish()
+        if self.connection.slow_query_log is not None:
+            self.connection.flush_slow_queries()
+            self._query = [kind, sql, parameters, 0.0]
+
+    def _finish(self, finalizing=False):
+        query, self._query = self._query, None
+        if query is None or query[-1] < self.connection.slow_query_log.threshold:
+            return
+        kind, sql, parameters, seconds = query
+        if finalizing:
+            self.connection.defer_slow_query(kind, sql, parameters, call_site(), seconds)
+        else:
+            self.connection.slow_query_log.record(self.connection, kind, sql, parameters, call_site(), seconds)
+
+    def execute(self, sql, parameters=()):
+        self._start('execute', sql, parameters)
+        return self._run(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        self._start('executemany', sql, None)
+        return self._run(sqlite3.Cursor.executemany, sql, parameters)
+
+    def executescript(self, script):
+        self._start('executescript', script, None)
+        return self._run(sqlite3.Cursor.executescript, script)
+
+    def fetchone(self):
+        row = self._run(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, *args):
+        return self._run(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        rows = self._run(sqlite3.Cursor.fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._run(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish(finalizing=True)
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+        connection factory used with METRICS_ENABLED or a SLOW_QUERY_LOG, its statements run on TracedCursor
+
+        - the slow statements of cursors finalized by the garbage collector are queued and logged, with their
+          query plan, by the next statement of the connection or when the pool releases it
+    """
+    slow_query_log = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slow_queries = deque()
+
+    def defer_slow_query(self, kind, sql, parameters, site, seconds):
+        self._slow_queries.append((time.time(), kind, sql, parameters, site, seconds))
+
+    def flush_slow_queries(self):
+        while self._slow_queries:
+            at, *query = self._slow_queries.popleft()
+            self.slow_query_log.record(self, *query, at=at)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    commit = _sql_timed(sqlite3.Connection.commit)
+    rollback = _sql_timed(sqlite3.Connection.rollback)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    reset_sql_totals()
+
+
+def _record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    registry = get_registry()
+    registry.observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started,
+                     endpoint=endpoint, method=request.method)
+    registry.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    statements, seconds = sql_totals()
+    registry.observe('sql_statements_per_request', statements, buckets=COUNT_BUCKETS, endpoint=endpoint)
+    registry.observe('sql_seconds_per_request', seconds, endpoint=endpoint)
+    return response
+
+
+def _process_gauges():
+    from application.db import get_db
+    from application.question_bank import question_bank_depths
+
+    gauges = [('sqlite_pool_connections', {'state': state}, value)
+              for state, value in sorted(current_app.extensions['sqlite_pool'].stats().items())]
+    for name, cache in sorted(current_app.extensions['caches'].items()):
+        gauges += [('cache_%s' % stat, {'cache': name}, value) for stat, value in sorted(cache.stats().items())]
+    # shared by every process, read from the database
+    gauges += [('question_bank_depth', {'field': field}, depth)
+               for field, depth in question_bank_depths(get_db()).items()]
+    return gauges
+
+
+def metrics():
+    token = 'Bearer %s' % current_app.config['METRICS_TOKEN']
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf8'), token.encode('utf8')):
+        return current_app.response_class('forbidden\n', status=403, mimetype='text/plain')
+    return current_app.response_class(get_registry().render(_process_gauges()),
+                                      mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """
+        with METRICS_ENABLED, times every request and its sql and serves the metrics of the process on /metrics
+
+        - disabled, no hook is installed and the connections are plain sqlite3 connections
+        - /metrics is only served with METRICS_TOKEN set, to requests sending it as `Authorization: Bearer <token>`
+    """
+    registry = app.extensions['metrics'] = MetricsRegistry()
+    registry.enabled = bool(app.config['METRICS_ENABLED'])
+    if not registry.enabled:
+        return
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    if app.config['METRICS_TOKEN']:
+        app.add_url_rule('/metrics', 'metrics', metrics)
+    else:
+        app.logger.warning("METRICS_ENABLED without a METRICS_TOKEN, /metrics is not served")
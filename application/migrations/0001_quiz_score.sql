@@ -0,0 +1,19 @@
+-- leaderboard scores materialized when a quiz is locked
+CREATE TABLE IF NOT EXISTS `quiz_score` (
+    `quiz_id` INTEGER NOT NULL PRIMARY KEY,
+    `user_id` INTEGER NOT NULL,
+    `score` INTEGER NOT NULL,
+    FOREIGN KEY(`quiz_id`) REFERENCES `quiz_state`(`id`),
+    FOREIGN KEY(`user_id`) REFERENCES `user`(`id`)
+);
+
+CREATE INDEX IF NOT EXISTS `quiz_score_rank` ON `quiz_score` (`score` DESC, `quiz_id`);
+
+INSERT OR IGNORE INTO `quiz_score` (`quiz_id`, `user_id`, `score`)
+SELECT quiz_state.id, quiz_state.user_id, COALESCE(SUM(question_option.is_correct), 0)
+FROM quiz_state
+LEFT OUTER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id
+LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id
+    AND question_option.question_id = quiz_question.id
+WHERE quiz_state.locked = 1
+GROUP BY quiz_state.id;
@@ -0,0 +1,11 @@
+-- current (unlocked) question of a quiz: WHERE quiz_id = ? AND locked = 0 ORDER BY id
+CREATE INDEX `quiz_question_open` ON `quiz_question` (`quiz_id`, `locked`, `id`);
+
+-- alive quizzes of a user: WHERE user_id = ? AND locked = 0
+CREATE INDEX `quiz_state_user_open` ON `quiz_state` (`user_id`, `locked`);
+
+-- details of one movie: WHERE movie_id = ? AND key = ? (covers value)
+CREATE INDEX `movie_detail_movie_key` ON `movie_detail` (`movie_id`, `key`, `value`);
+
+-- value pools of one key: WHERE key = ? AND value ...
+CREATE INDEX `movie_detail_key_value` ON `movie_detail` (`key`, `value`);
@@ -0,0 +1,12 @@
+-- ready-made questions waiting to be claimed by a quiz, options is a json list of the distractors
+CREATE TABLE `question_bank` (
+    `id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    `movie_id` INTEGER NOT NULL,
+    `field` TEXT NOT NULL,
+    `question` TEXT NOT NULL,
+    `answer` TEXT NOT NULL,
+    `options` TEXT NOT NULL,
+    FOREIGN KEY(`movie_id`) REFERENCES `movie`(`id`)
+);
+
+CREATE INDEX `question_bank_field` ON `question_bank` (`field`, `movie_id`);
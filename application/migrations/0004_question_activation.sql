@@ -0,0 +1,2 @@
+-- pre-generated questions (eager quiz generation) start their timer when first shown
+ALTER TABLE `quiz_question` ADD COLUMN `activated` INTEGER NOT NULL DEFAULT 1;
@@ -0,0 +1,8 @@
+-- database: catalog
+-- imdb title id of scraped movies and a hash of the scraped content, used to re-ingest titles idempotently
+CREATE TABLE `movie_source` (
+    `movie_id` INTEGER NOT NULL PRIMARY KEY,
+    `imdb_id` TEXT UNIQUE NOT NULL,
+    `content_hash` TEXT NOT NULL,
+    FOREIGN KEY(`movie_id`) REFERENCES `movie`(`id`)
+);
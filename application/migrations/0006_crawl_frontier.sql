@@ -0,0 +1,11 @@
+-- database: catalog
+-- pages discovered by `flask crawl`, the unique url index is the seen set of the crawl
+-- status: 0 pending, 1 crawled, 2 failed
+CREATE TABLE `crawl_frontier` (
+    `id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    `url` TEXT UNIQUE NOT NULL,
+    `depth` INTEGER NOT NULL,
+    `status` INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX `crawl_frontier_pending` ON `crawl_frontier` (`status`, `depth`, `id`);
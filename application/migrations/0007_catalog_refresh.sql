@@ -0,0 +1,11 @@
+-- database: catalog
+-- epoch seconds of the last scrape of each title and the number of quiz questions asked about it, used to
+-- pick the titles refreshed first
+ALTER TABLE `movie_source` ADD COLUMN `scraped_at` INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE `movie_source` ADD COLUMN `asked_count` INTEGER NOT NULL DEFAULT 0;
+
+-- bookkeeping of the refresh worker, eg. the id of the last quiz question counted into asked_count
+CREATE TABLE `refresh_state` (
+    `key` TEXT NOT NULL PRIMARY KEY,
+    `value` INTEGER NOT NULL
+);
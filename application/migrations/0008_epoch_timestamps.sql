@@ -0,0 +1,54 @@
+-- quiz_state.created_at and quiz_question.created_at become unix epoch seconds (INTEGER) so expiry is a plain
+-- comparison, in python and in sql. existing rows were written with the default DATETIME_FORMAT in local time,
+-- rows in any other format become 0, ie. long expired
+CREATE TABLE `quiz_state_epoch` (
+    `id`	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+	`user_id`	INTEGER NOT NULL,
+	`locked` INTEGER NOT NULL DEFAULT 0,
+	`created_at` INTEGER NOT NULL,
+	FOREIGN KEY(`user_id`) REFERENCES `user`(`id`)
+);
+
+INSERT INTO `quiz_state_epoch` (`id`, `user_id`, `locked`, `created_at`)
+SELECT `id`, `user_id`, `locked`, COALESCE(CAST(strftime('%s', `created_at`, 'utc') AS INTEGER), 0)
+FROM `quiz_state`;
+
+DROP TABLE `quiz_state`;
+ALTER TABLE `quiz_state_epoch` RENAME TO `quiz_state`;
+
+CREATE INDEX `quiz_state_user_open` ON `quiz_state` (`user_id`, `locked`);
+
+-- expired quizzes: WHERE locked = 0 AND created_at <= ?
+CREATE INDEX `quiz_state_expiry` ON `quiz_state` (`locked`, `created_at`);
+
+
+CREATE TABLE `quiz_question_epoch` (
+    `id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    `quiz_id` INTEGER NOT NULL,
+    `movie_id` INTEGER NOT NULL,
+    `field` TEXT NOT NULL,
+    `question_no` INTEGER NOT NULL,
+    `question` TEXT NOT NULL,
+    `user_answer` TEXT,
+    `locked` INTEGER NOT NULL DEFAULT 0,
+    `created_at` INTEGER NOT NULL,
+    `activated` INTEGER NOT NULL DEFAULT 1,
+    FOREIGN KEY(`quiz_id`) REFERENCES `quiz`(`id`),
+    FOREIGN KEY(`movie_id`) REFERENCES `movie`(`id`),
+    UNIQUE(`quiz_id`, `movie_id`, `field`)
+);
+
+INSERT INTO `quiz_question_epoch`
+    (`id`, `quiz_id`, `movie_id`, `field`, `question_no`, `question`, `user_answer`, `locked`, `created_at`,
+     `activated`)
+SELECT `id`, `quiz_id`, `movie_id`, `field`, `question_no`, `question`, `user_answer`, `locked`,
+       COALESCE(CAST(strftime('%s', `created_at`, 'utc') AS INTEGER), 0), `activated`
+FROM `quiz_question`;
+
+DROP TABLE `quiz_question`;
+ALTER TABLE `quiz_question_epoch` RENAME TO `quiz_question`;
+
+CREATE INDEX `quiz_question_open` ON `quiz_question` (`quiz_id`, `locked`, `id`);
+
+-- expired questions: WHERE locked = 0 AND activated = 1 AND created_at <= ?
+CREATE INDEX `quiz_question_expiry` ON `quiz_question` (`locked`, `activated`, `created_at`);
@@ -0,0 +1,8 @@
+-- database: catalog
+-- movies ranked on a column for the cross-movie questions: WHERE rating < ? ORDER BY rating DESC
+CREATE INDEX `movie_rating` ON `movie` (`rating`);
+CREATE INDEX `movie_released_date` ON `movie` (`released_date`);
+
+-- movies sharing a detail value: WHERE key = ? AND value IN (...), now covers movie_id (inverted index)
+DROP INDEX `movie_detail_key_value`;
+CREATE INDEX `movie_detail_key_value` ON `movie_detail` (`key`, `value`, `movie_id`);
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import html
+import logging
+
+from bs4 import BeautifulSoup
+
+from application.ingest import title_id
+from application.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+MOVIE_URL_REGEX = r'title/[a-z0-9]+(/|\?|/\?)?.*$'
+LD_JSON_REGEX = re.compile(r'<script\b[^>]*\btype\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script\s*>',
+                           re.I | re.S)
+HREF_REGEX = re.compile(r'<a\b[^>]*?\shref\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+
+_movie_url = re.compile(MOVIE_URL_REGEX)
+
+
+def ld_json_full(page):
+    """
+        ld+json payload of the page found through a full html parse
+    """
+    soup = BeautifulSoup(page, features='html.parser')
+    soup = soup.find('script', {'type': 'application/ld+json'})
+    assert soup is not None, "No ld+json payload found"
+    return json.loads(soup.text)
+
+
+def ld_json_fast(page):
+    """
+        ld+json payload of the page found by scanning for its script tag, None when the scan does not find a
+        parsable payload
+    """
+    match = LD_JSON_REGEX.search(page)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+def movie_links_full(page):
+    soup = BeautifulSoup(page, features='html.parser')
+    return [i.get('href') for i in soup.find_all('a', {'href': _movie_url})]
+
+
+def movie_links_fast(page):
+    hrefs = (html.unescape(double or single) for double, single in HREF_REGEX.findall(page))
+    return [href for href in hrefs if _movie_url.search(href)]
+
+
+@timed('scrape_parse_seconds', page='list')
+def parse_movies_list(page, fast=True):
+    """
+        movie links of a list page, the fast scan falls back to a full parse when it finds none
+    """
+    links = movie_links_fast(page) if fast else []
+    return links or movie_links_full(page)
+
+
+def canonical_movie_links(links):
+    """
+        the distinct movie links as canonical 'title/<imdb id>/' links in their first seen order, eg.
+        '/title/tt2398149/?ref_=ttls_li_tt' and '/title/tt2398149/fullcredits' are both 'title/tt2398149/'
+    """
+    canonical = {}
+    for link in links:
+        imdb_id = title_id(link)
+        if imdb_id is not None:
+            canonical.setdefault('title/%s/' % imdb_id, None)
+    return list(canonical)
+
+
+def movie_data_from_ld_json(data, link):
+    if data['@type'] != 'Movie':
+        logger.info("Skipping %s as it is not a movie.", link)
+        return None
+    description = re.sub(data['name'], '', data['description'], flags=re.I)
+    movie_data = {
+        'general': {
+            'imdb_id': title_id(data.get('url')) or title_id(link),
+            'name': data['name'],
+            'description': description,
+            'rating': '%.1f' % float(data['aggregateRating']['ratingValue']),
+            'released_date': data['datePublished'],
+        },
+        'movie_detail': [('genre', i) for i in data['genre']] if isinstance(data['genre'], list) else [
+            ('genre', data['genre'])
+        ]
+    }
+
+    for d in ('actor', 'director', 'creator'):
+        if isinstance(data[d], list):
+            movie_data['movie_detail'] += [(d, i['name']) for i in data[d] if i.get('name', False)]
+        else:
+            movie_data['movie_detail'].append((d, data[d]['name']))
+
+    movie_data['movie_detail'] = sorted(set(movie_data['movie_detail']), key=lambda x: x[0])
+
+    return movie_data
+
+
+@timed('scrape_parse_seconds', page='movie')
+def parse_movie_page(page, link, fast=True):
+    """
+        movie data of a title page, the fast scan falls back to a full parse when it misses the payload
+    """
+    data = ld_json_fast(page) if fast else None
+    if data is None:
+        data = ld_json_full(page)
+    return movie_data_from_ld_json(data, link)
+
+
+def parse_movie_page_or_none(page, link):
+    """
+        parse_movie_page for the parse process pool, failures are logged in the worker and returned as None
+    """
+    try:
+        return parse_movie_page(page, link)
+    except Exception as err:
+        logger.exception("Failed to parse %s. Error: %s." % (link, err))
+        return None
+
+
+def saved_pages(directory):
+    """
+        (path, html) of every saved page under directory, eg. the bodies of the scraper response cache
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith(('.body', '.html', '.htm')):
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    yield path, f.read().decode('utf8', errors='replace')
+
+
+def benchmark_parsers(pages, repeat=3):
+    """
+        times the fast and the full parse of pages (movie pages and list pages) and checks they agree
+
+        - returns {'pages', 'fast_seconds', 'full_seconds', 'mismatches'} with the best time of repeat runs
+    """
+    def parse(page, fast):
+        if 'ld+json' in page:
+            try:
+                return parse_movie_page(page, '', fast=fast)
+            except Exception:
+                return None
+        return parse_movies_list(page, fast=fast)
+
+    timings = {}
+    results = {}
+    for fast in (True, False):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results[fast] = [parse(page, fast) for page in pages]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[fast] = best
+    mismatches = sum(1 for fast, full in zip(results[True], results[False]) if fast != full)
+    return {'pages': len(pages), 'fast_seconds': timings[True], 'full_seconds': timings[False],
+            'mismatches': mismatches}
@@ -0,0 +1,125 @@
+import json
+import time
+import random
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import get_db
+from application.metrics import get_registry
+from application.catalog import get_catalog
+from application.questions import QUESTION_TEMPLATES, QuestionDraft, draft_random_question, template_for_field
+
+_CLAIMABLE = (
+    "SELECT * FROM question_bank WHERE id {side} ? AND field IN ({fields}) "
+    "AND movie_id NOT IN (SELECT movie_id FROM quiz_question WHERE quiz_id = ? AND field = question_bank.field) "
+    "AND movie_id NOT IN (SELECT movie_id FROM quiz_question WHERE quiz_id = ? GROUP BY movie_id HAVING COUNT(*) >= 3) "
+    "ORDER BY id LIMIT 1"
+)
+
+
+def _claim(db, quiz_id, fields):
+    """
+        seeks to a random rowid of the bank and claims the next usable row, wrapping around to the first one, so
+        concurrent quizzes do not all claim the oldest questions in the same order
+    """
+    high = db.execute("SELECT MAX(id) FROM question_bank").fetchone()[0]
+    if high is None:
+        return None
+    start = random.randint(0, high)
+    placeholders = ", ".join("?" * len(fields))
+    row = db.execute(_CLAIMABLE.format(side='>=', fields=placeholders), (start, *fields, quiz_id, quiz_id)).fetchone() \
+        or db.execute(_CLAIMABLE.format(side='<', fields=placeholders), (start, *fields, quiz_id, quiz_id)).fetchone()
+    if row is None:
+        return None
+    # the DELETE takes the write lock, a zero rowcount means another worker claimed the row first
+    if db.execute("DELETE FROM question_bank WHERE id = ?", (row['id'],)).rowcount != 1:
+        return False
+    return QuestionDraft(movie_id=row['movie_id'], field=row['field'], question=row['question'],
+                         answer=row['answer'], options=json.loads(row['options']))
+
+
+def claim_question(db, quiz_id, attempts=3):
+    """
+        atomically takes one banked question usable by the quiz, or None when the bank has none
+
+        - a random template is tried first so quizzes keep the same template mix, then any template
+        - the claim is part of the caller's transaction, it is released again if that transaction rolls back
+    """
+    fields = [template.field for template in QUESTION_TEMPLATES]
+    for _ in range(attempts):
+        draft = _claim(db, quiz_id, [random.choice(fields)])
+        if draft is None:
+            draft = _claim(db, quiz_id, fields)
+        if draft is None:
+            break
+        if draft:
+            get_registry().inc('question_bank_claims_total', result='claimed')
+            return draft
+    # no usable entry, the caller generates the question
+    get_registry().inc('question_bank_claims_total', result='missed')
+    return None
+
+
+def store_questions(db, drafts):
+    db.executemany(
+        "INSERT INTO question_bank (movie_id, field, question, answer, options) VALUES (?, ?, ?, ?, ?)",
+        [(draft.movie_id, draft.field, draft.question, draft.answer, json.dumps(draft.options)) for draft in drafts])
+
+
+def question_bank_depths(db):
+    depths = {template.field: 0 for template in QUESTION_TEMPLATES}
+    for row in db.execute("SELECT field, COUNT(*) AS depth FROM question_bank GROUP BY field"):
+        depths[row['field']] = row['depth']
+    return depths
+
+
+def refill_question_bank(db, low_water, high_water):
+    """
+        tops every template pool below low_water back up to high_water, one transaction per template
+
+        returns the number of questions added per template
+    """
+    catalog = get_catalog()
+    added = {}
+    for field, depth in question_bank_depths(db).items():
+        if depth >= low_water:
+            continue
+        template = template_for_field(field)
+        drafts = [draft for draft in (draft_random_question(catalog, template) for _ in range(high_water - depth))
+                  if draft is not None]
+        store_questions(db, drafts)
+        db.commit()
+        added[field] = len(drafts)
+    return added
+
+
+@click.command("refill-question-bank")
+@click.option('--loop', is_flag=True, help='keep refilling every --interval seconds')
+@click.option('--interval', default=5.0, help='seconds between two refills in --loop mode')
+@with_appcontext
+def refill_question_bank_command(loop, interval):
+    """
+        pre-generates questions so answering a quiz question never pays for generating the next one
+
+        $ flask refill-question-bank --loop
+    """
+    db = get_db()
+    while True:
+        added = refill_question_bank(db, current_app.config['QUESTION_BANK_LOW_WATER'],
+                                     current_app.config['QUESTION_BANK_HIGH_WATER'])
+        if added:
+            click.echo("Added %s" % ", ".join("%s: %s" % (field, count) for field, count in added.items()))
+        if not loop:
+            break
+        time.sleep(interval)
+
+
+@click.command("question-bank-stats")
+@with_appcontext
+def question_bank_stats_command():
+    """Display the number of ready-made questions per template."""
+    low_water = current_app.config['QUESTION_BANK_LOW_WATER']
+    for field, depth in question_bank_depths(get_db()).items():
+        click.echo("%-15s %6s%s" % (field, depth, "  (below %s)" % low_water if depth < low_water else ""))
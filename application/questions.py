@@ -0,0 +1,201 @@
+import random
+
+from functools import partial
+from collections import namedtuple
+
+from application.catalog import get_catalog
+
+
+def rating_options(rating: str, num: int = 3):
+    """
+
+        rating: answer rating passed to avoid duplication of correct answer
+        num: number of random options to return
+    """
+    options = []
+    while True:
+        r = '%.1f' % (random.uniform(0.5, 0.94) * 10)
+        if r not in options and r != rating:
+            options.append(r)
+        if len(options) == num:
+            break
+    return options
+
+
+def general_field_options(field: str, value: str, num: int = 3):
+    return get_catalog().sample_movie_values(field, value, num)
+
+
+def randomly_group_items(items, answers, tot_grps=3, max_per_grp=3):
+    assert tot_grps * max_per_grp <= len(items)
+    items = random.sample(items, len(items))
+    groups = []
+    indx = 0
+    while len(groups) != tot_grps:
+        pick_no_items = random.randint(1, max_per_grp)
+        groups.append(items[indx: indx + pick_no_items])
+        indx += pick_no_items
+
+    return groups
+
+
+def movie_detail_options(field, *answers: str):
+    items = get_catalog().sample_detail_values(field, answers, 9)
+    return randomly_group_items(items, answers, tot_grps=3, max_per_grp=3)
+
+
+def ranked_movie_options(field, below, catalog, movie, num=3):
+    """
+        the movie is the answer, the options are other movies ranked strictly below it on field (above it when
+        below is False), None when the catalog has too few of them
+    """
+    options = catalog.sample_ranked_movies(field, movie, below, num)
+    if len(options) < num:
+        return None
+    return movie['name'], options
+
+
+def shared_detail_options(key, catalog, movie, num=3):
+    """
+        a movie sharing a key value (eg. an actor) with the movie is the answer, the options are movies sharing none,
+        None when no other movie shares one
+    """
+    answer = catalog.shared_detail_movie(key, movie['id'])
+    if answer is None:
+        return None
+    options = catalog.sample_unrelated_movies(key, movie['id'], num)
+    if len(options) < num:
+        return None
+    return answer, options
+
+
+# table 'movies' marks the cross-movie templates, their get_option(catalog, movie) returns (answer, options) or None
+QuestionTemplate = namedtuple('QuestionTemplate', ('question_template', 'field', 'table', 'get_option'))
+
+QUESTION_TEMPLATES = (
+    QuestionTemplate(
+        question_template='What is the rating of the movie {name} ?',
+        field='rating',
+        table='movie',
+        get_option=rating_options
+    ),
+    QuestionTemplate(
+        question_template='When was the movie {name} released ?',
+        field='released_date',
+        table='movie',
+        get_option=partial(general_field_options, 'released_date')
+    ),
+    QuestionTemplate(
+        question_template='What best describes the movie {name} ?',
+        field='description',
+        table='movie',
+        get_option=partial(general_field_options, 'description')
+    ),
+    QuestionTemplate(
+        question_template='Who {verb} the director(s) of the movie {name} ?',
+        field='director',
+        table='movie_detail',
+        get_option=partial(movie_detail_options, 'director')
+    ),
+    QuestionTemplate(
+        question_template='What genre(s) does the movie {name} belongs to ?',
+        field='genre',
+        table='movie_detail',
+        get_option=partial(movie_detail_options, 'genre')
+    ),
+    QuestionTemplate(
+        question_template='Who wrote the movie {name} ?',
+        field='creator',
+        table='movie_detail',
+        get_option=partial(movie_detail_options, 'creator')
+    ),
+    QuestionTemplate(
+        question_template='Who {verb} the actor(s) of the movie {name} ?',
+        field='actor',
+        table='movie_detail',
+        get_option=partial(movie_detail_options, 'actor')
+    ),
+    QuestionTemplate(
+        question_template='Which of these movies has the highest rating ?',
+        field='highest_rating',
+        table='movies',
+        get_option=partial(ranked_movie_options, 'rating', True)
+    ),
+    QuestionTemplate(
+        question_template='Which of these movies has the lowest rating ?',
+        field='lowest_rating',
+        table='movies',
+        get_option=partial(ranked_movie_options, 'rating', False)
+    ),
+    QuestionTemplate(
+        question_template='Which of these movies was released first ?',
+        field='earliest_release',
+        table='movies',
+        get_option=partial(ranked_movie_options, 'released_date', False)
+    ),
+    QuestionTemplate(
+        question_template='Which of these movies shares an actor with the movie {name} ?',
+        field='shared_actor',
+        table='movies',
+        get_option=partial(shared_detail_options, 'actor')
+    ),
+    QuestionTemplate(
+        question_template='Which of these movies shares a director with the movie {name} ?',
+        field='shared_director',
+        table='movies',
+        get_option=partial(shared_detail_options, 'director')
+    ),
+)
+
+
+def filtered_question_templates(*excludes):
+    if excludes:
+        return tuple(filter(lambda x: x.field not in excludes, QUESTION_TEMPLATES))
+    return QUESTION_TEMPLATES
+
+
+QuestionDraft = namedtuple('QuestionDraft', ('movie_id', 'field', 'question', 'answer', 'options'))
+
+
+def template_for_field(field):
+    return next(template for template in QUESTION_TEMPLATES if template.field == field)
+
+
+def draft_question(catalog, movie, template):
+    """
+        builds a question with its correct answer and distractor options, nothing is written to the db
+
+        - returns None when a cross-movie template does not fit the movie, eg. the highest rating for the lowest
+          rated movie
+    """
+    if template.table == 'movies':
+        drafted = template.get_option(catalog, movie)
+        if drafted is None:
+            return None
+        answer, options = drafted
+    elif template.table == 'movie_detail':
+        answer = catalog.movie_details(movie['id'], template.field)
+        options = template.get_option(*answer)
+        answer = ', '.join(answer)
+    else:
+        answer = str(movie[template.field])
+        options = template.get_option(answer)
+    return QuestionDraft(
+        movie_id=movie['id'],
+        field=template.field,
+        question=template.question_template.format(**movie, verb='are'),
+        answer=answer,
+        options=[', '.join(opt) if isinstance(opt, list) else opt for opt in options],
+    )
+
+
+def draft_random_question(catalog, template, attempts=50):
+    """
+        a question of the template about a random movie it fits, None when none was found in attempts movies
+    """
+    for _ in range(attempts):
+        movie = catalog.random_movie()
+        draft = movie and draft_question(catalog, movie, template)
+        if draft is not None:
+            return draft
+    return None
@@ -1,166 +1,247 @@
 import random
-import datetime
 
-from functools import partial
-from collections import namedtuple
 from flask import (
     url_for,
     Blueprint,
     render_template,
     g,
     current_app,
-    request, flash)
+    request, flash, jsonify)
+from markupsafe import Markup
 from werkzeug.utils import redirect
 
 from application import get_db
-from application.auth import login_required
-from application.helpers import render_404
+from application.auth import login_required, api_login_required
+from application.helpers import render_404, conditional_response
+from application.leaderboard import record_quiz_scores
+from application.cache import get_cache
+from application.catalog import get_catalog
+from application.expiry import epoch_now, quiz_cutoff, question_cutoff
+from application.questions import QUESTION_TEMPLATES, filtered_question_templates, draft_question
+from application.question_bank import claim_question
+from application.metrics import timed
 
 bp = Blueprint("quiz", __name__, url_prefix="/quiz")
 
+QUESTIONS_PER_QUIZ = 10
 
-def is_game_alive(date_time: str) -> bool:
-    now = datetime.datetime.now()
-    return datetime.datetime.strptime(date_time, current_app.config['DATETIME_FORMAT']) + datetime.timedelta(
-        seconds=current_app.config['QUIZ_TIMEOUT_SECONDS']) > now
 
+def is_game_alive(created_at: int) -> bool:
+    return created_at > quiz_cutoff()
 
-def rating_options(rating: str, num: int = 3):
+
+def lock_quiz(db, *quiz_ids):
+    """
+        locks the given quizzes and materializes their leaderboard score in the same transaction
+    """
+    placeholders = ", ".join("?" * len(quiz_ids))
+    db.execute(F"UPDATE quiz_state SET locked = 1 WHERE id IN ({placeholders}) AND locked = 0", quiz_ids)
+    record_quiz_scores(db, *quiz_ids)
+    db.commit()
+    get_cache('quiz').delete(*[str(quiz_id) for quiz_id in quiz_ids])
+
+
+def _draft_for_quiz(db, quiz_id, question_no, attempts=10):
+    """
+        - from same movie only allow 3 questions at max.
     """
+    catalog = get_catalog()
+    for _ in range(attempts):
+        movie = catalog.random_movie()
+        if question_no == 1:
+            question_templates = QUESTION_TEMPLATES
+        else:
+            exclude_fields = [i['field'] for i in
+                              db.execute("SELECT field FROM quiz_question WHERE quiz_id = ? AND movie_id = ?",
+                                         (quiz_id, movie['id'])).fetchall()]
+            question_templates = filtered_question_templates(*exclude_fields)
+            if len(exclude_fields) >= 3 or not question_templates:
+                continue
+        draft = draft_question(catalog, movie, random.choice(question_templates))
+        if draft is not None:
+            return draft
+    raise Exception("Could not draft question #%s for quiz %s" % (question_no, quiz_id))
+
+
+def _insert_question(db, quiz_id, question_no, draft):
+    quiz_question = db.execute(
+        "INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (quiz_id, draft.movie_id, draft.field, question_no, draft.question, epoch_now()))
+    db.execute("INSERT INTO question_option (question_id, option, is_correct) VALUES (?, ?, ?)",
+               (quiz_question.lastrowid, draft.answer, 1))
+    db.executemany("INSERT INTO question_option (question_id, option) VALUES (?, ?)",
+                   [(quiz_question.lastrowid, opt) for opt in draft.options])
+    return quiz_question.lastrowid
+
 
-        rating: answer rating passed to avoid duplication of correct answer
-        num: number of random options to return
+def _draft_quiz(catalog, total=QUESTIONS_PER_QUIZ, attempts=100):
     """
+        drafts a whole quiz in memory, same rules as _draft_for_quiz: a (movie, field) pair is asked once and
+        a movie at most 3 times
+    """
+    drafts, used_fields = [], {}
+    for _ in range(attempts):
+        movie = catalog.random_movie()
+        fields = used_fields.setdefault(movie['id'], [])
+        question_templates = filtered_question_templates(*fields)
+        if len(fields) >= 3 or not question_templates:
+            continue
+        draft = draft_question(catalog, movie, random.choice(question_templates))
+        if draft is None:
+            continue
+        fields.append(draft.field)
+        drafts.append(draft)
+        if len(drafts) == total:
+            return drafts
+    raise Exception("Could not draft %s questions" % total)
+
+
+@timed('question_generation_seconds', mode='quiz')
+def _generate_quiz_questions(db, quiz_id):
+    """
+        writes every question of the quiz with batched inserts, each question timer starts when it is first shown
+    """
+    drafts = _draft_quiz(get_catalog())
+    now = epoch_now()
+    db.executemany(
+        "INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at, activated) "
+        "VALUES (?, ?, ?, ?, ?, ?, 0)",
+        [(quiz_id, draft.movie_id, draft.field, question_no, draft.question, now)
+         for question_no, draft in enumerate(drafts, 1)])
+    question_ids = dict(db.execute("SELECT question_no, id FROM quiz_question WHERE quiz_id = ?", (quiz_id,)))
     options = []
-    while True:
-        r = '%.1f' % (random.uniform(0.5, 0.94) * 10)
-        if r not in options and r != rating:
-            options.append(r)
-        if len(options) == num:
-            break
-    return options
+    for question_no, draft in enumerate(drafts, 1):
+        options.append((question_ids[question_no], draft.answer, 1))
+        options += [(question_ids[question_no], opt, 0) for opt in draft.options]
+    db.executemany("INSERT INTO question_option (question_id, option, is_correct) VALUES (?, ?, ?)", options)
 
 
-def general_field_options(field: str, value: str, num: int = 3):
-    db = get_db()
-    rows = db.execute(F"SELECT DISTINCT {field} FROM movie WHERE {field} != ? ORDER BY RANDOM()",
-                      (value,)).fetchall()
-    options = [rows[i][field] for i in range(num)]
-    return options
+def _current_question(db, quiz_id):
+    return db.execute("SELECT * FROM quiz_question WHERE quiz_id = ? AND locked = 0 ORDER BY id LIMIT 1",
+                      (quiz_id,)).fetchone()
 
 
-def randomly_group_items(items, answers, tot_grps=3, max_per_grp=3):
-    assert tot_grps * max_per_grp <= len(items)
-    groups = []
-    indx = 0
-    while len(groups) != tot_grps:
-        pick_no_items = random.randint(1, max_per_grp)
-        groups.append(items[indx: indx + pick_no_items])
-        indx += pick_no_items
+def _is_question_expired(quiz_ques):
+    return bool(quiz_ques['activated']) and quiz_ques['created_at'] <= question_cutoff()
 
-    return groups
 
+def _activate_question(db, question_id):
+    """
+        starts the timer of a pre-generated question the first time it is shown
+    """
+    db.execute("UPDATE quiz_question SET created_at = ?, activated = 1 WHERE id = ? AND activated = 0",
+               (epoch_now(), question_id))
 
-def movie_detail_options(field, *answers: str):
-    db = get_db()
-    placeholders = ", ".join("?" * len(answers))
-    movie_details = db.execute(
-        F"SELECT DISTINCT value FROM movie_detail WHERE key = ? AND value NOT IN ({placeholders})",
-        (field, *answers)).fetchall()
-    items = [i['value'] for i in movie_details]
-    return randomly_group_items(items, answers, tot_grps=3, max_per_grp=3)
-
-
-QuestionTemplate = namedtuple('QuestionTemplate', ('question_template', 'field', 'table', 'get_option'))
-
-QUESTION_TEMPLATES = (
-    QuestionTemplate(
-        question_template='What is the rating of the movie {name} ?',
-        field='rating',
-        table='movie',
-        get_option=rating_options
-    ),
-    QuestionTemplate(
-        question_template='When was the movie {name} released ?',
-        field='released_date',
-        table='movie',
-        get_option=partial(general_field_options, 'released_date')
-    ),
-    QuestionTemplate(
-        question_template='What best describes the movie {name} ?',
-        field='description',
-        table='movie',
-        get_option=partial(general_field_options, 'description')
-    ),
-    QuestionTemplate(
-        question_template='Who {verb} the director(s) of the movie {name} ?',
-        field='director',
-        table='movie_detail',
-        get_option=partial(movie_detail_options, 'director')
-    ),
-    QuestionTemplate(
-        question_template='What genre(s) does the movie {name} belongs to ?',
-        field='genre',
-        table='movie_detail',
-        get_option=partial(movie_detail_options, 'genre')
-    ),
-    QuestionTemplate(
-        question_template='Who wrote the movie {name} ?',
-        field='creator',
-        table='movie_detail',
-        get_option=partial(movie_detail_options, 'creator')
-    ),
-    QuestionTemplate(
-        question_template='Who {verb} the actor(s) of the movie {name} ?',
-        field='actor',
-        table='movie_detail',
-        get_option=partial(movie_detail_options, 'actor')
-    ),
-)
-
-
-def filtered_question_templates(*excludes):
-    if excludes:
-        return tuple(filter(lambda x: x.field not in excludes, QUESTION_TEMPLATES))
-    return QUESTION_TEMPLATES
+
+def _next_question(db, quiz_id, question_no):
+    """
+        activates the next pre-generated question of the quiz, or generates it when there is none
+    """
+    pending = _current_question(db, quiz_id)
+    if pending is None:
+        return _generate_random_question(db, quiz_id, question_no)
+    _activate_question(db, pending['id'])
+    return pending['id']
 
 
+@timed('question_generation_seconds', mode='question')
 def _generate_random_question(db, quiz_id, question_no):
     """
-        - from same movie only allow 3 questions at max.
+        claims a ready-made question from the question bank when enabled, else drafts one synchronously
     """
-    movie = db.execute("SELECT * FROM movie ORDER BY RANDOM()").fetchone()
-    if question_no > 1:
-        exclude_fields = [i['field'] for i in
-                          db.execute("SELECT field FROM quiz_question WHERE quiz_id = ? AND movie_id = ?",
-                                     (quiz_id, movie['id'])).fetchall()]
-        question_templates = filtered_question_templates(*exclude_fields)
-    else:
-        question_templates = filtered_question_templates()
-    random_no = random.randint(0, len(question_templates) - 1)
-    template = question_templates[random_no]
-    if template.table == 'movie_detail':
-        movie_details = db.execute('''SELECT * FROM movie INNER JOIN movie_detail
-                                      ON movie.id = movie_detail.movie_id
-                                      WHERE movie.id = ? AND movie_detail.key = ?''',
-                                   (movie['id'], template.field)).fetchall()
-        answer = [i['value'] for i in movie_details]
-        options = template.get_option(*answer)
-        answer = ', '.join(answer)
-    else:
-        answer = str(movie[template.field])
-        options = template.get_option(answer)
-    question = template.question_template.format(**movie, verb='are')
-    now = datetime.datetime.now().strftime(current_app.config['DATETIME_FORMAT'])
-    quiz_question = db.execute(
-        "INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (quiz_id, movie['id'], template.field, question_no, question, now))
-    db.execute("INSERT INTO question_option (question_id, option, is_correct) VALUES (?, ?, ?)",
-               (quiz_question.lastrowid, answer, 1))
-    db.executemany("INSERT INTO question_option (question_id, option) VALUES (?, ?)",
-                   [(quiz_question.lastrowid, ', '.join(opt) if isinstance(opt, list) else opt) for opt in options])
-    return quiz_question.lastrowid
+    draft = None
+    if current_app.config['QUESTION_BANK_ENABLED']:
+        draft = claim_question(db, quiz_id)
+    if draft is None:
+        draft = _draft_for_quiz(db, quiz_id, question_no)
+    return _insert_question(db, quiz_id, question_no, draft)
+
+
+def _open_question(db, quiz_id):
+    """
+        makes sure an alive quiz has an open question: activates a pre-generated one, replaces an expired one or
+        generates the next one, the changes are left uncommitted
+
+        returns (question_id, unchanged, expired)
+            - question_id is None once the last question is locked, the quiz must then be locked
+            - unchanged is the row of the open question when nothing had to be done
+            - expired is the number of the question that just expired, if any
+    """
+    quiz_ques = _current_question(db, quiz_id)
+    if quiz_ques is None:
+        # a new quiz, or its last question was locked by the expiry sweeper
+        asked = db.execute("SELECT MAX(question_no) FROM quiz_question WHERE quiz_id = ?",
+                           (quiz_id,)).fetchone()[0] or 0
+        if asked >= QUESTIONS_PER_QUIZ:
+            return None, None, None
+        return _generate_random_question(db=db, quiz_id=quiz_id, question_no=asked + 1), None, asked or None
+
+    if not quiz_ques['activated']:
+        _activate_question(db, quiz_ques['id'])
+        return quiz_ques['id'], None, None
+
+    if _is_question_expired(quiz_ques):
+        db.execute("UPDATE quiz_question SET locked = 1 WHERE id = ?", (quiz_ques['id'],))
+        if quiz_ques['question_no'] >= QUESTIONS_PER_QUIZ:
+            return None, None, None
+        return _next_question(db, quiz_id, quiz_ques['question_no'] + 1), None, quiz_ques['question_no']
+
+    return quiz_ques['id'], quiz_ques, None
+
+
+def _valid_answer(answer):
+    """
+        whether the answer has the type of an option id (an integer or its string form), None skips
+    """
+    return answer is None or (isinstance(answer, (int, str)) and not isinstance(answer, bool))
+
+
+def _record_answer(db, question_id, answer):
+    """
+        locks the question with the given answer (an option id, None to skip it)
+
+        - raises ValueError when the answer is not one of the options of the question, the question stays open
+
+        returns whether the answer is correct, None when skipped
+    """
+    correct = None
+    if answer is not None:
+        options = {str(row['id']): row for row in db.execute(
+            "SELECT id, is_correct FROM question_option WHERE question_id = ?", (question_id,))}
+        option = options.get(str(answer).strip())
+        if option is None:
+            raise ValueError("not an option of question %s: %r" % (question_id, answer))
+        answer, correct = option['id'], bool(option['is_correct'])
+    db.execute("UPDATE quiz_question SET user_answer = ?, locked = 1 WHERE id = ?", (answer, question_id))
+    return correct
+
+
+def _question_options(db, question_id):
+    return db.execute("SELECT quiz_question.id AS qid, "
+                      "question_option.id AS option_id, "
+                      "quiz_question.question, "
+                      "quiz_question.question_no, "
+                      "quiz_question.created_at, "
+                      "quiz_question.activated, "
+                      "question_option.option "
+                      "FROM quiz_question "
+                      "INNER JOIN question_option "
+                      "ON qid = question_option.question_id "
+                      "WHERE qid = ?",
+                      (question_id,)).fetchall()
+
+
+def _quiz_log(db, quiz_id):
+    return db.execute(
+        "SELECT quiz_question.question_no, quiz_question.question, question_option.option, "
+        "question_option.is_correct "
+        "FROM quiz_state "
+        "INNER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id "
+        "LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id "
+        "AND question_option.question_id = quiz_question.id "
+        "WHERE quiz_state.id = ? ORDER BY quiz_question.question_no",
+        (quiz_id,)).fetchall()
 
 
 @bp.route("/<quiz_id>/score", methods=("GET", "POST"))
@@ -172,16 +253,17 @@ def score(quiz_id):
     if quiz_state is None:
         return render_404()
 
-    quiz_log = db.execute(
-        "SELECT quiz_question.question_no, quiz_question.question, question_option.option, question_option.is_correct "
-        "FROM quiz_state "
-        "INNER JOIN quiz_question on quiz_state.id=quiz_question.quiz_id "
-        "LEFT OUTER JOIN question_option on quiz_question.user_answer = question_option.id "
-        "WHERE quiz_state.id = ? ORDER BY quiz_question.question_no",
-        (quiz_id,)).fetchall()
+    # a locked quiz never changes, its rendered log is cached and browsers revalidate it with its etag
+    score_cache = get_cache('score')
+    score_log = score_cache.get(quiz_state['id'])
+    if score_log is None:
+        quiz_log = _quiz_log(db, quiz_id)
+        score = str(sum(i['is_correct'] for i in quiz_log if i['is_correct']))
+        score_log = Markup(render_template('quiz/_score_log.html', quiz_log=quiz_log, score=score))
+        score_cache.set(quiz_state['id'], score_log)
 
-    score = str(sum(i['is_correct'] for i in quiz_log if i['is_correct']))
-    return render_template('quiz/score.html', quiz_log=quiz_log, score=score)
+    return conditional_response('%s:%s' % (g.user['username'], score_log),
+                                lambda: render_template('quiz/score.html', score_log=score_log))
 
 
 @bp.route("/<quiz_id>/question", methods=("GET", "POST"))
@@ -197,30 +279,62 @@ def question(quiz_id):
             - last question number (10) lock and quiz lock happens in same transaction in atomic state
     """
 
-    def _get_context(question_id):
-        db = get_db()
-        quiz_ques_options = db.execute("SELECT quiz_question.id AS qid, "
-                                       "question_option.id AS option_id, "
-                                       "quiz_question.question, "
-                                       "quiz_question.question_no, "
-                                       "question_option.option "
-                                       "FROM quiz_question "
-                                       "INNER JOIN question_option "
-                                       "ON qid = question_option.question_id "
-                                       "WHERE qid = ?",
-                                       (question_id,)).fetchall()
+    quiz_cache = get_cache('quiz')
+
+    def _get_context(question_id, quiz_state=None):
+        """
+            - with quiz_state given, the context is cached for refreshes of the same question
+        """
+        quiz_ques_options = _question_options(get_db(), question_id)
         context = {'question_no': quiz_ques_options[0]['question_no'], 'question': quiz_ques_options[0]['question'],
                    'options': [(i['option_id'], i['option']) for i in quiz_ques_options]}
 
+        if quiz_state is not None:
+            quiz_cache.set(quiz_id, {
+                'user_id': quiz_state['user_id'],
+                'quiz_created_at': quiz_state['created_at'],
+                'question': {key: quiz_ques_options[0][key] for key in ('qid', 'created_at', 'activated')},
+                'context': context,
+            })
         return context
 
+    def _get_cached_entry(db):
+        """
+            the cached entry of the current question, validated with one indexed query on quiz_question
+        """
+        entry = quiz_cache.get(quiz_id)
+        if entry is None or entry['user_id'] != g.user['id']:
+            return None
+        if not is_game_alive(entry['quiz_created_at']) or _is_question_expired(entry['question']):
+            quiz_cache.delete(quiz_id)
+            return None
+        current = db.execute("SELECT id FROM quiz_question WHERE quiz_id = ? AND locked = 0 ORDER BY id LIMIT 1",
+                             (quiz_id,)).fetchone()
+        if current is None or current['id'] != entry['question']['qid']:
+            quiz_cache.delete(quiz_id)
+            return None
+        return entry
+
+    def _render_unchanged(question_id, created_at, get_context):
+        """
+            the page of a question is the same until it is answered or expires, refreshes are answered
+            with 304 Not Modified
+        """
+        return conditional_response('%s:%s:%s' % (g.user['id'], question_id, created_at),
+                                    lambda: render_template('quiz/question.html', **get_context()),
+                                    last_modified=created_at)
+
     def _quiz_complete_action(db):
-        db.execute("UPDATE quiz_state SET locked = 1 WHERE id = ?", (quiz_id,))
-        db.commit()
+        lock_quiz(db, quiz_id)
         return redirect(url_for('quiz.score', quiz_id=quiz_id))
 
     def get():
         db = get_db()
+        entry = _get_cached_entry(db)
+        if entry is not None:
+            return _render_unchanged(entry['question']['qid'], entry['question']['created_at'],
+                                     lambda: entry['context'])
+
         quiz_state = db.execute("SELECT * FROM quiz_state WHERE id = ? AND user_id = ?",
                                 (quiz_id, g.user['id'])).fetchone()
 
@@ -232,73 +346,62 @@ def question(quiz_id):
             return redirect(url_for('quiz.score', quiz_id=quiz_id))
 
         if not is_game_alive(quiz_state['created_at']):
-            db.execute("UPDATE quiz_state SET locked = 1 WHERE id = ? AND locked = 0", (quiz_id,))
+            lock_quiz(db, quiz_id)
             flash('Quiz expired.', category='warning')
             return redirect(url_for('quiz.score', quiz_id=quiz_id))
 
-        quiz_ques = db.execute("SELECT * FROM quiz_question WHERE quiz_id = ? AND locked = 0 ORDER BY id DESC",
-                               (quiz_id,)).fetchone()
-        now = datetime.datetime.now()
-        if quiz_ques is None:
-            question_id = _generate_random_question(db=db, quiz_id=quiz_id, question_no=1)
-            db.commit()
-
-        elif datetime.datetime.strptime(quiz_ques['created_at'],
-                                        current_app.config['DATETIME_FORMAT']) + datetime.timedelta(
-            seconds=current_app.config['QUESTION_TIMEOUT_SECONDS']) <= now:
-            if quiz_ques['question_no'] >= 10:
-                return _quiz_complete_action(db)
-
-            flash('Question #%s expired' % quiz_ques['question_no'], category='warning')
-            db.execute("UPDATE quiz_question SET locked = 1 WHERE quiz_id = ? AND locked = 0", (quiz_id,))
-            question_id = _generate_random_question(db=db, quiz_id=quiz_id, question_no=quiz_ques['question_no'] + 1)
-            db.commit()
-
-        else:
-            question_id = quiz_ques['id']
+        question_id, unchanged, expired = _open_question(db, quiz_id)
+        if expired:
+            flash('Question #%s expired' % expired, category='warning')
+        if question_id is None:
+            return _quiz_complete_action(db)
+        if unchanged is not None:
+            return _render_unchanged(unchanged['id'], unchanged['created_at'],
+                                     lambda: _get_context(unchanged['id'], quiz_state))
+        db.commit()
 
-        context = _get_context(question_id)
+        context = _get_context(question_id, quiz_state)
         return render_template('quiz/question.html', **context), 200
 
     def post():
         db = get_db()
+        quiz_cache.delete(quiz_id)
         answer = request.form.get('answer', None)
-        quiz_ques = db.execute("SELECT * FROM quiz_question WHERE quiz_id = ? AND locked = 0 ORDER BY id DESC",
-                               (quiz_id,)).fetchone()
-        now = datetime.datetime.now()
+        quiz_ques = _current_question(db, quiz_id)
         if quiz_ques is None:
-            return render_404()
-        elif datetime.datetime.strptime(
-                quiz_ques['created_at'],
-                current_app.config['DATETIME_FORMAT']) + datetime.timedelta(
-            seconds=current_app.config['QUESTION_TIMEOUT_SECONDS']) <= now:
-            db.execute("UPDATE quiz_question SET locked = 1 WHERE quiz_id = ? AND locked = 0", (quiz_id,))
+            # no open question, eg. locked by the expiry sweeper, the question page sorts it out
+            flash("Question expired.", category='warning')
+            return redirect(url_for('quiz.question', quiz_id=quiz_id))
+        elif _is_question_expired(quiz_ques):
+            db.execute("UPDATE quiz_question SET locked = 1 WHERE id = ?", (quiz_ques['id'],))
 
             flash("Question expired.", category='warning')
+            if quiz_ques['question_no'] >= QUESTIONS_PER_QUIZ:
+                return _quiz_complete_action(db)
+            _next_question(db, quiz_id, quiz_ques['question_no'] + 1)
+            db.commit()
             return redirect(url_for('quiz.question', quiz_id=quiz_id))
 
         else:
             question_id = quiz_ques['id']
 
-        if answer is not None:
-            correct_option = db.execute("SELECT question_option.id AS option_id FROM quiz_question "
-                                        "INNER JOIN question_option "
-                                        "ON quiz_question.id = question_option.question_id "
-                                        "WHERE quiz_question.id = ? AND is_correct = 1",
-                                        (question_id,)).fetchone()
-            if str(correct_option['option_id']) == answer:
-                flash("Correct answer", category='success')
-            else:
-                flash("Wrong answer", category='danger')
-        else:
+        try:
+            correct = _record_answer(db, question_id, answer)
+        except ValueError:
+            flash("Not an option of question #%s." % quiz_ques['question_no'], category='danger')
+            return redirect(url_for('quiz.question', quiz_id=quiz_id))
+        if correct is None:
             flash("Skipped question #%s" % quiz_ques['question_no'], category='warning')
+        elif correct:
+            flash("Correct answer", category='success')
+        else:
+            flash("Wrong answer", category='danger')
 
-        db.execute("UPDATE quiz_question SET user_answer = ?, locked = 1 WHERE id = ?", (answer, question_id))
-        if quiz_ques['question_no'] >= 10:
+        if quiz_ques['question_no'] >= QUESTIONS_PER_QUIZ:
             flash('Quiz complete', category='info')
             return _quiz_complete_action(db=db)
 
-        question_id = _generate_random_question(db=db, quiz_id=quiz_id, question_no=quiz_ques['question_no'] + 1)
+        question_id = _next_question(db, quiz_id, quiz_ques['question_no'] + 1)
         db.commit()
 
         context = _get_context(question_id)
@@ -321,23 +424,163 @@ def create_quiz():
         - DO NOT CREATE THE GAME IF LESS THAN 10 MOVIES SCRAPPED IN DB
     """
     db = get_db()
-    if db.execute("SELECT COUNT(*) as count FROM movie").fetchone()['count'] < 10:
+    if not _has_enough_movies(db):
         error = "Not enough questions in the database. Game could not be loaded."
         return render_template('quiz/error.html', error=error)
 
-    quiz_states = db.execute("SELECT * FROM quiz_state WHERE user_id = ? AND locked = 0", (g.user['id'],)).fetchall()
+    quiz_id, resumed = _start_quiz(db, g.user['id'])
+    if resumed:
+        flash("You have incomplete quiz", category='info')
+    return redirect(url_for('quiz.question', quiz_id=quiz_id))
+
+
+def _has_enough_movies(db):
+    return db.execute("SELECT COUNT(*) as count FROM movie").fetchone()['count'] >= 10
+
+
+def _start_quiz(db, user_id):
+    """
+        returns (quiz_id, resumed): the alive quiz of the user, or a new one once the expired ones are locked
+    """
+    quiz_states = db.execute("SELECT * FROM quiz_state WHERE user_id = ? AND locked = 0", (user_id,)).fetchall()
     if quiz_states:
         if is_game_alive(quiz_states[-1]['created_at']):
-            flash("You have incomplete quiz", category='info')
-            return redirect(url_for('quiz.question', quiz_id=quiz_states[-1]['id']))
+            return quiz_states[-1]['id'], True
+        lock_quiz(db, *[i['id'] for i in quiz_states])
 
-        else:
-            db.execute("UPDATE quiz_state SET locked = 1 WHERE user_id = ? AND locked = 0", (g.user['id'],))
-
-    cursor = db.execute(
-        "INSERT INTO quiz_state (user_id, created_at) VALUES (?, ?)",
-        (g.user['id'], datetime.datetime.now().strftime(current_app.config['DATETIME_FORMAT']))
-    )
+    cursor = db.execute("INSERT INTO quiz_state (user_id, created_at) VALUES (?, ?)", (user_id, epoch_now()))
+    if current_app.config['QUIZ_EAGER_GENERATION']:
+        _generate_quiz_questions(db, cursor.lastrowid)
     db.commit()
+    return cursor.lastrowid, False
+
+
+# JSON API, one request per step of the quiz: create (returns the first question), answer (returns the next
+# question or the final score), plus the current question and score for reloads
 
-    return redirect(url_for('quiz.question', quiz_id=cursor.lastrowid))
+def _question_json(db, question_id):
+    rows = _question_options(db, question_id)
+    return {
+        'id': rows[0]['qid'],
+        'number': rows[0]['question_no'],
+        'text': rows[0]['question'],
+        'options': [{'id': row['option_id'], 'text': row['option']} for row in rows],
+        'expires_at': rows[0]['created_at'] + current_app.config['QUESTION_TIMEOUT_SECONDS'],
+    }
+
+
+def _quiz_json(db, quiz_state, question_id=None):
+    """
+        state of the quiz with its open question, or its score once complete
+    """
+    quiz = {'id': quiz_state['id'], 'total': QUESTIONS_PER_QUIZ,
+            'expires_at': quiz_state['created_at'] + current_app.config['QUIZ_TIMEOUT_SECONDS']}
+    if question_id is None:
+        row = db.execute("SELECT score FROM quiz_score WHERE quiz_id = ?", (quiz_state['id'],)).fetchone()
+        quiz.update(complete=True, score=row['score'] if row is not None else 0)
+    else:
+        quiz.update(complete=False, question=_question_json(db, question_id))
+    return quiz
+
+
+def _api_quiz_state(db, quiz_id):
+    return db.execute("SELECT * FROM quiz_state WHERE id = ? AND user_id = ?", (quiz_id, g.user['id'])).fetchone()
+
+
+def _api_open_question(db, quiz_state):
+    """
+        the open question id of the quiz and the number of a question that just expired, locking the quiz
+        when it is over (question id None)
+    """
+    if quiz_state['locked']:
+        return None, None
+    if not is_game_alive(quiz_state['created_at']):
+        lock_quiz(db, quiz_state['id'])
+        return None, None
+    question_id, _, expired = _open_question(db, quiz_state['id'])
+    if question_id is None:
+        lock_quiz(db, quiz_state['id'])
+    else:
+        db.commit()
+    return question_id, expired
+
+
+@bp.route("/api/create", methods=("POST",))
+@api_login_required
+def api_create_quiz():
+    db = get_db()
+    if not _has_enough_movies(db):
+        return jsonify(error="not enough movies"), 503
+    quiz_id, resumed = _start_quiz(db, g.user['id'])
+    quiz_state = _api_quiz_state(db, quiz_id)
+    question_id, _ = _api_open_question(db, quiz_state)
+    return jsonify(resumed=resumed, quiz=_quiz_json(db, quiz_state, question_id)), 200 if resumed else 201
+
+
+@bp.route("/api/<int:quiz_id>/question", methods=("GET",))
+@api_login_required
+def api_question(quiz_id):
+    db = get_db()
+    quiz_state = _api_quiz_state(db, quiz_id)
+    if quiz_state is None:
+        return jsonify(error="quiz not found"), 404
+    question_id, expired = _api_open_question(db, quiz_state)
+    return jsonify(expired=expired, quiz=_quiz_json(db, quiz_state, question_id))
+
+
+@bp.route("/api/<int:quiz_id>/answer", methods=("POST",))
+@api_login_required
+def api_answer(quiz_id):
+    """
+        body: {"question": <question id>, "answer": <option id or null to skip>}
+
+        answers the open question and returns the result along with the next question (or the final score)
+    """
+    db = get_db()
+    quiz_state = _api_quiz_state(db, quiz_id)
+    if quiz_state is None:
+        return jsonify(error="quiz not found"), 404
+    if quiz_state['locked']:
+        return jsonify(error="quiz is complete", quiz=_quiz_json(db, quiz_state)), 409
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    if not _valid_answer(payload.get('answer')):
+        return jsonify(error="answer must be an option id or null"), 400
+    get_cache('quiz').delete(str(quiz_id))
+
+    result = 'expired'
+    quiz_ques = _current_question(db, quiz_id)
+    if quiz_ques is not None and quiz_ques['id'] != payload.get('question'):
+        # answering a question that is not the open one, eg. answered from another tab
+        return jsonify(error="not the open question", quiz=_quiz_json(db, quiz_state, quiz_ques['id'])), 409
+    if quiz_ques is not None and is_game_alive(quiz_state['created_at']) and not _is_question_expired(quiz_ques):
+        try:
+            correct = _record_answer(db, quiz_ques['id'], payload.get('answer'))
+        except ValueError:
+            return jsonify(error="not an option of the question", quiz=_quiz_json(db, quiz_state, quiz_ques['id'])), 400
+        result = 'skipped' if correct is None else 'correct' if correct else 'wrong'
+        if quiz_ques['question_no'] >= QUESTIONS_PER_QUIZ:
+            lock_quiz(db, quiz_id)
+            return jsonify(result=result, quiz=_quiz_json(db, quiz_state))
+        question_id = _next_question(db, quiz_id, quiz_ques['question_no'] + 1)
+        db.commit()
+    else:
+        question_id, _ = _api_open_question(db, quiz_state)
+    return jsonify(result=result, quiz=_quiz_json(db, quiz_state, question_id))
+
+
+@bp.route("/api/<int:quiz_id>/score", methods=("GET",))
+@api_login_required
+def api_score(quiz_id):
+    db = get_db()
+    quiz_state = _api_quiz_state(db, quiz_id)
+    if quiz_state is None or not quiz_state['locked']:
+        return jsonify(error="no complete quiz found"), 404
+    quiz_log = _quiz_log(db, quiz_id)
+    return jsonify(quiz=_quiz_json(db, quiz_state), questions=[{
+        'number': row['question_no'],
+        'text': row['question'],
+        'answer': row['option'],
+        'result': 'skipped' if row['is_correct'] is None else 'correct' if row['is_correct'] else 'wrong',
+    } for row in quiz_log])
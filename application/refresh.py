@@ -0,0 +1,104 @@
+import time
+import click
+import logging
+
+from collections import Counter
+from flask import current_app
+from flask.cli import with_appcontext
+
+from application.db import catalog_writer, publish_catalog
+from application.ingest import ingest_movies, mark_scraped
+from application.scraper import get_fetcher
+from application.tasks import _scrape_movie_data
+
+logger = logging.getLogger(__name__)
+
+ASKED_WATERMARK = 'asked_question_id'
+
+
+def count_asked_questions(db):
+    """
+        adds the quiz questions created since the previous call to the asked_count of their movie
+    """
+    row = db.execute("SELECT value FROM refresh_state WHERE key = ?", (ASKED_WATERMARK,)).fetchone()
+    watermark = row['value'] if row is not None else 0
+    last_id = db.execute("SELECT MAX(id) FROM quiz_question").fetchone()[0] or 0
+    if last_id <= watermark:
+        return 0
+    counts = db.execute("SELECT movie_id, COUNT(*) AS asked FROM quiz_question WHERE id > ? AND id <= ? "
+                        "GROUP BY movie_id", (watermark, last_id)).fetchall()
+    db.executemany("UPDATE movie_source SET asked_count = asked_count + ? WHERE movie_id = ?",
+                   [(row['asked'], row['movie_id']) for row in counts])
+    db.execute("INSERT OR REPLACE INTO refresh_state (key, value) VALUES (?, ?)", (ASKED_WATERMARK, last_id))
+    db.commit()
+    return last_id - watermark
+
+
+def stale_titles(db, limit, min_age, now=None):
+    """
+        imdb ids of the titles scraped more than min_age seconds ago, the longest unrefreshed and most asked
+        about first (age weighted by the number of questions asked about the title)
+    """
+    now = int(time.time()) if now is None else now
+    rows = db.execute("SELECT imdb_id FROM movie_source WHERE scraped_at <= ? "
+                      "ORDER BY (? - scraped_at) * (1 + asked_count) DESC, movie_id LIMIT ?",
+                      (now - min_age, now, limit)).fetchall()
+    return [row['imdb_id'] for row in rows]
+
+
+def refresh_catalog(db, fetcher, batch_size, min_age):
+    """
+        re-scrapes one bounded batch of the stalest titles
+
+        - unchanged titles only get their scraped_at bumped (see ingest_movies), failed ones are retried after
+          min_age like the others
+        - returns a Counter of the ingest results and failed titles
+    """
+    count_asked_questions(db)
+    imdb_ids = stale_titles(db, batch_size, min_age)
+    if not imdb_ids:
+        return Counter()
+    summary = Counter()
+    movies, failed = [], []
+    for link, movie_data in fetcher.map(_scrape_movie_data, ['title/%s/' % imdb_id for imdb_id in imdb_ids]):
+        if movie_data is None:
+            failed.append(link.split('/')[1])
+        else:
+            movies.append(movie_data)
+    summary.update(ingest_movies(db, movies, batch_size=batch_size))
+    if failed:
+        logger.warning("Failed to refresh %s", ", ".join(failed))
+        mark_scraped(db, failed)
+        db.commit()
+        summary['failed'] += len(failed)
+    return summary
+
+
+@click.command("refresh-catalog")
+@click.option('--loop', is_flag=True, help='keep refreshing every --interval seconds')
+@click.option('--interval', default=60.0, help='seconds between two refreshes in --loop mode')
+@click.option('--batch-size', default=None, type=int,
+              help='titles re-scraped per refresh, defaults to REFRESH_BATCH_SIZE')
+@with_appcontext
+def refresh_catalog_command(loop, interval, batch_size):
+    """
+        keeps the scraped movies current, re-scraping a bounded batch of the stalest and most asked titles
+
+        $ flask refresh-catalog --loop
+    """
+    config = current_app.config
+    while True:
+        # looping, the staging copy of a separate catalog is kept across refreshes and only replaces the catalog
+        # file when titles changed, rather than copying the whole catalog for every batch
+        with catalog_writer(publish=not loop) as db:
+            summary = refresh_catalog(db, get_fetcher(), batch_size or config['REFRESH_BATCH_SIZE'],
+                                      config['REFRESH_MIN_AGE'])
+        if loop and (summary['inserted'] or summary['updated']):
+            publish_catalog()
+        if summary:
+            click.echo("Refreshed %s titles: %s updated, %s unchanged, %s failed" % (
+                summary['updated'] + summary['unchanged'] + summary['failed'], summary['updated'],
+                summary['unchanged'], summary['failed']))
+        if not loop:
+            break
+        time.sleep(interval)
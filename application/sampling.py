@@ -0,0 +1,163 @@
+import random
+
+MOVIE_FIELDS = ('name', 'description', 'released_date', 'rating')
+# movie columns indexed in order (movie_rating, movie_released_date) for the cross-movie questions
+RANKED_FIELDS = ('rating', 'released_date')
+
+# random draws tried per requested value before falling back to an exact (indexed) query
+DRAWS_PER_VALUE = 8
+
+
+def _id_range(db, table):
+    # a subquery per bound: MIN() and MAX() in the same select are not optimized, they scan the whole table
+    row = db.execute(F"SELECT (SELECT MIN(id) FROM {table}) AS low, (SELECT MAX(id) FROM {table}) AS high").fetchone()
+    return row['low'], row['high']
+
+
+def random_movie(db):
+    """
+        picks a random movie by seeking to a random rowid, O(log n) whatever the catalog size
+
+        - ids are AUTOINCREMENT and movies are never deleted, so gaps (and the bias they add) are rare
+    """
+    low, high = _id_range(db, 'movie')
+    if low is None:
+        return None
+    return db.execute("SELECT * FROM movie WHERE id >= ? ORDER BY id LIMIT 1",
+                      (random.randint(low, high),)).fetchone()
+
+
+def sample_movie_values(db, field, exclude, k):
+    """
+        k distinct random values of a movie column, different from the exclude value
+    """
+    assert field in MOVIE_FIELDS, "Unknown movie field %s" % field
+    low, high = _id_range(db, 'movie')
+    values = []
+    if low is None:
+        return values
+
+    for _ in range(k * DRAWS_PER_VALUE):
+        row = db.execute(F"SELECT {field} FROM movie WHERE id >= ? ORDER BY id LIMIT 1",
+                         (random.randint(low, high),)).fetchone()
+        value = row[field]
+        if value != exclude and value not in values:
+            values.append(value)
+            if len(values) == k:
+                return values
+
+    # tiny or very repetitive catalog, complete the sample exactly
+    placeholders = ", ".join("?" * (len(values) + 1))
+    rows = db.execute(F"SELECT DISTINCT {field} FROM movie WHERE {field} NOT IN ({placeholders}) LIMIT ?",
+                      (exclude, *values, k - len(values))).fetchall()
+    values += [row[field] for row in rows]
+    random.shuffle(values)
+    return values
+
+
+def sample_detail_values(db, key, excludes, k):
+    """
+        k distinct random movie_detail values of the given key, none of them in excludes
+
+        - seeks to a random movie_detail rowid and takes the next row with the key, details of one movie are
+          stored next to each other so the walk is bounded by the number of details per movie
+    """
+    low, high = _id_range(db, 'movie_detail')
+    values = []
+    if low is None:
+        return values
+
+    for _ in range(k * DRAWS_PER_VALUE):
+        row = db.execute("SELECT value FROM movie_detail WHERE id >= ? AND key = ? ORDER BY id LIMIT 1",
+                         (random.randint(low, high), key)).fetchone()
+        if row is None:
+            continue
+        value = row['value']
+        if value not in excludes and value not in values:
+            values.append(value)
+            if len(values) == k:
+                return values
+
+    placeholders = ", ".join("?" * (len(excludes) + len(values)))
+    rows = db.execute(
+        F"SELECT DISTINCT value FROM movie_detail WHERE key = ? AND value NOT IN ({placeholders}) LIMIT ?",
+        (key, *excludes, *values, k - len(values))).fetchall()
+    values += [row['value'] for row in rows]
+    random.shuffle(values)
+    return values
+
+
+def sample_ranked_movies(db, field, value, below, k):
+    """
+        names of k random movies whose field is strictly below value (above it when below is False), fewer when the
+        catalog has fewer
+
+        - random rowid seeks are kept when they land on the right side of value, the movies ranked next to value
+          in the movie_<field> index complete the sample
+    """
+    assert field in RANKED_FIELDS, "Unknown ranked field %s" % field
+    low, high = _id_range(db, 'movie')
+    names = []
+    if low is None:
+        return names
+
+    for _ in range(k * DRAWS_PER_VALUE):
+        row = db.execute(F"SELECT name, {field} FROM movie WHERE id >= ? ORDER BY id LIMIT 1",
+                         (random.randint(low, high),)).fetchone()
+        if (row[field] < value if below else row[field] > value) and row['name'] not in names:
+            names.append(row['name'])
+            if len(names) == k:
+                return names
+
+    placeholders = ", ".join("?" * len(names))
+    rows = db.execute(
+        F"SELECT name FROM movie WHERE {field} {'<' if below else '>'} ? AND name NOT IN ({placeholders}) "
+        F"ORDER BY {field} {'DESC' if below else 'ASC'} LIMIT ?", (value, *names, k - len(names))).fetchall()
+    names += [row['name'] for row in rows]
+    random.shuffle(names)
+    return names
+
+
+def shared_detail_movie(db, key, movie_id):
+    """
+        name of a random other movie sharing one of the key values of movie_id, or None
+
+        - takes the values of movie_id in random order and seeks to a random movie id in the postings of each one
+          in the (key, value, movie_id) inverted index, wrapping around to its first posting
+    """
+    values = [row['value'] for row in db.execute("SELECT value FROM movie_detail WHERE movie_id = ? AND key = ?",
+                                                 (movie_id, key))]
+    random.shuffle(values)
+    low, high = _id_range(db, 'movie')
+    for value in values:
+        start = random.randint(low, high)
+        row = db.execute("SELECT movie_id FROM movie_detail WHERE key = ? AND value = ? AND movie_id >= ? "
+                         "AND movie_id != ? ORDER BY movie_id LIMIT 1", (key, value, start, movie_id)).fetchone() \
+            or db.execute("SELECT movie_id FROM movie_detail WHERE key = ? AND value = ? AND movie_id < ? "
+                          "AND movie_id != ? ORDER BY movie_id LIMIT 1", (key, value, start, movie_id)).fetchone()
+        if row is not None:
+            return db.execute("SELECT name FROM movie WHERE id = ?", (row['movie_id'],)).fetchone()['name']
+    return None
+
+
+def sample_unrelated_movies(db, key, movie_id, k):
+    """
+        names of up to k random movies sharing none of the key values of movie_id
+    """
+    low, high = _id_range(db, 'movie')
+    names = []
+    if low is None:
+        return names
+
+    for _ in range(k * DRAWS_PER_VALUE):
+        row = db.execute("SELECT id, name FROM movie WHERE id >= ? ORDER BY id LIMIT 1",
+                         (random.randint(low, high),)).fetchone()
+        if row['name'] in names or db.execute(
+                "SELECT 1 FROM movie_detail WHERE movie_id = ? AND key = ? AND value IN "
+                "(SELECT value FROM movie_detail WHERE movie_id = ? AND key = ?) LIMIT 1",
+                (row['id'], key, movie_id, key)).fetchone():
+            continue
+        names.append(row['name'])
+        if len(names) == k:
+            break
+    return names
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+from urllib.parse import urlsplit
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app, has_app_context
+
+from application.metrics import get_registry
+
+IMDB_URL = r'https://www.imdb.com'
+
+
+class RateLimiter:
+    """
+        spaces out the requests sent to the same host, at most `rate` requests per second per host
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache:
+    """
+        on-disk cache of response bodies keyed by the sha256 of their url
+
+        - <directory>/<key[:2]>/<key>.body holds the body and <key>.json its url, ETag, Last-Modified and fetch time
+        - entries younger than ttl seconds are served without any request, older ones are revalidated with a
+          conditional request
+        - once the bodies exceed max_bytes the least recently used entries are evicted
+    """
+
+    def __init__(self, directory, ttl=86400, max_bytes=1 << 30):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.body', base + '.json'
+
+    def load(self, url):
+        """returns (metadata, body) of the cached url, or None"""
+        body_path, meta_path = self._paths(url)
+        # under the lock, so an eviction does not remove the entry while it is read
+        with self._lock:
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(body_path, 'rb') as f:
+                    body = f.read()
+                # the body mtime doubles as the last access time for the LRU eviction
+                os.utime(body_path)
+            except (OSError, ValueError):
+                return None
+        return meta, body
+
+    def is_fresh(self, meta):
+        return time.time() - meta['fetched_at'] < self.ttl
+
+    def _write(self, path, data):
+        tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        with self._lock:
+            previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            self._write(body_path, response.content)
+            self._write_meta(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        self._grow(len(response.content) - previous)
+
+    def touch(self, url, etag=None, last_modified=None):
+        """marks the cached body as just fetched (after a 200 or a 304 revalidation)"""
+        with self._lock:
+            self._write_meta(url, etag, last_modified)
+
+    def _write_meta(self, url, etag, last_modified):
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()}
+        self._write(self._paths(url)[1], json.dumps(meta).encode('utf8'))
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.body'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _grow(self, delta):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += delta
+            if self._size <= self.max_bytes:
+                return
+            for _, size, path in sorted(self._entries()):
+                for stale in (path, path[:-len('.body')] + '.json'):
+                    if os.path.exists(stale):
+                        os.unlink(stale)
+                self._size -= size
+                if self._size <= self.max_bytes * 0.9:
+                    break
+
+
+def _cached_response(url, body):
+    response = requests.Response()
+    response._content = body
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+class Fetcher:
+    """
+        shared keep-alive http session with timeouts, retries with exponential backoff and a per host rate limit
+
+        - safe to use from several threads, the connection pool holds `concurrency` connections per host
+    """
+
+    def __init__(self, base_url=IMDB_URL, concurrency=8, rate_limit=4.0, timeout=10.0, retries=3, backoff=0.5,
+                 cache=None, offline=False):
+        """
+            cache: ResponseCache used for get requests
+            offline: serve every get request from the cache, never touching the network
+        """
+        assert cache is not None or not offline, "offline mode needs a response cache"
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.offline = offline
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'movie-quiz-scraper'
+        adapter = HTTPAdapter(
+            pool_connections=concurrency, pool_maxsize=concurrency,
+            max_retries=Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_config(cls, config, offline=False):
+        cache = None
+        if config['SCRAPE_CACHE_DIR']:
+            cache = ResponseCache(config['SCRAPE_CACHE_DIR'], ttl=config['SCRAPE_CACHE_TTL'],
+                                  max_bytes=config['SCRAPE_CACHE_MAX_BYTES'])
+        return cls(base_url=config['SCRAPE_BASE_URL'], concurrency=config['SCRAPE_CONCURRENCY'],
+                   rate_limit=config['SCRAPE_RATE_LIMIT'], timeout=config['SCRAPE_TIMEOUT'],
+                   retries=config['SCRAPE_RETRIES'], backoff=config['SCRAPE_BACKOFF'], cache=cache, offline=offline)
+
+    def _tally(self, outcome):
+        # requests are sent from the threads of map(), Counter updates are not atomic
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def _count(self, started, outcome):
+        self._tally(outcome)
+        get_registry().observe('scrape_fetch_seconds', time.perf_counter() - started, outcome=outcome)
+
+    def request(self, method, url):
+        if method not in ('get', 'post'):
+            raise Exception("Method %s not allowed." % method)
+        cached = self.cache.load(url) if self.cache is not None and method == 'get' else None
+        if self.offline:
+            if cached is None:
+                self._tally('cache_miss')
+                raise Exception("%s is not in the response cache" % url)
+            self._tally('cache_hit')
+            return _cached_response(url, cached[1])
+        if cached is not None and self.cache.is_fresh(cached[0]):
+            self._tally('cache_hit')
+            return _cached_response(url, cached[1])
+
+        headers = {}
+        if cached is not None:
+            if cached[0]['etag']:
+                headers['If-None-Match'] = cached[0]['etag']
+            if cached[0]['last_modified']:
+                headers['If-Modified-Since'] = cached[0]['last_modified']
+        self.rate_limiter.wait(urlsplit(url).netloc)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, headers=headers)
+            if response.status_code == 304 and cached is not None:
+                self._count(started, 'revalidated')
+                self.cache.touch(url, etag=response.headers.get('ETag', cached[0]['etag']),
+                                 last_modified=response.headers.get('Last-Modified', cached[0]['last_modified']))
+                return _cached_response(url, cached[1])
+            response.raise_for_status()
+        except Exception:
+            self._count(started, 'failed')
+            raise
+        self._count(started, 'fetched')
+        if self.cache is not None and method == 'get':
+            self.cache.store(url, response)
+        return response
+
+    def map(self, func, items):
+        """
+            runs func(item, fetcher) for every item on `concurrency` threads, yields (item, result) as they complete
+
+            - called in an app context, func runs in that app context, eg. to record the metrics of the app
+        """
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def run(item):
+            if app is None:
+                return func(item, self)
+            with app.app_context():
+                return func(item, self)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(run, item): item for item in items}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+
+def get_fetcher():
+    """
+        the fetcher of the current app, created from its SCRAPE_* settings on first use
+    """
+    if 'scrape_fetcher' not in current_app.extensions:
+        current_app.extensions['scrape_fetcher'] = Fetcher.from_config(current_app.config)
+    return current_app.extensions['scrape_fetcher']
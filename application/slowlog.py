@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+import click
+from collections import Counter
+from flask import current_app
+from flask.cli import with_appcontext
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_INTERNAL_FILES = (os.path.abspath(__file__).rsplit('.', 1)[0], os.path.join(_ROOT, 'application', 'metrics'))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+        the sql with its literals replaced by ? and its IN (?, ?, ...) lists collapsed, so the queries built with
+        different values or list lengths share one fingerprint
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _PLACEHOLDER_LIST.sub('(...)', sql)
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode('utf8')).hexdigest()[:12]
+
+
+def parameters_shape(parameters):
+    """
+        the types of the parameters without their values, eg. ['int', 'str'] or {'id': 'int'}
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in sorted(parameters.items())}
+    if isinstance(parameters, (list, tuple)):
+        types = [type(value).__name__ for value in parameters[:20]]
+        return types + ['... %s parameters' % len(parameters)] if len(parameters) > 20 else types
+    return type(parameters).__name__
+
+
+def call_site():
+    """
+        'path:line function' of the first frame outside the sql tracing code, eg. 'application/quiz.py:44 _draft'
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.rsplit('.', 1)[0] in _INTERNAL_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    path = frame.f_code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    return '%s:%s %s' % (path, frame.f_lineno, frame.f_code.co_name)
+
+
+def _query_plan(connection, sql, parameters):
+    """
+        EXPLAIN QUERY PLAN of the statement as indented lines, run on a plain cursor so it is not traced itself
+    """
+    try:
+        rows = sqlite3.Connection.cursor(connection, sqlite3.Cursor).execute(
+            'EXPLAIN QUERY PLAN %s' % sql, parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    depths = {0: -1}
+    plan = []
+    for row in rows:
+        depths[row[0]] = depths.get(row[1], -1) + 1
+        plan.append('%s%s' % ('  ' * depths[row[0]], row[3]))
+    return plan
+
+
+class SlowQueryLog:
+    """
+        appends the statements slower than threshold_ms to a json lines file, with their normalized sql,
+        fingerprint, parameter types, duration, call site and query plan
+
+        - the plan of a fingerprint is explained once per process, the first time it is slow
+        - the duration covers running the statement and stepping through the rows read by the caller
+    """
+
+    def __init__(self, path, threshold_ms=100):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def record(self, connection, kind, sql, parameters, site, seconds, at=None):
+        normalized = normalize_sql(sql)
+        digest = fingerprint(normalized)
+        with self._lock:
+            explained = digest in self._plans
+            plan = self._plans.get(digest)
+        if not explained:
+            plan = _query_plan(connection, sql, parameters) if kind == 'execute' else None
+            with self._lock:
+                plan = self._plans.setdefault(digest, plan)
+        entry = {
+            'at': at or time.time(),
+            'fingerprint': digest,
+            'sql': normalized,
+            'kind': kind,
+            'parameters': parameters_shape(parameters) if kind == 'execute' else None,
+            'ms': round(seconds * 1000, 3),
+            'site': site,
+            'plan': plan,
+        }
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+def read_slow_queries(path):
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def aggregate_slow_queries(entries):
+    """
+        the logged statements grouped by fingerprint, slowest total time first
+    """
+    queries = {}
+    for entry in entries:
+        query = queries.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'], 'sql': entry['sql'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'sites': Counter(), 'parameters': [], 'plan': None, 'last_at': 0,
+        })
+        query['calls'] += 1
+        query['total_ms'] += entry['ms']
+        query['max_ms'] = max(query['max_ms'], entry['ms'])
+        query['sites'][entry['site']] += 1
+        if entry['parameters'] not in query['parameters']:
+            query['parameters'].append(entry['parameters'])
+        query['plan'] = entry['plan'] or query['plan']
+        query['last_at'] = max(query['last_at'], entry['at'])
+    for query in queries.values():
+        query['mean_ms'] = query['total_ms'] / query['calls']
+        query['full_scan'] = any(line.strip().startswith('SCAN ') for line in query['plan'] or ())
+    return sorted(queries.values(), key=lambda query: query['total_ms'], reverse=True)
+
+
+@click.command("slow-queries")
+@click.option('--log', 'path', default=None, help='slow query log, defaults to SLOW_QUERY_LOG')
+@click.option('--top', default=20, help='number of queries reported')
+@click.option('--sort', type=click.Choice(['total', 'max', 'calls']), default='total')
+@with_appcontext
+def slow_queries_command(path, top, sort):
+    """
+        reports the logged slow queries grouped by fingerprint, with their call sites and query plan
+
+        $ flask slow-queries --sort max --top 10
+    """
+    path = path or current_app.config['SLOW_QUERY_LOG']
+    if not path:
+        raise click.UsageError("Pass --log or set SLOW_QUERY_LOG.")
+    if not os.path.exists(path):
+        click.echo("No slow query logged in %s." % path)
+        return
+    queries = aggregate_slow_queries(read_slow_queries(path))
+    queries.sort(key=lambda query: query['%s_ms' % sort if sort != 'calls' else 'calls'], reverse=True)
+    for rank, query in enumerate(queries[:top], 1):
+        click.echo("#%s %s  %s calls, total %.1fms, max %.1fms, mean %.1fms%s" % (
+            rank, query['fingerprint'], query['calls'], query['total_ms'], query['max_ms'], query['mean_ms'],
+            '  FULL SCAN' if query['full_scan'] else ''))
+        click.echo("    %s" % query['sql'])
+        click.echo("    at %s" % ', '.join('%s (%s)' % site for site in query['sites'].most_common(3)))
+        click.echo("    parameters %s" % ' | '.join(json.dumps(shape) for shape in query['parameters'][:3]))
+        for line in query['plan'] or ['(no plan)']:
+            click.echo("    plan: %s" % line)
+    click.echo("%s slow queries, %s distinct." % (sum(query['calls'] for query in queries), len(queries)))
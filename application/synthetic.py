@@ -0,0 +1,260 @@
+import time
+import random
+import datetime
+import contextlib
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from application.db import catalog_writer, get_db
+from application.expiry import SCORE_CHUNK
+from application.leaderboard import record_quiz_scores
+from application.questions import QUESTION_TEMPLATES
+
+GENRES = ('Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Crime', 'Adventure', 'Horror', 'Sci-Fi', 'Fantasy',
+          'Mystery', 'Animation', 'Family', 'Biography', 'History', 'War', 'Music', 'Western', 'Sport', 'Musical')
+WORDS = ('last', 'night', 'city', 'river', 'king', 'dream', 'shadow', 'storm', 'heart', 'road', 'secret', 'war',
+         'light', 'house', 'summer', 'winter', 'ghost', 'queen', 'island', 'fire', 'silent', 'golden', 'broken',
+         'lost', 'wild', 'dark', 'blue', 'long', 'hidden', 'iron', 'glass', 'stone', 'paper', 'star', 'moon', 'sea')
+FIRST_NAMES = ('James', 'Mary', 'John', 'Linda', 'Robert', 'Maria', 'David', 'Sarah', 'Michael', 'Emma', 'Daniel',
+               'Olivia', 'Paul', 'Anna', 'Mark', 'Laura', 'Kevin', 'Julia', 'Brian', 'Nina', 'Omar', 'Yuki', 'Ravi',
+               'Chen', 'Lucas', 'Sofia', 'Ivan', 'Amara', 'Diego', 'Aiko')
+LAST_NAMES = ('Smith', 'Garcia', 'Kim', 'Brown', 'Rossi', 'Novak', 'Khan', 'Silva', 'Muller', 'Sato', 'Dubois',
+              'Jensen', 'Cohen', 'Okafor', 'Singh', 'Lopez', 'Walsh', 'Berg', 'Costa', 'Ivanova', 'Park', 'Reyes')
+
+EPOCH_START = datetime.date(1920, 1, 1).toordinal()
+EPOCH_END = datetime.date(2024, 12, 31).toordinal()
+
+SYNTHETIC_PASSWORD = 'synthetic'
+QUIZ_QUESTIONS = 10
+HISTORY_DAYS = 90
+
+
+def _person(index):
+    """
+        the name of person #index of a pool of synthetic people, names repeat with a numeric suffix
+    """
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    generation = index // (len(FIRST_NAMES) * len(LAST_NAMES))
+    return '%s %s%s' % (first, last, ' %s' % generation if generation else '')
+
+
+def _long_tail(rng, pool_size):
+    """
+        index into a pool of people where low indexes are drawn much more often, so a few people appear in many
+        movies and most in one or two
+    """
+    return int(pool_size * rng.random() ** 3)
+
+
+def _movie(rng, number):
+    words = [rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3))]
+    plot = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(12, 30)))
+    return (
+        'The %s %s' % (' '.join(words), number),
+        ' is a movie about %s.' % plot,
+        datetime.date.fromordinal(rng.randint(EPOCH_START, EPOCH_END)).isoformat(),
+        round(min(9.9, max(1.0, rng.gauss(6.6, 1.1))), 1),
+    )
+
+
+def generate_catalog(db, movies, seed=0, batch_size=10000):
+    """
+        fills movie and movie_detail with `movies` synthetic movies, the same seed always generates the same rows
+
+        - every movie has 1-3 genres out of 20, 3-8 actors, 1-2 directors and 1-3 creators, people are drawn
+          from long tailed pools (a few appear in many movies, most in one)
+        - rows are written with executemany, batch_size movies per transaction
+    """
+    rng = random.Random(seed)
+    first_id = (db.execute("SELECT MAX(id) FROM movie").fetchone()[0] or 0) + 1
+    actors, directors, creators = max(movies * 3, 100), max(movies // 3, 30), max(movies // 2, 30)
+    for start in range(0, movies, batch_size):
+        movie_rows, detail_rows = [], []
+        for movie_id in range(first_id + start, first_id + min(start + batch_size, movies)):
+            movie_rows.append((movie_id, *_movie(rng, movie_id)))
+            details = {('genre', genre) for genre in rng.sample(GENRES, rng.randint(1, 3))}
+            for key, pool, low, high in (('actor', actors, 3, 8), ('director', directors, 1, 2),
+                                         ('creator', creators, 1, 3)):
+                details.update((key, _person(_long_tail(rng, pool))) for _ in range(rng.randint(low, high)))
+            detail_rows += [(movie_id, key, value) for key, value in sorted(details)]
+        db.executemany("INSERT INTO movie (id, name, description, released_date, rating) VALUES (?, ?, ?, ?, ?)",
+                       movie_rows)
+        db.executemany("INSERT INTO movie_detail (movie_id, key, value) VALUES (?, ?, ?)", detail_rows)
+        db.commit()
+    return movies
+
+
+@contextlib.contextmanager
+def bulk_writes(db):
+    """
+        pragmas for bulk loads on this connection: no fsync per commit and a large page cache, restored on exit
+
+        - a crash during the load can lose the last transactions, never corrupt the database in wal mode
+    """
+    synchronous = db.execute("PRAGMA synchronous").fetchone()[0]
+    cache_size = db.execute("PRAGMA cache_size").fetchone()[0]
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA cache_size = -262144")
+    try:
+        yield db
+    finally:
+        db.execute("PRAGMA synchronous = %d" % synchronous)
+        db.execute("PRAGMA cache_size = %d" % cache_size)
+
+
+def generate_users(db, users, seed=0, activated=0.9, batch_size=10000):
+    """
+        adds `users` synthetic users named synthetic<id>, `activated` of them activated
+
+        - they all share the password 'synthetic', hashed once
+    """
+    rng = random.Random(seed)
+    password = generate_password_hash(SYNTHETIC_PASSWORD)
+    first_id = (db.execute("SELECT MAX(id) FROM user").fetchone()[0] or 0) + 1
+    for start in range(0, users, batch_size):
+        db.executemany("INSERT INTO user (id, username, password, is_activated) VALUES (?, ?, ?, ?)",
+                       [(user_id, 'synthetic%s' % user_id, password, int(rng.random() < activated))
+                        for user_id in range(first_id + start, first_id + min(start + batch_size, users))])
+        db.commit()
+    return users
+
+
+def _movie_answers(db, movie_ids):
+    """
+        {movie id: {field: correct answer}} of every single-movie question template field, as draft_question writes them
+    """
+    placeholders = ', '.join('?' * len(movie_ids))
+    answers = {row['id']: {'name': row['name'], 'rating': str(row['rating']), 'released_date': row['released_date'],
+                           'description': row['description']}
+               for row in db.execute("SELECT * FROM movie WHERE id IN (%s)" % placeholders, movie_ids)}
+    details = {}
+    for row in db.execute("SELECT movie_id, key, value FROM movie_detail WHERE movie_id IN (%s) "
+                          "ORDER BY movie_id, key, value" % placeholders, movie_ids):
+        details.setdefault((row['movie_id'], row['key']), []).append(row['value'])
+    for (movie_id, key), values in details.items():
+        answers[movie_id][key] = ', '.join(values)
+    return answers
+
+
+def _quiz_history(rng, quiz_id, user_id, expired, movies, answers, question_id, option_id, now):
+    """
+        rows of one locked quiz: all questions answered, or for an expired one the answered questions followed by
+        the question that expired unanswered
+    """
+    created_at = now - rng.randint(current_app.config['QUIZ_TIMEOUT_SECONDS'] + 60, HISTORY_DAYS * 24 * 3600)
+    skill = rng.betavariate(2, 2)
+    shown = rng.randint(1, QUIZ_QUESTIONS) if expired else QUIZ_QUESTIONS
+    questions, options, asked = [], [], set()
+    while len(questions) < shown:
+        movie_id, template = rng.choice(movies), rng.choice(QUESTION_TEMPLATES)
+        answer = answers.get(movie_id, {}).get(template.field)
+        if answer is None or (movie_id, template.field) in asked:
+            continue
+        asked.add((movie_id, template.field))
+        choices = {answer}
+        for _ in range(20):
+            if len(choices) == 4:
+                break
+            if template.field == 'rating':
+                choices.add('%.1f' % (rng.uniform(0.5, 0.94) * 10))
+            else:
+                choices.add(answers[rng.choice(movies)].get(template.field) or answer)
+        while len(choices) < 4:
+            # a tiny catalog without enough distinct values
+            choices.add('%s (%s)' % (answer, len(choices)))
+        choices = [answer] + rng.sample(sorted(choices - {answer}), 3)
+        question_id += 1
+        question_no = len(questions) + 1
+        first_option = option_id + 1
+        options += [(option_id + i + 1, question_id, choice, int(i == 0)) for i, choice in enumerate(choices)]
+        option_id += len(choices)
+        if expired and question_no == shown:
+            user_answer = None
+        elif rng.random() < 0.05:
+            user_answer = None
+        else:
+            user_answer = str(first_option if rng.random() < skill else first_option + rng.randint(1, 3))
+        questions.append((question_id, quiz_id, movie_id, template.field, question_no,
+                          template.question_template.format(name=answers[movie_id]['name'], verb='are'),
+                          user_answer, created_at + 30 * (question_no - 1)))
+    return (quiz_id, user_id, created_at), questions, options, question_id, option_id
+
+
+def generate_quizzes(db, quizzes, seed=0, expired=0.2, now=None, batch_size=1000):
+    """
+        adds `quizzes` locked quizzes of the activated users with their questions, options, answers and
+        leaderboard scores, `expired` of them expired before their last question was answered
+
+        - a few users play most of the quizzes, each user answers correctly at their own random skill level
+        - quizzes were created during the last 90 days, all of them are over
+    """
+    rng = random.Random(seed)
+    now = int(time.time()) if now is None else now
+    user_ids = [row[0] for row in db.execute("SELECT id FROM user WHERE is_activated = 1 ORDER BY id")]
+    low, high = db.execute("SELECT MIN(id), MAX(id) FROM movie").fetchone()
+    if not user_ids or low is None:
+        raise ValueError("Synthetic quizzes need activated users and movies.")
+    quiz_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM quiz_state").fetchone()[0]
+    question_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM quiz_question").fetchone()[0]
+    option_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM question_option").fetchone()[0]
+    for start in range(0, quizzes, batch_size):
+        count = min(batch_size, quizzes - start)
+        movies = [rng.randint(low, high) for _ in range(count * 5)]
+        answers = _movie_answers(db, sorted(set(movies)))
+        movies = [movie_id for movie_id in movies if movie_id in answers]
+        states, questions, options = [], [], []
+        for _ in range(count):
+            quiz_id += 1
+            state, quiz_questions, quiz_options, question_id, option_id = _quiz_history(
+                rng, quiz_id, user_ids[_long_tail(rng, len(user_ids))], rng.random() < expired, movies, answers,
+                question_id, option_id, now)
+            states.append(state)
+            questions += quiz_questions
+            options += quiz_options
+        db.executemany("INSERT INTO quiz_state (id, user_id, locked, created_at) VALUES (?, ?, 1, ?)", states)
+        db.executemany("INSERT INTO quiz_question (id, quiz_id, movie_id, field, question_no, question, user_answer, "
+                       "locked, created_at, activated) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, 1)", questions)
+        db.executemany("INSERT INTO question_option (id, question_id, option, is_correct) VALUES (?, ?, ?, ?)",
+                       options)
+        quiz_ids = [state[0] for state in states]
+        for i in range(0, len(quiz_ids), SCORE_CHUNK):
+            record_quiz_scores(db, *quiz_ids[i: i + SCORE_CHUNK])
+        db.commit()
+    return quizzes
+
+
+@click.command("seed-synthetic")
+@click.option('--movies', default=100000, help='synthetic movies added to the catalog')
+@click.option('--users', default=10000, help='synthetic users, 90% of them activated')
+@click.option('--quizzes', default=100000, help='finished quizzes of the activated users')
+@click.option('--expired', default=0.2, help='share of the quizzes that expired before their last answer')
+@click.option('--seed', default=0, help='the same seed generates the same rows on the same database')
+@with_appcontext
+def seed_synthetic_command(movies, users, quizzes, expired, seed):
+    """
+        fills the database with a large deterministic synthetic catalog, users and quiz history for profiling
+
+        $ flask init-db
+        $ flask seed-synthetic --movies 1000000 --users 100000 --quizzes 1000000
+    """
+    db = get_db()
+
+    def generate_movies():
+        with catalog_writer() as catalog, bulk_writes(catalog):
+            generate_catalog(catalog, movies, seed=seed)
+
+    steps = (
+        ('movies', movies, generate_movies),
+        ('users', users, lambda: generate_users(db, users, seed=seed)),
+        ('quizzes', quizzes, lambda: generate_quizzes(db, quizzes, seed=seed, expired=expired)),
+    )
+    with bulk_writes(db):
+        for name, total, generate in steps:
+            if total:
+                started = time.monotonic()
+                generate()
+                click.echo("%s %s generated in %.1fs." % (total, name, time.monotonic() - started))
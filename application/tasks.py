@@ -1,22 +1,29 @@
-import re
-import json
+import time
 import click
 import logging
-import requests
 import functools
 
 from pprint import pprint
-from bs4 import BeautifulSoup
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from flask import current_app
 from flask.cli import with_appcontext
 
-from application.db import get_db
+from application.db import catalog_writer, publish_catalog
+from application.ingest import ingest_movies
+from application.parsing import (
+    benchmark_parsers,
+    canonical_movie_links,
+    parse_movie_page,
+    parse_movie_page_or_none,
+    parse_movies_list,
+    saved_pages,
+)
+from application.scraper import Fetcher, get_fetcher
 
 logger = logging.getLogger(__name__)
 logging.basicConfig()
 
-IMDB_URL = r'https://www.imdb.com'
-MOVIE_URL_REGEX = r'title/[a-z0-9]+(/|\?|/\?)?.*$'
-
 
 def exception_handler(f):
     functools.wraps(f)
@@ -31,15 +38,9 @@ def exception_handler(f):
     return wrapper
 
 
-def get_response(url, method='get'):
+def get_response(url, method='get', fetcher=None):
     try:
-        if method == 'get':
-            response = requests.get(url)
-        elif method == 'post':
-            response = requests.post(url)
-        else:
-            raise Exception("Method %s not allowed." % method)
-        response.raise_for_status()
+        response = (fetcher or get_fetcher()).request(method, url)
     except Exception as err:
         raise Exception("Error connecting %s url" % url)
     return response
@@ -47,69 +48,66 @@ def get_response(url, method='get'):
 
 @exception_handler
 def _populate_movie(movie_data):
-    db = get_db()
-    cursor = db.execute(
-        "INSERT INTO movie (name, description, rating, released_date) VALUES (?, ?, ?, ?)",
-        (movie_data['general']['name'], movie_data['general']['description'], movie_data['general']['rating'],
-         movie_data['general']['released_date'])
-    )
-    movie_id = cursor.lastrowid
-    db.executemany(
-        "INSERT INTO movie_detail (movie_id, key, value) VALUES (?, ?, ?)",
-        [(movie_id, *key_value) for key_value in movie_data['movie_detail']]
-    )
-    db.commit()
-
-
-def _scrape_movies_list(link='/'):
+    # publishing a separate catalog copies the whole file once, an unchanged movie keeps the staging copy instead
+    with catalog_writer(publish=False) as db:
+        summary = ingest_movies(db, [movie_data])
+    if summary['inserted'] or summary['updated']:
+        publish_catalog()
+    return summary
+
+
+def _scrape_movies_list(link='/', fetcher=None):
     """
         link: default to IMDB home page url
     """
-    response = get_response('%s%s' % (IMDB_URL, link))
-    soup = BeautifulSoup(response.text, features='html.parser')
-    movies = soup.find_all('a', {'href': re.compile(MOVIE_URL_REGEX)})
-    return [i.get('href') for i in movies]
+    fetcher = fetcher or get_fetcher()
+    response = get_response('%s%s' % (fetcher.base_url, link), fetcher=fetcher)
+    return canonical_movie_links(parse_movies_list(response.text))
 
 
 @exception_handler
-def _scrape_movie_data(link):
-    response = get_response(r'%s/%s' % (IMDB_URL, link))
-    soup = BeautifulSoup(response.text, features='html.parser')
-    soup = soup.find('script', {'type': 'application/ld+json'})
-    assert soup is not None, "Failed to scrap %s" % link
-    data = json.loads(soup.text)
-    if data['@type'] != 'Movie':
-        print("\nSkipping %s as it is not a movie." % link)
-        return None
-    description = re.sub(data['name'], '', data['description'], flags=re.I)
-    movie_data = {
-        'general': {
-            'name': data['name'],
-            'description': description,
-            'rating': '%.1f' % float(data['aggregateRating']['ratingValue']),
-            'released_date': data['datePublished'],
-        },
-        'movie_detail': [('genre', i) for i in data['genre']] if isinstance(data['genre'], list) else [
-            ('genre', data['genre'])
-        ]
-    }
-
-    for d in ('actor', 'director', 'creator'):
-        if isinstance(data[d], list):
-            movie_data['movie_detail'] += [(d, i['name']) for i in data[d] if i.get('name', False)]
-        else:
-            movie_data['movie_detail'].append((d, data[d]['name']))
-
-    movie_data['movie_detail'] = sorted(set(movie_data['movie_detail']), key=lambda x: x[0])
-
-    return movie_data
+def _download_movie_page(link, fetcher=None):
+    fetcher = fetcher or get_fetcher()
+    return get_response(r'%s/%s' % (fetcher.base_url, link.lstrip('/')), fetcher=fetcher).text
+
+
+@exception_handler
+def _scrape_movie_data(link, fetcher=None):
+    fetcher = fetcher or get_fetcher()
+    response = get_response(r'%s/%s' % (fetcher.base_url, link.lstrip('/')), fetcher=fetcher)
+    return parse_movie_page(response.text, link)
+
+
+def _scrape_movies(fetcher, links, parse_workers=0):
+    """
+        yields (link, movie data or None) of every link as they are scraped
+
+        - with parse_workers, the pages downloaded on the fetcher threads are parsed in a pool of that many
+          processes, otherwise each page is parsed on the thread that downloaded it
+    """
+    if not parse_workers:
+        yield from fetcher.map(_scrape_movie_data, links)
+        return
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        futures = {}
+        for link, page in fetcher.map(_download_movie_page, links):
+            if page is None:
+                yield link, None
+            else:
+                futures[pool.submit(parse_movie_page_or_none, page, link)] = link
+            # the pages parsed so far are yielded while the next ones are still downloading
+            for future in [future for future in futures if future.done()]:
+                yield futures.pop(future), future.result()
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 
 @click.command("scrape-movie")
 @click.argument("link")
 @click.option('--populate', is_flag=True)
+@click.option('--offline', is_flag=True, help='serve the page from the response cache only')
 @with_appcontext
-def scrape_movie_command(link, populate):
+def scrape_movie_command(link, populate, offline):
     """
         scrapes & displays the movie data for given movie link.
         **check example below for movie link(url) format to pass on**
@@ -122,32 +120,109 @@ def scrape_movie_command(link, populate):
         _To populate db add --populate flag_
         $ flask scrape-movie 'title/tt2398149/?ref_=ttls_li_tt' --populate
 
+        _With CATALOG_DATABASE set, a new or changed movie copies the whole catalog file once, populate many
+        movies with scrape-home-movies_
+
+        _To re-parse a page already in the response cache (SCRAPE_CACHE_DIR) without network_
+        $ flask scrape-movie 'title/tt2398149/?ref_=ttls_li_tt' --offline
+
     """
-    movie_data = _scrape_movie_data(link)
-    if populate and movie_data is not None:
-        _populate_movie(movie_data)
+    if offline and not current_app.config['SCRAPE_CACHE_DIR']:
+        raise click.UsageError("--offline needs SCRAPE_CACHE_DIR")
+    fetcher = Fetcher.from_config(current_app.config, offline=True) if offline else get_fetcher()
+    movie_data = _scrape_movie_data(link, fetcher)
     pprint(movie_data)
+    if populate and movie_data is not None:
+        summary = _populate_movie(movie_data)
+        if summary is not None:
+            print("\n%s inserted, %s updated, %s unchanged" % (
+                summary['inserted'], summary['updated'], summary['unchanged']))
 
 
 @click.command("scrape-home-movies")
 @click.option('--link', default=None, help='IMDB link to crawl and scrape movies list from')
 @click.option('--populate', is_flag=True)
+@click.option('--concurrency', default=None, type=int, help='parallel downloads, defaults to SCRAPE_CONCURRENCY')
+@click.option('--rate-limit', default=None, type=float,
+              help='requests per second per host, defaults to SCRAPE_RATE_LIMIT')
+@click.option('--offline', is_flag=True, help='serve every page from the response cache only')
+@click.option('--batch-size', default=None, type=int,
+              help='movies written per transaction, defaults to INGEST_BATCH_SIZE')
+@click.option('--parse-workers', default=None, type=int,
+              help='processes parsing the downloaded pages, defaults to SCRAPE_PARSE_WORKERS')
 @with_appcontext
-def scrape_home_movies_command(link, populate):
+def scrape_home_movies_command(link, populate, concurrency, rate_limit, offline, batch_size, parse_workers):
     """
         crawl movie links and scrape those movies data
 
         _To populate db with some popular movies_
         $ flask scrape-home-movies --link '/search/title/?groups=top_250&sort=user_rating' --populate
+
+        _To replay a previous crawl from the response cache (SCRAPE_CACHE_DIR) without network_
+        $ flask scrape-home-movies --link '/search/title/?groups=top_250&sort=user_rating' --offline
     """
+    if offline and not current_app.config['SCRAPE_CACHE_DIR']:
+        raise click.UsageError("--offline needs SCRAPE_CACHE_DIR")
+    config = dict(current_app.config)
+    if concurrency is not None:
+        config['SCRAPE_CONCURRENCY'] = concurrency
+    if rate_limit is not None:
+        config['SCRAPE_RATE_LIMIT'] = rate_limit
+    fetcher = Fetcher.from_config(config, offline=offline)
+
+    started = time.monotonic()
     if link is None:
         print('\nScraping home page')
-        links = _scrape_movies_list()
+        links = _scrape_movies_list(fetcher=fetcher)
+    else:
+        links = _scrape_movies_list(link, fetcher=fetcher)
+
+    summary = Counter()
+
+    def scraped_movies():
+        workers = current_app.config['SCRAPE_PARSE_WORKERS'] if parse_workers is None else parse_workers
+        for _, movie_data in _scrape_movies(fetcher, links, workers):
+            print("\nScrapped %s" % _)
+            if movie_data is None:
+                summary['skipped'] += 1
+                continue
+            summary['scraped'] += 1
+            yield movie_data
+
+    if populate:
+        with catalog_writer() as db:
+            summary.update(ingest_movies(db, scraped_movies(),
+                                         batch_size=batch_size or current_app.config['INGEST_BATCH_SIZE']))
     else:
-        links = _scrape_movies_list(link)
-    for _ in links:
-        print("\nScrapping %s" % _)
-        movie_data = _scrape_movie_data(_)
-        if populate and movie_data is not None:
-            _populate_movie(movie_data)
-            pprint(movie_data)
+        for _ in scraped_movies():
+            pass
+    populated = summary['inserted'] + summary['updated'] + summary['unchanged']
+
+    print("\n%s links in %.1fs: %s scraped, %s populated (%s inserted, %s updated, %s unchanged), "
+          "%s skipped or failed, %s http errors, %s from cache" % (
+              len(links), time.monotonic() - started, summary['scraped'], populated, summary['inserted'],
+              summary['updated'], summary['unchanged'], summary['skipped'] + summary['failed'],
+              fetcher.stats['failed'], fetcher.stats['cache_hit'] + fetcher.stats['revalidated']))
+
+
+@click.command("benchmark-parser")
+@click.option('--pages', 'directory', default=None,
+              help='directory of saved pages (.body, .html), defaults to the SCRAPE_CACHE_DIR response cache')
+@click.option('--repeat', default=3, help='runs of each parser, the best one is reported')
+@with_appcontext
+def benchmark_parser_command(directory, repeat):
+    """
+        compares the fast ld+json / link scan with the full html parse on saved pages
+
+        $ flask benchmark-parser --pages application/storage/http-cache
+    """
+    directory = directory or current_app.config['SCRAPE_CACHE_DIR']
+    if not directory:
+        raise click.UsageError("Pass --pages or set SCRAPE_CACHE_DIR.")
+    pages = [page for _, page in saved_pages(directory)]
+    if not pages:
+        raise click.UsageError("No saved pages found in %s." % directory)
+    result = benchmark_parsers(pages, repeat=repeat)
+    click.echo("%s pages: fast %.1f pages/s, full %.1f pages/s, %.1fx faster, %s mismatches" % (
+        result['pages'], result['pages'] / result['fast_seconds'], result['pages'] / result['full_seconds'],
+        result['full_seconds'] / result['fast_seconds'], result['mismatches']))
@@ -1,9 +1,15 @@
 import os
+import json
 import pytest
+import hashlib
 import tempfile
+import threading
+
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 from application import create_app
-from application.db import get_db, init_db
+from application.db import get_db, get_pool, init_db
 
 with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
     _data_sql = f.read().decode('utf8')
@@ -18,7 +24,6 @@ def app():
         'DATABASE': db_path,
         'SECRET_KEY': 'test1234',
         'ACTIVATION_FILE': 'test_activation_code.txt',
-        'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
         'QUESTION_TIMEOUT_SECONDS': 900,
         'QUIZ_TIMEOUT_SECONDS': 3600,
         'PAGE_SIZE': 5
@@ -33,8 +38,11 @@ def app():
 
     yield app
 
+    get_pool(app).close()
     os.close(db_fd)
-    os.unlink(db_path)
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
     if os.path.exists(activation_file_path):
         os.unlink(activation_file_path)
 
@@ -97,3 +105,73 @@ def auth(client):
 @pytest.fixture
 def quiz(client):
     return QuizActions(client)
+
+
+def movie_page(title_id, name, rating='8.5', actors=('Actor One', 'Actor Two')):
+    data = {
+        '@type': 'Movie',
+        'url': '/title/%s/' % title_id,
+        'name': name,
+        'description': '%s is a movie about %s.' % (name, title_id),
+        'aggregateRating': {'ratingValue': rating},
+        'datePublished': '2001-01-01',
+        'genre': ['Drama', 'Crime'],
+        'actor': [{'name': actor} for actor in actors],
+        'director': {'name': 'Director %s' % title_id},
+        'creator': [{'name': 'Writer %s' % title_id}, {'url': '/company/co1/'}],
+    }
+    return ('<html><head><title>%s</title><script type="application/ld+json">%s</script></head>'
+            '<body><h1>%s</h1></body></html>' % (name, json.dumps(data), name))
+
+
+class StubIMDB:
+    """
+        local http server standing in for imdb, serves `pages` by path and fails the first hit of `fail_once`
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.hits = Counter()
+        self.fail_once = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits[self.path] += 1
+                if self.path in stub.fail_once and stub.hits[self.path] == 1:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                page = stub.pages.get(self.path)
+                if page is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = page.encode('utf8')
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = 'http://127.0.0.1:%s' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def imdb(app):
+    stub = StubIMDB()
+    app.config.update(SCRAPE_BASE_URL=stub.base_url, SCRAPE_BACKOFF=0, SCRAPE_RATE_LIMIT=0)
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
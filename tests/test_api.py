@@ -0,0 +1,78 @@
+from application import get_db
+
+
+def _correct_option(app, question):
+    with app.app_context():
+        return get_db().execute("SELECT id FROM question_option WHERE question_id = ? AND is_correct = 1",
+                                (question['id'],)).fetchone()['id']
+
+
+def test_api_login_required(client):
+    response = client.post('/quiz/api/create')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'login required'}
+
+
+def test_api_quiz_flow(client, auth, app):
+    auth.login()
+    response = client.post('/quiz/api/create')
+    assert response.status_code == 201
+    quiz = response.get_json()['quiz']
+    assert quiz['question']['number'] == 1 and len(quiz['question']['options']) == 4
+
+    response = client.post('/quiz/api/create')
+    assert response.status_code == 200 and response.get_json()['resumed']
+    assert client.get('/quiz/api/1/question').get_json()['quiz']['question'] == quiz['question']
+
+    results = []
+    for number in range(1, 11):
+        question = quiz['question']
+        assert question['number'] == number
+        answer = _correct_option(app, question) if number % 2 else None
+        body = client.post('/quiz/api/1/answer', json={'question': question['id'], 'answer': answer}).get_json()
+        results.append(body['result'])
+        quiz = body['quiz']
+
+    assert results == ['correct', 'skipped'] * 5
+    assert quiz['complete'] and quiz['score'] == 5
+
+    response = client.get('/quiz/api/1/score')
+    assert response.get_json()['quiz']['score'] == 5
+    assert [row['result'] for row in response.get_json()['questions']] == results
+    assert client.post('/quiz/api/1/answer', json={}).status_code == 409
+
+
+def test_api_answer_rejects_invalid_answers(client, auth, app):
+    auth.login()
+    question = client.post('/quiz/api/create').get_json()['quiz']['question']
+    with app.app_context():
+        # an option of another question scores nothing on this one
+        other = get_db().execute("SELECT MAX(id) + 1 FROM question_option").fetchone()[0]
+
+    for answer in ([1], {'id': 1}, True, 1.5, other, 'x'):
+        response = client.post('/quiz/api/1/answer', json={'question': question['id'], 'answer': answer})
+        assert response.status_code == 400 and 'error' in response.get_json()
+
+    # the question is still open
+    answer = _correct_option(app, question)
+    body = client.post('/quiz/api/1/answer', json={'question': question['id'], 'answer': str(answer)}).get_json()
+    assert body['result'] == 'correct'
+
+
+def test_api_answer_stale_and_expired_questions(client, auth, app):
+    auth.login()
+    question = client.post('/quiz/api/create').get_json()['quiz']['question']
+
+    response = client.post('/quiz/api/1/answer', json={'question': question['id'] + 100, 'answer': None})
+    assert response.status_code == 409
+    assert response.get_json()['quiz']['question']['id'] == question['id']
+
+    with app.app_context():
+        get_db().execute("UPDATE quiz_question SET created_at = 0")
+        get_db().commit()
+    body = client.post('/quiz/api/1/answer', json={'question': question['id'], 'answer': None}).get_json()
+    assert body['result'] == 'expired'
+    assert body['quiz']['question']['number'] == 2
+
+    assert client.get('/quiz/api/2/question').status_code == 404
+    assert client.get('/quiz/api/1/score').status_code == 404
@@ -0,0 +1,35 @@
+import json
+
+from application.benchmark import compare_results
+
+
+def test_benchmark_command(runner, tmp_path):
+    output, baseline = tmp_path / 'current.json', tmp_path / 'baseline.json'
+    args = ['benchmark', '--sizes', '50', '--iterations', '12', '--workdir', str(tmp_path)]
+    result = runner.invoke(args=args + ['--output', str(output)])
+    assert result.exit_code == 0, result.output
+    assert 'Catalog of 50 movies ready' in result.output
+
+    current = json.loads(output.read_text())
+    assert set(current['results']['50']) == {'rating_options', 'general_field_options', 'movie_detail_options',
+                                             '_generate_random_question', 'home', 'question_get', 'question_post'}
+    assert all(summary['runs'] == 12 for summary in current['results']['50'].values())
+
+    # the catalog is reused and compared with a baseline that is much faster
+    for summary in current['results']['50'].values():
+        summary['median_ms'] /= 100
+    baseline.write_text(json.dumps(current))
+    result = runner.invoke(args=args + ['--baseline', str(baseline)])
+    assert result.exit_code == 1
+    assert 'Catalog of 50 movies ready' in result.output
+    assert 'timings regressed by more than 20%' in result.output
+
+
+def test_compare_results():
+    baseline = {'results': {'1000': {'home': {'median_ms': 2.0}, 'question_get': {'median_ms': 1.0}}}}
+    current = {'results': {
+        '1000': {'home': {'median_ms': 2.3}, 'question_get': {'median_ms': 1.3}, 'question_post': {'median_ms': 9.0}},
+        '100000': {'home': {'median_ms': 50.0}},
+    }}
+    assert compare_results(current, baseline, threshold=0.2) == [('1000', 'question_get', 1.0, 1.3)]
+    assert compare_results(current, baseline, threshold=0.5) == []
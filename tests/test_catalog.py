@@ -0,0 +1,129 @@
+import os
+
+from application import get_db
+from application.catalog import build_snapshot, load_snapshot, get_catalog, CatalogSnapshot, SqliteCatalog
+from application.questions import QUESTION_TEMPLATES, draft_question, draft_random_question, template_for_field
+
+
+def _build(app, tmp_path):
+    path = str(tmp_path / 'catalog.snapshot')
+    with app.app_context():
+        assert build_snapshot(get_db(), path) == 25
+    return path
+
+
+def test_snapshot_matches_database(app, tmp_path):
+    snapshot = CatalogSnapshot(_build(app, tmp_path))
+
+    with app.app_context():
+        db = get_db()
+        sqlite_catalog = SqliteCatalog(db)
+        for index, movie in enumerate(db.execute("SELECT * FROM movie ORDER BY id")):
+            assert snapshot.movie_at(index) == dict(movie)
+            for key in ('actor', 'genre', 'director', 'creator'):
+                assert snapshot.movie_details(movie['id'], key) == sqlite_catalog.movie_details(movie['id'], key)
+
+    assert snapshot.movie_details(1000, 'actor') == []
+
+
+def test_snapshot_sampling(app, tmp_path):
+    snapshot = CatalogSnapshot(_build(app, tmp_path))
+
+    values = snapshot.sample_detail_values('genre', ('Drama', 'Crime'), 5)
+    assert len(values) == len(set(values)) == 5
+    assert not {'Drama', 'Crime'} & set(values)
+
+    values = snapshot.sample_movie_values('released_date', '1994-09-23', 3)
+    assert len(set(values)) == 3 and '1994-09-23' not in values
+    assert {snapshot.random_movie()['id'] for _ in range(100)} <= set(range(1, 26))
+
+
+def test_snapshot_cross_movie_sampling(app, tmp_path):
+    snapshot = CatalogSnapshot(_build(app, tmp_path))
+
+    with app.app_context():
+        db = get_db()
+        for movie in db.execute("SELECT * FROM movie ORDER BY id").fetchall():
+            for field in ('rating', 'released_date'):
+                below = {row[0] for row in db.execute(
+                    "SELECT name FROM movie WHERE %s < ?" % field, (movie[field],))}
+                assert set(snapshot.sample_ranked_movies(field, movie, True, 30)) == below
+                above = {row[0] for row in db.execute(
+                    "SELECT name FROM movie WHERE %s > ?" % field, (movie[field],))}
+                assert set(snapshot.sample_ranked_movies(field, movie, False, 30)) == above
+
+            for key in ('actor', 'director'):
+                sharing = {row[0] for row in db.execute(
+                    "SELECT DISTINCT name FROM movie INNER JOIN movie_detail ON movie.id = movie_detail.movie_id "
+                    "WHERE key = ? AND value IN (SELECT value FROM movie_detail WHERE movie_id = ? AND key = ?)",
+                    (key, movie['id'], key))} - {movie['name']}
+                shared = snapshot.shared_detail_movie(key, movie['id'])
+                assert shared in sharing if sharing else shared is None
+                unrelated = snapshot.sample_unrelated_movies(key, movie['id'], 3)
+                assert not set(unrelated) & (sharing | {movie['name']})
+
+
+def test_cross_movie_questions(app, tmp_path):
+    snapshot = CatalogSnapshot(_build(app, tmp_path))
+
+    with app.app_context():
+        for catalog in (SqliteCatalog(get_db()), snapshot):
+            for template in QUESTION_TEMPLATES:
+                if template.table != 'movies':
+                    continue
+                draft = draft_random_question(catalog, template)
+                assert draft.field == template.field
+                assert len(set(draft.options)) == 3 and draft.answer not in draft.options
+
+        # the lowest rated movie is never the answer of the highest rating question
+        lowest = get_db().execute("SELECT * FROM movie ORDER BY rating, id LIMIT 1").fetchone()
+        assert draft_question(snapshot, dict(lowest), template_for_field('highest_rating')) is None
+
+
+def test_snapshot_reload(app, tmp_path):
+    path = _build(app, tmp_path)
+    snapshot = load_snapshot(path, check_interval=0)
+    assert load_snapshot(path, check_interval=0) is snapshot
+
+    with app.app_context():
+        get_db().execute("DELETE FROM movie WHERE id > 20")
+        build_snapshot(get_db(), path)
+
+    reloaded = load_snapshot(path, check_interval=0)
+    assert reloaded is not snapshot and len(reloaded) == 20
+    assert len(snapshot) == 25
+
+    os.unlink(path)
+    assert load_snapshot(path, check_interval=0) is None
+
+
+def test_quiz_question_from_snapshot(client, auth, app, tmp_path, runner):
+    path = str(tmp_path / 'catalog.snapshot')
+    result = runner.invoke(args=['build-catalog-snapshot', '--output', path])
+    assert 'Catalog snapshot with 25 movies' in result.output
+    app.config['CATALOG_SNAPSHOT'] = path
+
+    with app.test_request_context('/'):
+        assert isinstance(get_catalog(), CatalogSnapshot)
+
+    auth.check_login_required()
+    client.get('/quiz/create')
+    response = client.get('/quiz/1/question')
+    assert b'Question #1' in response.data
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM question_option WHERE question_id = 1").fetchone()[0] == 4
+
+
+def test_shared_detail_movie_is_random(app, tmp_path):
+    snapshot = CatalogSnapshot(_build(app, tmp_path))
+
+    with app.app_context():
+        db = get_db()
+        movies = db.execute("SELECT movie.id, movie.name FROM movie INNER JOIN movie_detail "
+                            "ON movie.id = movie_detail.movie_id WHERE key = 'director' AND value = ? ORDER BY movie.id",
+                            ('Christopher Nolan',)).fetchall()
+        assert len(movies) == 3
+        for catalog in (SqliteCatalog(db), snapshot):
+            # any of the other movies of the director, not the first postings of the index
+            draws = {catalog.shared_detail_movie('director', movies[-1]['id']) for _ in range(100)}
+            assert draws == {movie['name'] for movie in movies[:-1]}
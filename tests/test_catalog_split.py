@@ -0,0 +1,132 @@
+import os
+import sqlite3
+
+import pytest
+
+from application import get_db
+from application.db import catalog_writer, get_pool, init_db, publish_catalog, schema_version, upgrade_db
+from application.ingest import ingest_movies
+from tests.test_ingest import _movie_data
+from tests.test_refresh import _ask, _seed_titles
+
+
+@pytest.fixture
+def split_app(app, runner, tmp_path):
+    app.config['CATALOG_DATABASE'] = str(tmp_path / 'catalog.sqlite')
+    result = runner.invoke(args=['split-catalog'])
+    assert 'Moved the catalog of 25 movies' in result.output
+    return app
+
+
+def _tables(path):
+    connection = sqlite3.connect(path)
+    try:
+        return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        connection.close()
+
+
+def test_split_catalog(split_app, runner):
+    tables = _tables(split_app.config['DATABASE'])
+    assert 'quiz_question' in tables and 'movie' not in tables and 'movie_source' not in tables
+    assert {'movie', 'movie_detail', 'movie_source', 'crawl_frontier', 'refresh_state'} <= _tables(
+        split_app.config['CATALOG_DATABASE'])
+
+    with split_app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 25
+        assert schema_version(db, 'catalog') == schema_version(db) == upgrade_db()
+        # the catalog is read-only for the app
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute("DELETE FROM movie")
+
+    assert 'already in' in runner.invoke(args=['split-catalog']).output
+
+
+def test_split_catalog_quiz(split_app, client, auth):
+    auth.login()
+    response = client.get('/quiz/create')
+    assert response.headers['Location'] == 'http://localhost/quiz/1/question'
+    assert b'Question #1' in client.get('/quiz/1/question').data
+
+
+def test_catalog_writer_swaps_catalog(split_app):
+    path = split_app.config['CATALOG_DATABASE']
+    with split_app.app_context():
+        db = get_db()
+        with catalog_writer() as catalog:
+            ingest_movies(catalog, [_movie_data('tt0000001', 'Staged Movie')])
+            # readers keep the live catalog until the staging one replaces it
+            assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 25
+        assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 26
+        assert not os.path.exists(path + '.staging')
+
+    with split_app.app_context():
+        assert get_db().execute("SELECT id FROM movie WHERE name = 'Staged Movie'").fetchone() is not None
+
+
+def test_catalog_writer_keeps_failed_staging(split_app):
+    path = split_app.config['CATALOG_DATABASE']
+    with split_app.app_context():
+        with pytest.raises(RuntimeError):
+            with catalog_writer() as catalog:
+                ingest_movies(catalog, [_movie_data('tt0000001', 'Staged Movie')])
+                raise RuntimeError
+        assert get_db().execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 25
+        assert os.path.exists(path + '.staging')
+
+        # the next writer resumes from the committed batches of the failed one
+        with catalog_writer() as catalog:
+            ingest_movies(catalog, [_movie_data('tt0000002', 'Other Movie')])
+        assert get_db().execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 27
+
+
+def test_catalog_writer_unpublished_staging(split_app):
+    path = split_app.config['CATALOG_DATABASE']
+    with split_app.app_context():
+        db = get_db()
+        with catalog_writer(publish=False) as catalog:
+            ingest_movies(catalog, [_movie_data('tt0000001', 'Staged Movie')])
+        staging = os.stat(path + '.staging')
+        # the next writer reuses the staging copy rather than copying the catalog again
+        with catalog_writer(publish=False) as catalog:
+            ingest_movies(catalog, [_movie_data('tt0000002', 'Other Movie')])
+        assert os.stat(path + '.staging').st_ino == staging.st_ino
+        assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 25
+
+        publish_catalog()
+        assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 27
+        assert not os.path.exists(path + '.staging')
+        publish_catalog()
+
+
+def test_attach_catalog_failure_is_logged(app, tmp_path, caplog):
+    path = tmp_path / 'catalog.sqlite'
+    path.write_bytes(b'not a database' * 100)
+    app.config['CATALOG_DATABASE'] = str(path)
+    with app.app_context():
+        with pytest.raises(sqlite3.DatabaseError):
+            get_db()
+    assert 'Attaching the catalog %s failed' % path in caplog.text
+    get_pool(app).close()
+
+
+def test_refresh_catalog_command_split(imdb, split_app, runner):
+    split_app.config.update(REFRESH_BATCH_SIZE=5, REFRESH_MIN_AGE=60)
+    with split_app.app_context():
+        with catalog_writer() as catalog:
+            _seed_titles(catalog, imdb, 2)
+        _ask(get_db(), 'tt0000001', 3)
+
+    result = runner.invoke(args=['refresh-catalog'])
+    assert 'Refreshed 2 titles: 0 updated, 2 unchanged, 0 failed' in result.output
+    with split_app.app_context():
+        # the asked questions are counted from the quiz database attached to the staging catalog
+        assert get_db().execute("SELECT asked_count FROM movie_source WHERE imdb_id = 'tt0000001'").fetchone()[0] == 3
+
+
+def test_init_db_split(split_app):
+    with split_app.app_context():
+        init_db()
+        assert 'movie' not in _tables(split_app.config['DATABASE'])
+        assert get_db().execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 0
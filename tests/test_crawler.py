@@ -0,0 +1,106 @@
+import sqlite3
+
+from application import get_db
+from application.crawler import crawl, PENDING, CRAWLED, FAILED
+from application.scraper import Fetcher
+from tests.conftest import movie_page
+
+
+def _linked_movie_page(number, *linked):
+    links = ''.join('<a href="/title/tt%07d/?ref_=tt_sims_%s">More</a>' % (other, i) for i, other in enumerate(linked))
+    return movie_page('tt%07d' % number, 'Movie %s' % number).replace('</body>', links + '</body>')
+
+
+def _movie_graph(imdb):
+    """
+        /list -> 1, 2 ; 1 -> 2, 3 ; 2 -> 1, 4 ; 3 -> 5 ; 4 -> 5
+    """
+    imdb.pages['/list'] = ('<html><body><a href="/title/tt0000001/?ref_=list">1</a>'
+                           '<a href="/title/tt0000002/?ref_=list">2</a><a href="/title/tt0000001/">1</a></body></html>')
+    for number, linked in ((1, (2, 3)), (2, (1, 4)), (3, (5,)), (4, (5,)), (5, ())):
+        imdb.pages['/title/tt%07d/' % number] = _linked_movie_page(number, *linked)
+
+
+def _frontier(db):
+    return {row['url']: (row['depth'], row['status']) for row in db.execute("SELECT * FROM crawl_frontier")}
+
+
+def test_crawl_is_breadth_first_and_bounded_by_depth(imdb, app):
+    _movie_graph(imdb)
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0)
+    with app.app_context():
+        db = get_db()
+        summary = crawl(db, fetcher, ['/list'], max_depth=2)
+        assert summary['crawled'] == 5
+        assert summary['inserted'] == 4
+        assert summary['pending'] == 0
+        assert _frontier(db) == {
+            '/list': (0, CRAWLED), 'title/tt0000001/': (1, CRAWLED), 'title/tt0000002/': (1, CRAWLED),
+            'title/tt0000003/': (2, CRAWLED), 'title/tt0000004/': (2, CRAWLED),
+        }
+    assert imdb.hits['/title/tt0000001/'] == 1
+
+
+class _ConcurrentWriter(Fetcher):
+    """
+        writes to the database from another connection while the pages of a batch are still being handed out
+    """
+
+    def __init__(self, database, **kwargs):
+        super().__init__(**kwargs)
+        self.database = database
+        self.writes = 0
+
+    def map(self, func, items):
+        for i, result in enumerate(super().map(func, items)):
+            if i:
+                connection = sqlite3.connect(self.database, timeout=0)
+                try:
+                    connection.execute("INSERT INTO user (username, password) VALUES (?, 'x')",
+                                       ('writer %s' % self.writes,))
+                    connection.commit()
+                finally:
+                    connection.close()
+                self.writes += 1
+            yield result
+
+
+def test_crawl_does_not_lock_the_database_while_downloading(imdb, app):
+    _movie_graph(imdb)
+    fetcher = _ConcurrentWriter(app.config['DATABASE'], base_url=imdb.base_url, rate_limit=0, backoff=0)
+    with app.app_context():
+        summary = crawl(get_db(), fetcher, ['/list'], max_depth=2)
+    assert summary['crawled'] == 5 and summary['discovered'] == 4
+    assert fetcher.writes == 2
+
+
+def test_crawl_resumes_from_the_frontier(imdb, app):
+    _movie_graph(imdb)
+    imdb.fail_once.add('/title/tt0000004/')
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0, retries=0)
+    with app.app_context():
+        db = get_db()
+        summary = crawl(db, fetcher, ['/list'], max_depth=3, max_pages=2, batch_size=1)
+        assert (summary['crawled'], summary['pending']) == (2, 2)
+
+        summary = crawl(db, fetcher, max_depth=3)
+        assert (summary['crawled'], summary['failed'], summary['pending']) == (3, 1, 0)
+        assert _frontier(db)['title/tt0000004/'] == (2, FAILED)
+        assert 'title/tt0000005/' in _frontier(db)
+        assert db.execute("SELECT COUNT(*) FROM movie WHERE name LIKE 'Movie %'").fetchone()[0] == 4
+
+
+def test_crawl_command(imdb, app, runner):
+    _movie_graph(imdb)
+    result = runner.invoke(args=['crawl', '--link', '/list', '--depth', '1'])
+    assert '3 pages crawled' in result.output
+    assert '2 movies inserted' in result.output
+
+    result = runner.invoke(args=['crawl', '--depth', '2'])
+    assert '0 pages crawled' in result.output
+
+    result = runner.invoke(args=['crawl', '--link', '/list', '--depth', '2', '--restart'])
+    assert '5 pages crawled' in result.output
+    assert '2 movies inserted, 0 updated, 2 unchanged' in result.output
+    with app.app_context():
+        assert all(status != PENDING for _, status in _frontier(get_db()).values())
@@ -0,0 +1,185 @@
+import gc
+import re
+import threading
+
+import pytest
+
+from application import get_db
+from application.catalog import SqliteCatalog
+from application.db import get_pool, schema_version, upgrade_db
+from application.expiry import sweep_expired
+from application.ingest import ingest_movies
+from application.leaderboard import backfill_leaderboard
+from application.question_bank import refill_question_bank
+from application.questions import QUESTION_TEMPLATES, draft_random_question
+from application.slowlog import normalize_sql
+from tests.conftest import _data_sql
+from tests.test_ingest import _movie_data
+
+# full scans run at most once per ttl, see total_scored_quizzes
+CACHED_SCANS = ('SELECT COUNT(*) AS total FROM quiz_score',)
+ANSWER_REGEX = re.compile(r'name="answer"[^>]*?\svalue="(\d+)"')
+
+
+def _take_html_quiz(client):
+    quiz_url = client.get('/quiz/create').headers['Location']
+    response = client.get(quiz_url)
+    while response.status_code == 200:
+        options = ANSWER_REGEX.findall(response.get_data(as_text=True))
+        response = client.post(quiz_url, data={'answer': options[0]} if options else {})
+        if response.status_code == 302 and '/question' in response.headers['Location']:
+            response = client.get(response.headers['Location'])
+    client.get(response.headers['Location'])
+
+
+def _take_api_quiz(client):
+    quiz = client.post('/quiz/api/create').get_json()['quiz']
+    while not quiz.get('complete'):
+        question = quiz['question']
+        quiz = client.post('/quiz/api/%s/answer' % quiz['id'], json={
+            'question': question['id'], 'answer': question['options'][0]['id']}).get_json()['quiz']
+    client.get('/quiz/api/%s/score' % quiz['id'])
+
+
+@pytest.fixture
+def hot_statements(app, client, auth):
+    """
+        every distinct SELECT, UPDATE and DELETE the app runs while serving quizzes, as traced by sqlite with
+        their bound values
+    """
+    statements = {}
+
+    def trace(sql):
+        if sql.lstrip().split(' ', 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            statements.setdefault(normalize_sql(sql), sql)
+
+    with app.app_context():
+        get_db().set_trace_callback(trace)
+    try:
+        auth.login()
+        client.get('/')
+        _take_html_quiz(client)
+        _take_api_quiz(client)
+        app.config['QUESTION_BANK_ENABLED'] = True
+        with app.app_context():
+            refill_question_bank(get_db(), low_water=1, high_water=2)
+        _take_html_quiz(client)
+        client.get('/?page=2')
+        with app.test_request_context('/'):
+            db = get_db()
+            for template in QUESTION_TEMPLATES:
+                draft_random_question(SqliteCatalog(db), template)
+            ingest_movies(db, [_movie_data('tt0000001', 'Hot Movie')])
+            sweep_expired(db)
+            db.commit()
+    finally:
+        with app.app_context():
+            get_db().set_trace_callback(None)
+    return list(statements.values())
+
+
+def test_hot_statements_use_indexes(app, hot_statements):
+    assert len(hot_statements) > 20
+    with app.app_context():
+        db = get_db()
+        for sql in hot_statements:
+            if normalize_sql(sql) in CACHED_SCANS:
+                continue
+            plan = [row['detail'] for row in db.execute("EXPLAIN QUERY PLAN " + sql)]
+            for detail in plan:
+                # a select of subqueries only scans its single constant row
+                assert not detail.startswith('SCAN') or ' USING ' in detail or detail == 'SCAN CONSTANT ROW', (
+                    sql, plan)
+
+
+def test_db_upgrade_keeps_data(app, runner):
+    with app.app_context():
+        db = get_db()
+        tables = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        for row in tables.fetchall():
+            db.execute('DROP TABLE "%s"' % row['name'])
+        db.execute("PRAGMA user_version = 0")
+        with app.open_resource("schema.sql") as f:
+            db.executescript(f.read().decode("utf8"))
+        db.executescript(_data_sql)
+        db.execute("INSERT INTO quiz_state (user_id, created_at) VALUES (1, '2020-01-01 00:00:00')")
+        db.execute("INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at) "
+                   "VALUES (1, 1, 'name', 1, 'q', '2020-01-01 00:00:30')")
+        # a locked quiz answered with the correct option of another question scores nothing
+        db.execute("INSERT INTO quiz_state (user_id, created_at, locked) VALUES (1, '2020-01-01 00:00:00', 1)")
+        db.execute("INSERT INTO question_option (id, question_id, option, is_correct) VALUES (7, 99, 'x', 1)")
+        db.execute("INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at, "
+                   "user_answer, locked) VALUES (2, 1, 'name', 1, 'q', '2020-01-01 00:00:30', 7, 1)")
+        db.commit()
+
+    result = runner.invoke(args=['db-upgrade'])
+    assert 'Database schema is at version' in result.output
+
+    with app.app_context():
+        db = get_db()
+        assert schema_version(db) == 9
+        assert upgrade_db() == 9
+        assert db.execute("SELECT COUNT(*) FROM movie").fetchone()[0] == 25
+        assert db.execute("SELECT 1 FROM sqlite_master WHERE name = 'quiz_question_open'").fetchone()
+        local_epoch = db.execute("SELECT CAST(strftime('%s', '2020-01-01 00:00:00', 'utc') AS INTEGER)").fetchone()[0]
+        assert db.execute("SELECT created_at FROM quiz_state").fetchone()[0] == local_epoch
+        assert tuple(db.execute("SELECT created_at, activated FROM quiz_question").fetchone()) == (local_epoch + 30, 1)
+        # the migration backfill scores like backfill_leaderboard
+        assert db.execute("SELECT score FROM quiz_score WHERE quiz_id = 2").fetchone()[0] == 0
+        backfill_leaderboard(db)
+        assert db.execute("SELECT score FROM quiz_score WHERE quiz_id = 2").fetchone()[0] == 0
+
+
+def test_connection_pragmas(app):
+    with app.app_context():
+        db = get_db()
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert db.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert db.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        assert db.execute("PRAGMA temp_store").fetchone()[0] == 2
+
+
+def test_connection_reused_across_requests(app, monkeypatch):
+    pool = get_pool(app)
+    with app.app_context():
+        first = get_db()
+        first.execute("INSERT INTO user (username, password) VALUES ('uncommitted', 'x')")
+    with app.app_context():
+        assert get_db() is first
+        assert get_db().execute("SELECT * FROM user WHERE username = 'uncommitted'").fetchone() is None
+
+    assert pool.stats()['reused'] >= 1
+
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    with app.app_context():
+        assert get_db() is not first
+
+
+def test_connection_closed_when_thread_exits(app):
+    pool = get_pool(app)
+    open_connections = pool.stats()['open']
+
+    def request():
+        with app.app_context():
+            get_db().execute("SELECT 1")
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+    assert pool.stats()['open'] == open_connections
+    assert pool.stats()['closed'] >= 4
+
+
+def test_connection_pool_disabled(app):
+    app.config['SQLITE_POOL'] = False
+    pool = get_pool(app)
+    open_connections = pool.stats()['open']
+    with app.app_context():
+        db = get_db()
+        assert pool.stats()['open'] == open_connections + 1
+    assert pool.stats()['open'] == open_connections
+    with app.app_context():
+        assert get_db() is not db
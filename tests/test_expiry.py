@@ -0,0 +1,45 @@
+from application import get_db
+from application.expiry import epoch_now, sweep_expired
+
+
+def _start_quiz(client, auth, username='test'):
+    auth.login(username)
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+
+
+def test_sweep_expired_locks_quizzes_and_records_scores(client, auth, app):
+    _start_quiz(client, auth)
+    with app.app_context():
+        db = get_db()
+        assert sweep_expired(db) == (0, 0)
+
+        now = epoch_now() + app.config['QUIZ_TIMEOUT_SECONDS']
+        assert sweep_expired(db, now=now) == (1, 1)
+        assert db.execute("SELECT locked FROM quiz_state WHERE id = 1").fetchone()[0] == 1
+        assert db.execute("SELECT score FROM quiz_score WHERE quiz_id = 1").fetchone()[0] == 0
+        assert sweep_expired(db, now=now) == (0, 0)
+
+    response = client.get('/quiz/1/question', follow_redirects=True)
+    assert b'Quiz complete.' in response.data
+
+
+def test_swept_question_moves_quiz_to_next_question(client, auth, app):
+    _start_quiz(client, auth)
+    with app.app_context():
+        db = get_db()
+        assert sweep_expired(db, now=epoch_now() + app.config['QUESTION_TIMEOUT_SECONDS']) == (0, 1)
+
+    response = client.post('/quiz/1/question', data={'answer': '1'}, follow_redirects=True)
+    assert b'Question #1 expired' in response.data
+    assert b'Question #2' in response.data
+
+
+def test_sweep_expired_command(client, auth, app, runner):
+    _start_quiz(client, auth)
+    with app.app_context():
+        get_db().execute("UPDATE quiz_state SET created_at = 0")
+        get_db().commit()
+
+    result = runner.invoke(args=['sweep-expired'])
+    assert 'Locked 1 quizzes and 0 questions.' in result.output
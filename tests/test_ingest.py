@@ -0,0 +1,70 @@
+from collections import Counter
+
+from application import get_db
+from application.ingest import ingest_movies, title_id
+
+
+def _movie_data(imdb_id, name, rating='8.5', actors=('Actor One', 'Actor Two')):
+    return {
+        'general': {'imdb_id': imdb_id, 'name': name, 'description': 'about %s' % name, 'rating': rating,
+                    'released_date': '2001-01-01'},
+        'movie_detail': [('genre', 'Drama')] + [('actor', actor) for actor in actors],
+    }
+
+
+def _details(db, name):
+    return sorted(tuple(row) for row in db.execute(
+        "SELECT key, value FROM movie_detail INNER JOIN movie ON movie.id = movie_detail.movie_id WHERE name = ?",
+        (name,)))
+
+
+def test_title_id():
+    assert title_id('title/tt2398149/?ref_=ttls_li_tt') == 'tt2398149'
+    assert title_id('/name/nm1/') is None
+    assert title_id(None) is None
+
+
+def test_ingest_is_idempotent(app):
+    movies = [_movie_data('tt%07d' % i, 'Movie %s' % i) for i in range(5)]
+    with app.app_context():
+        db = get_db()
+        assert ingest_movies(db, movies + movies[:2], batch_size=2) == Counter(inserted=5, duplicate=2)
+        assert ingest_movies(db, movies, batch_size=2) == Counter(unchanged=5)
+        assert db.execute("SELECT COUNT(*) FROM movie WHERE name LIKE 'Movie %'").fetchone()[0] == 5
+        assert db.execute("SELECT COUNT(*) FROM movie_source").fetchone()[0] == 5
+
+
+def test_ingest_updates_changed_movies(app):
+    with app.app_context():
+        db = get_db()
+        ingest_movies(db, [_movie_data('tt0000001', 'Movie 1'), _movie_data('tt0000002', 'Movie 2')])
+        detail_ids = [row[0] for row in db.execute(
+            "SELECT movie_detail.id FROM movie_detail INNER JOIN movie ON movie.id = movie_id WHERE name = 'Movie 1'")]
+
+        summary = ingest_movies(db, [_movie_data('tt0000001', 'Movie 1', rating='9.1'),
+                                     _movie_data('tt0000002', 'Movie 2', actors=('Actor Three',))])
+        assert summary == Counter(updated=2)
+        assert db.execute("SELECT rating FROM movie WHERE name = 'Movie 1'").fetchone()[0] == 9.1
+        assert [row[0] for row in db.execute(
+            "SELECT movie_detail.id FROM movie_detail INNER JOIN movie ON movie.id = movie_id "
+            "WHERE name = 'Movie 1'")] == detail_ids
+        assert _details(db, 'Movie 2') == [('actor', 'Actor Three'), ('genre', 'Drama')]
+
+
+def test_ingest_adopts_movies_stored_without_imdb_id(app):
+    with app.app_context():
+        db = get_db()
+        movie_data = _movie_data('tt0111161', 'The Shawshank Redemption', rating='9.3', actors=('Tim Robbins',))
+        assert ingest_movies(db, [movie_data]) == Counter(updated=1)
+        assert db.execute("SELECT COUNT(*) FROM movie WHERE name = 'The Shawshank Redemption'").fetchone()[0] == 1
+        assert db.execute("SELECT movie_id FROM movie_source WHERE imdb_id = 'tt0111161'").fetchone()[0] == 1
+        assert _details(db, 'The Shawshank Redemption') == [('actor', 'Tim Robbins'), ('genre', 'Drama')]
+
+
+def test_ingest_skips_conflicting_movies(app):
+    with app.app_context():
+        db = get_db()
+        summary = ingest_movies(db, [_movie_data('tt0000001', 'Movie 1'), _movie_data('tt0000002', 'Movie 1'),
+                                     {'general': {'name': 'No id'}, 'movie_detail': []}])
+        assert summary == Counter(inserted=1, failed=2)
+        assert _details(db, 'Movie 1') == [('actor', 'Actor One'), ('actor', 'Actor Two'), ('genre', 'Drama')]
@@ -0,0 +1,108 @@
+from application import get_db
+from application.leaderboard import leaderboard_page
+
+
+def _complete_quiz(client, app, correct=True):
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+    for question_no in range(1, 11):
+        with app.app_context():
+            answer = get_db().execute(
+                "SELECT question_option.id FROM quiz_question "
+                "INNER JOIN question_option ON quiz_question.id = question_option.question_id "
+                "WHERE quiz_question.quiz_id = 1 AND quiz_question.question_no = ? AND is_correct = ?",
+                (question_no, 1 if correct else 0)).fetchone()['id']
+        client.post('/quiz/1/question', data={'answer': answer})
+
+
+def test_quiz_complete_records_score(client, auth, app):
+    auth.check_login_required()
+    _complete_quiz(client, app)
+
+    with app.app_context():
+        quiz_score = get_db().execute("SELECT * FROM quiz_score WHERE quiz_id = 1").fetchone()
+        assert quiz_score['score'] == 10
+        assert quiz_score['user_id'] == 1
+
+    response = client.get('/')
+    assert b'<td>10</td>' in response.data
+
+
+def test_expired_quiz_records_score(client, auth, app):
+    auth.check_login_required()
+    client.get('/quiz/create')
+
+    with app.app_context():
+        get_db().execute("UPDATE quiz_state SET created_at = 946684800 WHERE id = 1")
+        get_db().commit()
+
+    client.get('/quiz/1/question')
+    with app.app_context():
+        assert get_db().execute("SELECT score FROM quiz_score WHERE quiz_id = 1").fetchone()['score'] == 0
+
+
+def test_backfill_leaderboard(client, auth, app, runner):
+    auth.check_login_required()
+    _complete_quiz(client, app, correct=False)
+
+    with app.app_context():
+        get_db().execute("DELETE FROM quiz_score")
+        get_db().commit()
+
+    result = runner.invoke(args=['backfill-leaderboard'])
+    assert 'Leaderboard rebuilt with 1 quizzes.' in result.output
+
+    with app.app_context():
+        assert get_db().execute("SELECT score FROM quiz_score WHERE quiz_id = 1").fetchone()['score'] == 0
+
+
+def _seed_scores(app, total=23):
+    with app.app_context():
+        db = get_db()
+        db.executemany("INSERT INTO quiz_score (quiz_id, user_id, score) VALUES (?, 1, ?)",
+                       [(i, i % 4) for i in range(1, total + 1)])
+        db.commit()
+        return [(row['score'], row['quiz_id']) for row in db.execute(
+            "SELECT score, quiz_id FROM quiz_score ORDER BY score DESC, quiz_id")]
+
+
+def test_leaderboard_cursor_pages(app):
+    expected = _seed_scores(app)
+
+    with app.test_request_context('/'):
+        db = get_db()
+        seen, cursor, page = [], None, 1
+        while True:
+            result = leaderboard_page(db, 5, cursor=cursor, window=2)
+            assert result['page'] == page
+            seen += [(row['score'], row['quiz_id']) for row in result['rows']]
+            pages = dict(result['pages'])
+            if page + 1 not in pages:
+                break
+            cursor, page = pages[page + 1], page + 1
+
+        assert seen == expected
+        assert [no for no, _ in result['pages']] == [3, 4, 5]
+
+        deep = leaderboard_page(db, 5, cursor=dict(result['pages'])[3])
+        assert [(row['score'], row['quiz_id']) for row in deep['rows']] == expected[10:15]
+
+
+def test_leaderboard_page_number_fallback(app):
+    expected = _seed_scores(app)
+
+    with app.test_request_context('/'):
+        result = leaderboard_page(get_db(), 5, page=4, cursor='tampered-token')
+        assert result['page'] == 4
+        assert [(row['score'], row['quiz_id']) for row in result['rows']] == expected[15:20]
+
+
+def test_home_windowed_pagination(client, auth, app):
+    _seed_scores(app, total=60)
+    auth.check_login_required()
+
+    response = client.get('/?page=6')
+    assert b'Page 6 of 12' in response.data
+    assert b'>1</a>' not in response.data
+    assert b'>4</a>' in response.data and b'>8</a>' in response.data
+    assert b'>9</a>' not in response.data
@@ -0,0 +1,50 @@
+import os
+import json
+import logging
+import sqlite3
+
+from application.loadtest import LoadStats, run_load
+
+
+def test_run_load(app):
+    report = run_load(app, 3, quizzes=2)
+
+    assert report['quizzes'] == 6
+    endpoints = report['endpoints']
+    assert [endpoints[name]['requests'] for name in ('register', 'login', 'create_quiz', 'score')] == [3, 3, 6, 6]
+    assert endpoints['question_post']['requests'] == 60
+    assert sum(endpoint['errors'] for endpoint in endpoints.values()) == 0
+    assert report['requests'] == sum(endpoint['requests'] for endpoint in endpoints.values())
+    assert 0 < endpoints['question_post']['p50_ms'] <= endpoints['question_post']['p99_ms']
+
+
+def test_load_stats_count_locked_errors():
+    stats = LoadStats(timeout=1.0)
+    logger = logging.getLogger('test_loadtest')
+    logger.addHandler(stats)
+    try:
+        stats._endpoint.name = 'question_post'
+        try:
+            raise sqlite3.OperationalError('database is locked')
+        except sqlite3.Error as err:
+            logger.exception(err)
+        try:
+            raise ValueError('database is locked')
+        except ValueError as err:
+            logger.exception(err)
+    finally:
+        logger.removeHandler(stats)
+    assert stats.report(1.0)['locked'] == stats.locked['question_post'] == 1
+
+
+def test_load_test_command(app, runner, tmp_path):
+    output = tmp_path / 'load.json'
+    activation_file = os.path.join(app.root_path, 'storage', app.config['ACTIVATION_FILE'])
+    if os.path.exists(activation_file):
+        os.remove(activation_file)
+    result = runner.invoke(args=['load-test', '--users', '2', '--busy-timeout', '100', '--output', str(output)])
+    assert result.exit_code == 0, result.output
+    assert "2 quizzes" in result.output
+    assert json.loads(output.read_text())['endpoints']['score']['requests'] == 2
+    # the activation codes of the virtual users are kept out of the configured activation file
+    assert not os.path.exists(activation_file)
@@ -0,0 +1,122 @@
+import re
+import sqlite3
+
+import pytest
+
+from application import create_app, get_db
+from application.db import get_pool
+from application.metrics import MetricsRegistry, get_registry, timed
+from application.question_bank import claim_question, refill_question_bank
+from application.questions import QUESTION_TEMPLATES
+from application.scraper import Fetcher
+
+
+@pytest.fixture
+def metrics_app(app):
+    metrics_app = create_app(dict(app.config, METRICS_ENABLED=True, METRICS_TOKEN='secret'))
+    yield metrics_app
+    get_pool(metrics_app).close()
+
+
+def _sample(text, name):
+    match = re.search(r'^%s (\S+)$' % re.escape(name), text, re.M)
+    assert match is not None, "%s not in\n%s" % (name, text)
+    return float(match.group(1))
+
+
+def test_registry_render():
+    metrics = MetricsRegistry()
+    metrics.inc('requests_total', endpoint='home')
+    metrics.observe('latency_seconds', 0.003, buckets=(0.001, 0.01), endpoint='home')
+    assert metrics.render() == ''
+
+    metrics.enabled = True
+    metrics.inc('requests_total', endpoint='home')
+    metrics.inc('requests_total', 2, endpoint='home')
+    metrics.observe('latency_seconds', 0.003, buckets=(0.001, 0.01), endpoint='home')
+    metrics.observe('latency_seconds', 0.5, buckets=(0.001, 0.01), endpoint='home')
+    assert metrics.render(gauges=[('cache_size', {'cache': 'q"uiz'}, 4)]).splitlines() == [
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="home"} 3',
+        '# TYPE cache_size gauge',
+        'cache_size{cache="q\\"uiz"} 4',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{endpoint="home",le="0.001"} 0',
+        'latency_seconds_bucket{endpoint="home",le="0.01"} 1',
+        'latency_seconds_bucket{endpoint="home",le="+Inf"} 2',
+        'latency_seconds_sum{endpoint="home"} 0.503',
+        'latency_seconds_count{endpoint="home"} 2',
+    ]
+
+
+def test_metrics_disabled(app, client):
+    assert client.get('/metrics').status_code == 404
+    with app.app_context():
+        assert type(get_db()) is sqlite3.Connection
+
+    calls = []
+    assert timed('disabled_seconds')(lambda: calls.append(1) or 'done')() == 'done'
+    assert calls == [1] and 'disabled_seconds' not in get_registry().render()
+    with app.app_context():
+        timed('disabled_seconds')(lambda: None)()
+        assert not get_registry().enabled and get_registry().render() == ''
+
+
+def test_metrics_endpoint(metrics_app):
+    client = metrics_app.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    assert client.get('/').status_code == 200
+    quiz_url = client.get('/quiz/create').headers['Location']
+    assert client.get(quiz_url).status_code == 200
+
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert _sample(text, 'http_request_duration_seconds_count{endpoint="home",method="GET"}') == 1
+    assert _sample(text, 'http_requests_total{endpoint="auth.login",method="POST",status="302"}') == 1
+    # the home page reads the user and a page of the leaderboard at least
+    assert _sample(text, 'sql_statements_per_request_sum{endpoint="home"}') >= 2
+    assert _sample(text, 'sql_seconds_per_request_sum{endpoint="quiz.question"}') > 0
+    assert _sample(text, 'question_generation_seconds_count{mode="question"}') == 1
+    assert _sample(text, 'cache_hits{cache="user"}') >= 1
+    assert _sample(text, 'sqlite_pool_connections{state="opened"}') >= 1
+    assert _sample(text, 'question_bank_depth{field="rating"}') == 0
+
+
+def test_question_bank_metrics(metrics_app):
+    with metrics_app.app_context():
+        db = get_db()
+        assert claim_question(db, 1) is None
+        refill_question_bank(db, 1, 2)
+        assert claim_question(db, 1) is not None
+        db.commit()
+
+    text = metrics_app.test_client().get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+    assert _sample(text, 'question_bank_claims_total{result="missed"}') == 1
+    assert _sample(text, 'question_bank_claims_total{result="claimed"}') == 1
+    assert sum(_sample(text, 'question_bank_depth{field="%s"}' % template.field)
+               for template in QUESTION_TEMPLATES) == 2 * len(QUESTION_TEMPLATES) - 1
+
+
+def test_metrics_registry_per_app(metrics_app, app, imdb):
+    imdb.pages['/title/tt0000001/'] = 'page'
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0)
+    with metrics_app.app_context():
+        # fetched on the threads of map, in the app context of the caller
+        assert [page.text for _, page in fetcher.map(lambda link, fetcher: fetcher.request('get', link),
+                                                     [imdb.base_url + '/title/tt0000001/'])] == ['page']
+        assert 'scrape_fetch_seconds_count{outcome="fetched"} 1' in get_registry().render()
+
+    # an app created later with metrics disabled does not turn off the registry of the first one
+    assert not create_app(dict(app.config)).extensions['metrics'].enabled
+    assert metrics_app.extensions['metrics'].enabled
+    assert app.extensions['metrics'].render() == ''
+
+
+def test_metrics_need_a_token(app):
+    metrics_app = create_app(dict(app.config, METRICS_ENABLED=True))
+    assert metrics_app.test_client().get('/metrics').status_code == 404
+    get_pool(metrics_app).close()
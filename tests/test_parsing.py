@@ -0,0 +1,52 @@
+import json
+
+from application.parsing import (
+    benchmark_parsers,
+    ld_json_fast,
+    ld_json_full,
+    movie_links_fast,
+    movie_links_full,
+    parse_movie_page,
+    parse_movies_list,
+)
+from tests.conftest import movie_page
+
+LIST_PAGE = (
+    '<html><body><a class="x" href="/title/tt0000001/?ref_=list&amp;pos=1">One</a>'
+    "<A HREF='/title/tt0000002/'>Two</A><a href=\"/name/nm1/\">Someone</a>"
+    '<a data-href="/title/tt9/" href="/chart/top/">Top</a></body></html>'
+)
+
+
+def test_fast_and_full_movie_parse_agree():
+    page = movie_page('tt0000001', 'Movie 1', rating='7.25')
+    assert ld_json_fast(page) == ld_json_full(page)
+    assert parse_movie_page(page, 'title/tt0000001/') == parse_movie_page(page, 'title/tt0000001/', fast=False)
+
+
+def test_fast_movie_parse_falls_back_to_full_parse():
+    page = movie_page('tt0000001', 'Movie 1').replace('type="application/ld+json"', 'type=application/ld+json')
+    assert ld_json_fast(page) is None
+    assert parse_movie_page(page, 'title/tt0000001/')['general']['name'] == 'Movie 1'
+
+    broken = '<script type="application/ld+json">{"@type": </script>' + movie_page('tt1', 'Movie 1')
+    assert ld_json_fast(broken) is None
+
+
+def test_fast_and_full_links_agree():
+    assert movie_links_fast(LIST_PAGE) == movie_links_full(LIST_PAGE) == [
+        '/title/tt0000001/?ref_=list&pos=1', '/title/tt0000002/'
+    ]
+    assert parse_movies_list('<html><body><a href=/title/tt0000003/>Three</a></body></html>') == [
+        '/title/tt0000003/'
+    ]
+
+
+def test_benchmark_parsers():
+    pages = [movie_page('tt%07d' % i, 'Movie %s' % i) for i in range(3)] + [LIST_PAGE]
+    pages.append('<script type="application/ld+json">%s</script>' % json.dumps({'@type': 'Person'}))
+
+    result = benchmark_parsers(pages, repeat=1)
+    assert result['pages'] == 5
+    assert result['mismatches'] == 0
+    assert result['fast_seconds'] < result['full_seconds']
@@ -0,0 +1,58 @@
+from application import get_db
+from application.questions import QUESTION_TEMPLATES, QuestionDraft
+from application.question_bank import claim_question, store_questions, question_bank_depths, refill_question_bank
+
+
+def test_refill_question_bank(app, runner):
+    with app.app_context():
+        added = refill_question_bank(get_db(), low_water=2, high_water=4)
+        assert set(added.values()) == {4}
+        assert set(question_bank_depths(get_db()).values()) == {4}
+        assert refill_question_bank(get_db(), low_water=2, high_water=4) == {}
+
+    result = runner.invoke(args=['question-bank-stats'])
+    assert 'actor' in result.output and '(below' in result.output
+
+
+def test_claim_question_respects_quiz_rules(app):
+    with app.app_context():
+        db = get_db()
+        store_questions(db, [QuestionDraft(1, 'rating', 'What is the rating of the movie X ?', '9.3', ['1.0'])])
+        db.execute("INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at) "
+                   "VALUES (1, 1, 'rating', 1, 'q', 946684800)")
+        assert claim_question(db, quiz_id=1) is None
+
+        draft = claim_question(db, quiz_id=2)
+        assert draft.options == ['1.0'] and draft.movie_id == 1
+        assert question_bank_depths(db)['rating'] == 0
+
+
+def test_claim_question_is_random(app):
+    with app.app_context():
+        db = get_db()
+        store_questions(db, [QuestionDraft(movie_id, 'rating', 'What is the rating of movie %s ?' % movie_id, '9.3',
+                                           ['1.0']) for movie_id in range(1, 21)])
+        db.commit()
+        # the first claim of every quiz, rolled back so the bank keeps its 20 questions
+        first_claims = set()
+        for quiz_id in range(100, 130):
+            first_claims.add(claim_question(db, quiz_id).movie_id)
+            db.rollback()
+        assert len(first_claims) > 5
+
+
+def test_quiz_question_claimed_from_bank(client, auth, app):
+    app.config['QUESTION_BANK_ENABLED'] = True
+    with app.app_context():
+        refill_question_bank(get_db(), low_water=1, high_water=2)
+
+    auth.check_login_required()
+    client.get('/quiz/create')
+    assert b'Question #1' in client.get('/quiz/1/question').data
+
+    with app.app_context():
+        db = get_db()
+        assert sum(question_bank_depths(db).values()) == 2 * len(QUESTION_TEMPLATES) - 1
+        question = db.execute("SELECT * FROM quiz_question WHERE quiz_id = 1").fetchone()
+        assert db.execute("SELECT COUNT(*) FROM question_option WHERE question_id = ?",
+                          (question['id'],)).fetchone()[0] == 4
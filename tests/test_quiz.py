@@ -1,4 +1,5 @@
 from application import get_db
+from application.cache import get_cache
 
 
 def test_home(client, auth):
@@ -58,3 +59,135 @@ def test_quiz_question_incorrect_answer(client, auth, app):
             get_db().execute("SELECT id FROM question_option WHERE question_id = 1 AND is_correct = 0").fetchone()['id']
     response = client.post('/quiz/1/question', data={'answer': cor_ans_id})
     assert b'Wrong answer' in response.data
+
+
+def test_quiz_question_answer_not_an_option(client, auth, app):
+    auth.check_login_required()
+
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+    with app.app_context():
+        other_id = get_db().execute("SELECT id FROM question_option WHERE question_id != 1").fetchone()
+    response = client.post('/quiz/1/question', data={'answer': other_id['id'] if other_id else 10 ** 6})
+    assert response.headers['Location'] == 'http://localhost/quiz/1/question'
+    response = client.get('/quiz/1/question')
+    assert b'Not an option of question #1' in response.data and b'Question #1' in response.data
+
+
+def test_quiz_eager_generation(client, auth, app):
+    app.config['QUIZ_EAGER_GENERATION'] = True
+    auth.check_login_required()
+
+    client.get('/quiz/create')
+    with app.app_context():
+        db = get_db()
+        questions = db.execute("SELECT * FROM quiz_question WHERE quiz_id = 1 ORDER BY question_no").fetchall()
+        assert [i['question_no'] for i in questions] == list(range(1, 11))
+        assert not any(i['activated'] for i in questions)
+        assert len({(i['movie_id'], i['field']) for i in questions}) == 10
+        movie_ids = [i['movie_id'] for i in questions]
+        assert max(movie_ids.count(i) for i in movie_ids) <= 3
+        assert db.execute("SELECT COUNT(*) FROM question_option WHERE is_correct = 1").fetchone()[0] == 10
+
+    assert b'Question #1' in client.get('/quiz/1/question').data
+    response = client.post('/quiz/1/question', data={})
+    assert b'Question #2' in response.data
+
+    with app.app_context():
+        activated = get_db().execute("SELECT question_no FROM quiz_question WHERE activated = 1").fetchall()
+        assert [i['question_no'] for i in activated] == [1, 2]
+
+
+def test_quiz_question_expired_on_answer(client, auth, app):
+    auth.check_login_required()
+
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+    with app.app_context():
+        get_db().execute("UPDATE quiz_question SET created_at = 946684800")
+        get_db().commit()
+
+    response = client.post('/quiz/1/question', data={}, follow_redirects=True)
+    assert b'Question expired.' in response.data
+    assert b'Question #2' in response.data
+
+
+def test_quiz_question_refresh_is_cached(client, auth, app):
+    auth.check_login_required()
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+
+    statements = []
+    with app.app_context():
+        connection = get_db()
+    connection.set_trace_callback(statements.append)
+    response = client.get('/quiz/1/question')
+    connection.set_trace_callback(None)
+
+    assert b'Question #1' in response.data
+    assert len([i for i in statements if i.lstrip().upper().startswith('SELECT')]) == 1
+    with app.app_context():
+        assert get_cache('quiz').stats()['hits'] == 1
+        assert get_cache('user').stats()['hits'] >= 1
+
+    client.post('/quiz/1/question', data={})
+    assert b'Question #2' in client.get('/quiz/1/question').data
+
+
+def test_quiz_question_cache_validated(client, auth, app):
+    auth.check_login_required()
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+
+    with app.app_context():
+        get_db().execute("UPDATE quiz_question SET locked = 1")
+        get_db().commit()
+
+    response = client.get('/quiz/1/question')
+    assert b'Question #1' in response.data
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM quiz_question").fetchone()[0] == 2
+
+
+def test_quiz_question_not_modified(client, auth, app):
+    auth.check_login_required()
+    client.get('/quiz/create')
+    # the first view generates the question and is not tagged
+    assert 'ETag' not in client.get('/quiz/1/question').headers
+
+    response = client.get('/quiz/1/question')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert client.get('/quiz/1/question', headers={'If-None-Match': etag}).status_code == 304
+    last_modified = response.headers['Last-Modified']
+    assert client.get('/quiz/1/question', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    response = client.post('/quiz/1/question', data={})
+    response = client.get('/quiz/1/question', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Question #2' in response.data
+
+
+def test_quiz_score_not_modified(client, auth, app):
+    auth.check_login_required()
+    client.get('/quiz/create')
+    client.get('/quiz/1/question')
+    with app.app_context():
+        get_db().execute("UPDATE quiz_state SET created_at = 0")
+        get_db().commit()
+        get_cache('quiz').clear()
+    client.get('/quiz/1/question')
+
+    response = client.get('/quiz/1/score')
+    assert b'Quiz expired.' in response.data and 'ETag' not in response.headers
+
+    statements = []
+    with app.app_context():
+        connection = get_db()
+    connection.set_trace_callback(statements.append)
+    response = client.get('/quiz/1/score')
+    etag = response.headers['ETag']
+    assert b'Score: <span class="text-primary">0</span>' in response.data
+    assert client.get('/quiz/1/score', headers={'If-None-Match': etag}).status_code == 304
+    connection.set_trace_callback(None)
+    assert not [i for i in statements if 'question_option' in i]
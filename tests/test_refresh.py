@@ -0,0 +1,69 @@
+from application import get_db
+from application.ingest import ingest_movies
+from application.refresh import count_asked_questions, refresh_catalog, stale_titles
+from application.scraper import Fetcher
+from tests.conftest import movie_page
+
+
+def _seed_titles(db, imdb, total):
+    movies = []
+    for i in range(total):
+        imdb.pages['/title/tt%07d/' % i] = movie_page('tt%07d' % i, 'Movie %s' % i)
+        movies.append({
+            'general': {'imdb_id': 'tt%07d' % i, 'name': 'Movie %s' % i, 'rating': '8.5',
+                        'description': ' is a movie about tt%07d.' % i, 'released_date': '2001-01-01'},
+            'movie_detail': [('genre', 'Drama'), ('genre', 'Crime'), ('actor', 'Actor One'), ('actor', 'Actor Two'),
+                             ('director', 'Director tt%07d' % i), ('creator', 'Writer tt%07d' % i)],
+        })
+    ingest_movies(db, movies)
+    db.executemany("UPDATE movie_source SET scraped_at = ? WHERE imdb_id = ?",
+                   [(1000 + i, 'tt%07d' % i) for i in range(total)])
+    db.commit()
+
+
+def _ask(db, imdb_id, times):
+    movie_id = db.execute("SELECT movie_id FROM movie_source WHERE imdb_id = ?", (imdb_id,)).fetchone()[0]
+    for i in range(times):
+        db.execute("INSERT INTO quiz_question (quiz_id, movie_id, field, question_no, question, created_at) "
+                   "VALUES (?, ?, ?, 1, 'q', 1577836800)", (1000 + i, movie_id, 'name'))
+    db.commit()
+
+
+def test_stale_titles_are_weighted_by_asked_count(imdb, app):
+    with app.app_context():
+        db = get_db()
+        _seed_titles(db, imdb, 4)
+        _ask(db, 'tt0000003', 2)
+        assert count_asked_questions(db) == 2
+        assert count_asked_questions(db) == 0
+
+        assert stale_titles(db, 2, min_age=0, now=2000) == ['tt0000003', 'tt0000000']
+        assert stale_titles(db, 10, min_age=1000, now=2000) == ['tt0000000']
+
+
+def test_refresh_catalog_only_writes_changed_titles(imdb, app):
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0, retries=0)
+    with app.app_context():
+        db = get_db()
+        _seed_titles(db, imdb, 3)
+        imdb.pages['/title/tt0000001/'] = movie_page('tt0000001', 'Movie 1', rating='9.4')
+        del imdb.pages['/title/tt0000002/']
+
+        summary = refresh_catalog(db, fetcher, batch_size=2, min_age=3600)
+        assert (summary['updated'], summary['unchanged'], summary['failed']) == (1, 1, 0)
+        assert db.execute("SELECT rating FROM movie WHERE name = 'Movie 1'").fetchone()[0] == 9.4
+
+        summary = refresh_catalog(db, fetcher, batch_size=2, min_age=3600)
+        assert summary['failed'] == 1
+        assert refresh_catalog(db, fetcher, batch_size=2, min_age=3600) == {}
+        assert all(row[0] > 2000 for row in db.execute("SELECT scraped_at FROM movie_source"))
+
+
+def test_refresh_catalog_command(imdb, app, runner):
+    with app.app_context():
+        _seed_titles(get_db(), imdb, 2)
+    app.config.update(REFRESH_BATCH_SIZE=5, REFRESH_MIN_AGE=60)
+
+    result = runner.invoke(args=['refresh-catalog'])
+    assert 'Refreshed 2 titles: 0 updated, 2 unchanged, 0 failed' in result.output
+    assert runner.invoke(args=['refresh-catalog']).output == ''
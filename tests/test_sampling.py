@@ -0,0 +1,95 @@
+import random
+
+from application import get_db
+from application.questions import randomly_group_items
+from application.sampling import (
+    random_movie,
+    sample_movie_values,
+    sample_detail_values,
+    sample_ranked_movies,
+    shared_detail_movie,
+    sample_unrelated_movies,
+)
+
+
+def test_random_movie(app):
+    with app.app_context():
+        ids = {random_movie(get_db())['id'] for _ in range(200)}
+        assert len(ids) > 10
+        assert ids <= set(range(1, 26))
+
+
+def test_random_movie_empty_catalog(app):
+    with app.app_context():
+        get_db().execute("DELETE FROM movie")
+        assert random_movie(get_db()) is None
+
+
+def test_sample_movie_values(app):
+    with app.app_context():
+        values = sample_movie_values(get_db(), 'released_date', '1994-09-23', 3)
+        assert len(values) == len(set(values)) == 3
+        assert '1994-09-23' not in values
+
+
+def test_sample_movie_values_small_catalog(app):
+    with app.app_context():
+        get_db().execute("UPDATE movie SET rating = 8.0 WHERE id > 3")
+        values = sample_movie_values(get_db(), 'rating', 9.3, 3)
+        assert sorted(values) == [8.0, 9.0, 9.2]
+
+
+def test_sample_detail_values(app):
+    with app.app_context():
+        excludes = ('Drama', 'Crime')
+        values = sample_detail_values(get_db(), 'genre', excludes, 5)
+        assert len(values) == len(set(values)) == 5
+        assert not set(values) & set(excludes)
+
+
+def test_sample_ranked_movies(app):
+    with app.app_context():
+        db = get_db()
+        below = sample_ranked_movies(db, 'rating', 8.8, True, 3)
+        assert len(set(below)) == 3
+        assert all(db.execute("SELECT rating FROM movie WHERE name = ?", (name,)).fetchone()[0] < 8.8
+                   for name in below)
+        # only 2 movies are rated above 9.0, the index completes the sample exactly
+        assert sorted(sample_ranked_movies(db, 'rating', 9.0, False, 5)) == ['The Godfather',
+                                                                            'The Shawshank Redemption']
+        assert sample_ranked_movies(db, 'released_date', '0000-00-00', True, 3) == []
+
+
+def _movies_with(db, key, value):
+    return {row[0] for row in db.execute("SELECT name FROM movie INNER JOIN movie_detail "
+                                         "ON movie.id = movie_detail.movie_id WHERE key = ? AND value = ?",
+                                         (key, value))}
+
+
+def test_shared_detail_movies(app):
+    with app.app_context():
+        db = get_db()
+        movie = db.execute("SELECT movie_id, value FROM movie_detail WHERE key = 'director' GROUP BY value "
+                           "HAVING COUNT(*) > 1 ORDER BY value LIMIT 1").fetchone()
+        sharing = _movies_with(db, 'director', movie['value'])
+        name = db.execute("SELECT name FROM movie WHERE id = ?", (movie['movie_id'],)).fetchone()[0]
+        assert {shared_detail_movie(db, 'director', movie['movie_id']) for _ in range(20)} <= sharing - {name}
+
+        unrelated = sample_unrelated_movies(db, 'director', movie['movie_id'], 3)
+        assert len(set(unrelated)) == 3 and not set(unrelated) & sharing
+
+        alone = db.execute("SELECT id FROM movie WHERE NOT EXISTS (SELECT 1 FROM movie_detail AS own "
+                           "INNER JOIN movie_detail AS other ON own.key = other.key AND own.value = other.value "
+                           "WHERE own.movie_id = movie.id AND own.key = 'director' AND other.movie_id != movie.id) "
+                           "ORDER BY id LIMIT 1").fetchone()[0]
+        assert shared_detail_movie(db, 'director', alone) is None
+
+
+def test_randomly_group_items_is_random():
+    items = list(range(20))
+    first_items = {randomly_group_items(items, ())[0][0] for _ in range(50)}
+    assert len(first_items) > 1
+    random.seed(1)
+    groups = randomly_group_items(items, ())
+    assert len(groups) == 3
+    assert len({i for group in groups for i in group}) == sum(len(group) for group in groups)
@@ -0,0 +1,177 @@
+import os
+import time
+
+from application import get_db
+from application.ingest import title_id
+from application.scraper import Fetcher, RateLimiter, ResponseCache
+from application.tasks import _scrape_movies, _scrape_movies_list, _scrape_movie_data
+from tests.conftest import movie_page
+
+
+def _movies_list(imdb, total):
+    links = ''.join('<a href="/title/tt%07d/?ref_=list">Movie %s</a>' % (i, i) for i in range(total))
+    imdb.pages['/list'] = '<html><body>%s<a href="/name/nm1/">Someone</a></body></html>' % links
+    for i in range(total):
+        imdb.pages['/title/tt%07d/' % i] = movie_page('tt%07d' % i, 'Movie %s' % i)
+
+
+def test_scrape_movie_data(imdb):
+    imdb.pages['/title/tt0000001/'] = movie_page('tt0000001', 'Movie 1', rating='7.25')
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0)
+
+    movie_data = _scrape_movie_data('title/tt0000001/', fetcher)
+    assert movie_data['general']['name'] == 'Movie 1'
+    assert movie_data['general']['rating'] == '7.2'
+    assert ('director', 'Director tt0000001') in movie_data['movie_detail']
+    assert movie_data['general']['imdb_id'] == 'tt0000001'
+
+
+def test_movies_list_links_are_canonical(imdb):
+    imdb.pages['/list'] = ('<a href="/title/tt0000001/?ref_=a">1</a><a href="/title/tt0000001/?ref_=b">1</a>'
+                           '<a href="/title/tt0000001/fullcredits">credits</a><a href="/title/tt0000002/">2</a>')
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0)
+
+    assert _scrape_movies_list('/list', fetcher) == ['title/tt0000001/', 'title/tt0000002/']
+
+
+def test_fetcher_retries_and_reuses_connections(imdb):
+    _movies_list(imdb, 12)
+    imdb.fail_once.add('/title/tt0000003/')
+    fetcher = Fetcher(base_url=imdb.base_url, concurrency=4, rate_limit=0, backoff=0)
+
+    links = _scrape_movies_list('/list', fetcher)
+    assert len(links) == 12
+    results = dict(fetcher.map(_scrape_movie_data, links))
+    assert sorted(data['general']['name'] for data in results.values()) == sorted('Movie %s' % i for i in range(12))
+    assert imdb.hits['/title/tt0000003/'] == 2
+    assert fetcher.stats['fetched'] == 13
+
+
+def test_fetcher_stats_from_threads(imdb, tmp_path):
+    _movies_list(imdb, 2)
+    cache = ResponseCache(str(tmp_path))
+    Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0, cache=cache).request('get', imdb.base_url + '/list')
+    fetcher = Fetcher(base_url=imdb.base_url, concurrency=8, cache=cache, offline=True)
+
+    fetched = list(fetcher.map(lambda item, fetcher: fetcher.request('get', imdb.base_url + item), ['/list'] * 2000))
+    assert len(fetched) == 2000
+    assert fetcher.stats['cache_hit'] == 2000
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=20)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.wait('www.imdb.com')
+    limiter.wait('other.host')
+    assert 0.18 <= time.monotonic() - started < 1
+
+
+def test_scrape_home_movies_command(imdb, app, runner):
+    _movies_list(imdb, 5)
+    imdb.pages['/title/tt0000004/'] = '<html>not a movie page</html>'
+
+    result = runner.invoke(args=['scrape-home-movies', '--link', '/list', '--populate', '--concurrency', '3'])
+    assert '5 links in' in result.output
+    assert '4 scraped, 4 populated (4 inserted, 0 updated, 0 unchanged), 1 skipped or failed' in result.output
+
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM movie WHERE name LIKE 'Movie %'").fetchone()[0] == 4
+
+
+def test_response_cache_ttl_and_revalidation(imdb, tmp_path):
+    imdb.pages['/title/tt0000001/'] = movie_page('tt0000001', 'Movie 1')
+    url = imdb.base_url + '/title/tt0000001/'
+    cache = ResponseCache(str(tmp_path), ttl=3600)
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0, cache=cache)
+
+    assert 'Movie 1' in fetcher.request('get', url).text
+    assert 'Movie 1' in fetcher.request('get', url).text
+    assert imdb.hits['/title/tt0000001/'] == 1
+    assert fetcher.stats['cache_hit'] == 1
+
+    cache.ttl = 0
+    assert 'Movie 1' in fetcher.request('get', url).text
+    assert imdb.hits['/title/tt0000001/'] == 2
+    assert fetcher.stats['revalidated'] == 1
+
+    imdb.pages['/title/tt0000001/'] = movie_page('tt0000001', 'Movie 1 (Remastered)')
+    assert 'Remastered' in fetcher.request('get', url).text
+    assert fetcher.stats['fetched'] == 2
+
+
+def test_response_cache_eviction(imdb, tmp_path):
+    for i in range(10):
+        imdb.pages['/title/tt%07d/' % i] = movie_page('tt%07d' % i, 'Movie %s' % i)
+    page_size = len(imdb.pages['/title/tt0000000/'])
+    cache = ResponseCache(str(tmp_path), max_bytes=page_size * 4)
+    fetcher = Fetcher(base_url=imdb.base_url, rate_limit=0, backoff=0, cache=cache)
+
+    for i in range(10):
+        fetcher.request('get', imdb.base_url + '/title/tt%07d/' % i)
+
+    bodies = [name for _, _, files in os.walk(str(tmp_path)) for name in files if name.endswith('.body')]
+    assert 0 < len(bodies) <= 4
+    assert cache.load(imdb.base_url + '/title/tt0000009/') is not None
+    assert cache.load(imdb.base_url + '/title/tt0000000/') is None
+
+
+def test_scrape_home_movies_offline(imdb, app, runner, tmp_path):
+    _movies_list(imdb, 3)
+    app.config['SCRAPE_CACHE_DIR'] = str(tmp_path)
+    runner.invoke(args=['scrape-home-movies', '--link', '/list'])
+    imdb.server.shutdown()
+
+    result = runner.invoke(args=['scrape-home-movies', '--link', '/list', '--populate', '--offline'])
+    assert '3 scraped, 3 populated (3 inserted, 0 updated, 0 unchanged), 0 skipped or failed' in result.output
+    assert '0 http errors, 4 from cache' in result.output
+
+    result = runner.invoke(args=['scrape-movie', 'title/tt9999999/', '--offline'])
+    assert 'None' in result.output
+
+    app.config['SCRAPE_CACHE_DIR'] = None
+    for args in (['scrape-movie', 'title/tt0000001/'], ['scrape-home-movies'], ['crawl']):
+        result = runner.invoke(args=args + ['--offline'])
+        assert result.exit_code == 2 and '--offline needs SCRAPE_CACHE_DIR' in result.output
+
+
+class _SlowDownloads:
+    def __init__(self, events):
+        self.events = events
+
+    def map(self, func, links):
+        for i, link in enumerate(links):
+            if i:
+                time.sleep(0.5)
+            self.events.append('downloaded %s' % link)
+            yield link, movie_page('tt%07d' % i, 'Movie %s' % i)
+
+
+def test_scrape_movies_parse_workers_stream_results():
+    events = []
+    links = ['title/tt%07d/' % i for i in range(4)]
+    for link, movie_data in _scrape_movies(_SlowDownloads(events), links, parse_workers=2):
+        assert movie_data['general']['imdb_id'] == title_id(link)
+        events.append('parsed %s' % link)
+
+    # the first pages are parsed and yielded while the last ones are still downloading
+    assert events.index('parsed title/tt0000000/') < events.index('downloaded title/tt0000003/')
+    assert len(events) == 8
+
+
+def test_scrape_home_movies_parse_workers(imdb, app, runner):
+    _movies_list(imdb, 4)
+    imdb.pages['/title/tt0000003/'] = '<html>not a movie page</html>'
+
+    result = runner.invoke(args=['scrape-home-movies', '--link', '/list', '--populate', '--parse-workers', '2'])
+    assert '3 scraped, 3 populated (3 inserted, 0 updated, 0 unchanged), 1 skipped or failed' in result.output
+
+
+def test_benchmark_parser_command(imdb, app, runner, tmp_path):
+    _movies_list(imdb, 3)
+    app.config['SCRAPE_CACHE_DIR'] = str(tmp_path)
+    runner.invoke(args=['scrape-home-movies', '--link', '/list'])
+
+    result = runner.invoke(args=['benchmark-parser', '--repeat', '1'])
+    assert '4 pages: fast' in result.output
+    assert '0 mismatches' in result.output
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from application import create_app, get_db
+from application.db import get_pool
+from application.slowlog import aggregate_slow_queries, normalize_sql, fingerprint, parameters_shape
+
+
+@pytest.fixture
+def slow_app(app, tmp_path):
+    slow_app = create_app(dict(app.config, SLOW_QUERY_LOG=str(tmp_path / 'slow.jsonl'), SLOW_QUERY_MS=0))
+    yield slow_app
+    get_pool(slow_app).close()
+
+
+def _entries(app):
+    with open(app.config['SLOW_QUERY_LOG']) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM movie WHERE id IN (?, ?, ?) AND name = 'It''s' LIMIT 10") == \
+        "SELECT * FROM movie WHERE id IN (...) AND name = ? LIMIT ?"
+    assert fingerprint(normalize_sql("SELECT * FROM movie WHERE id IN (?, ?)")) == \
+        fingerprint(normalize_sql("SELECT * FROM movie WHERE id IN (?,?,?,?)"))
+    assert normalize_sql("SELECT movie_detail.value FROM t1") == "SELECT movie_detail.value FROM t1"
+    assert parameters_shape((1, 'a', None)) == ['int', 'str', 'NoneType']
+    assert parameters_shape({'id': 1}) == {'id': 'int'}
+    assert parameters_shape(list(range(25)))[-1] == '... 25 parameters'
+
+
+def _lookup_movie(db, name):
+    return db.execute("SELECT * FROM movie WHERE name = ?", (name,)).fetchone()
+
+
+def test_slow_queries_are_logged(slow_app):
+    with slow_app.app_context():
+        db = get_db()
+        assert _lookup_movie(db, 'The Godfather')['id'] == 2
+        assert len(list(db.execute("SELECT id FROM movie WHERE description LIKE '%Batman%'"))) == 1
+        db.execute("UPDATE movie SET rating = rating WHERE id = ?", (1,))
+        db.executemany("UPDATE movie SET rating = rating WHERE id = ?", [(1,), (2,)])
+        db.commit()
+
+    entries = {entry['sql']: entry for entry in _entries(slow_app)}
+    lookup = entries["SELECT * FROM movie WHERE name = ?"]
+    assert lookup['parameters'] == ['str']
+    assert lookup['site'].startswith('tests/test_slowlog.py:') and lookup['site'].endswith('_lookup_movie')
+    assert lookup['plan'] == ['SEARCH movie USING INDEX sqlite_autoindex_movie_1 (name=?)']
+    assert entries["SELECT id FROM movie WHERE description LIKE ?"]['plan'] == ['SCAN movie']
+    updates = [entry for entry in _entries(slow_app) if entry['sql'].startswith('UPDATE movie')]
+    assert [(entry['kind'], entry['parameters']) for entry in updates] == [('execute', ['int']), ('executemany', None)]
+
+
+def test_finalized_cursors_are_logged_later(slow_app, monkeypatch):
+    explained = []
+    monkeypatch.setattr('application.slowlog._query_plan', lambda *args: explained.append(args[1]) or ['plan'])
+    with slow_app.app_context():
+        db = get_db()
+        db.execute("SELECT 1").fetchall()
+        del explained[:]
+        # the cursor is finalized right away, with its first row read
+        _lookup_movie(db, 'The Godfather')
+        assert explained == []
+        db.execute("SELECT COUNT(*) FROM movie").fetchone()
+        assert explained[0] == "SELECT * FROM movie WHERE name = ?"
+
+    sites = {entry['sql']: entry['site'] for entry in _entries(slow_app)}
+    assert sites["SELECT * FROM movie WHERE name = ?"].endswith('_lookup_movie')
+
+
+def test_slow_queries_command(slow_app):
+    with slow_app.app_context():
+        db = get_db()
+        for name in ('The Godfather', 'The Dark Knight'):
+            _lookup_movie(db, name)
+        db.execute("SELECT COUNT(*) FROM movie WHERE description LIKE ?", ('%war%',)).fetchone()
+
+    queries = {query['sql']: query for query in aggregate_slow_queries(_entries(slow_app))}
+    assert queries["SELECT * FROM movie WHERE name = ?"]['calls'] == 2
+    assert queries["SELECT COUNT(*) FROM movie WHERE description LIKE ?"]['full_scan']
+
+    result = slow_app.test_cli_runner().invoke(args=['slow-queries', '--sort', 'calls'])
+    assert result.exit_code == 0, result.output
+    assert 'SELECT * FROM movie WHERE name = ?' in result.output
+    assert 'FULL SCAN' in result.output
+    assert 'plan: SCAN movie' in result.output
+
+
+def test_slow_query_log_disabled(runner):
+    result = runner.invoke(args=['slow-queries'])
+    assert 'set SLOW_QUERY_LOG' in result.output
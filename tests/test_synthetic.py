@@ -0,0 +1,78 @@
+from application import get_db
+from application.leaderboard import backfill_leaderboard
+from application.synthetic import generate_catalog
+
+SYNTHETIC_TABLES = ('movie', 'movie_detail', 'user', 'quiz_state', 'quiz_question', 'question_option', 'quiz_score')
+
+
+# detail row ids come from AUTOINCREMENT and password hashes are salted
+COLUMNS = {'movie_detail': 'movie_id, key, value', 'user': 'id, username, is_activated'}
+
+
+def _dump(db, tables=SYNTHETIC_TABLES):
+    return {table: [tuple(row) for row in db.execute("SELECT %s FROM %s ORDER BY 1, 2, 3"
+                                                     % (COLUMNS.get(table, '*'), table))]
+            for table in tables}
+
+
+def _clear(db, tables=SYNTHETIC_TABLES):
+    for table in tables:
+        db.execute("DELETE FROM %s" % table)
+    db.commit()
+
+
+def test_generate_catalog_is_deterministic(app):
+    with app.app_context():
+        db = get_db()
+        _clear(db, ('movie', 'movie_detail'))
+        generate_catalog(db, 30, seed=7, batch_size=8)
+        first = _dump(db, ('movie', 'movie_detail'))
+        _clear(db, ('movie', 'movie_detail'))
+        generate_catalog(db, 30, seed=7)
+
+        assert len(first['movie']) == 30
+        assert len(first['movie_detail']) >= 30 * 6
+        assert _dump(db, ('movie', 'movie_detail')) == first
+        assert db.execute("SELECT COUNT(DISTINCT movie_id) FROM movie_detail WHERE key = 'genre'").fetchone()[0] == 30
+
+
+def test_seed_synthetic(app, runner, client):
+    with app.app_context():
+        _clear(get_db())
+    args = ['seed-synthetic', '--movies', '60', '--users', '20', '--quizzes', '50', '--expired', '0.5', '--seed', '3']
+    result = runner.invoke(args=args)
+    assert result.exit_code == 0, result.output
+    assert '50 quizzes generated' in result.output
+
+    with app.app_context():
+        db = get_db()
+        first = _dump(db)
+        assert len(first['movie']) == 60
+        assert len(first['user']) == 20
+        assert len(first['quiz_state']) == len(first['quiz_score']) == 50
+        assert db.execute("SELECT COUNT(*) FROM quiz_state WHERE locked = 0").fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM quiz_state INNER JOIN user ON user.id = quiz_state.user_id "
+                          "WHERE user.is_activated = 0").fetchone()[0] == 0
+        # every question has 4 options and one correct answer, answers point at the options of their question
+        assert db.execute("SELECT COUNT(*) FROM question_option GROUP BY question_id "
+                          "HAVING COUNT(*) != 4 OR SUM(is_correct) != 1").fetchall() == []
+        assert db.execute("SELECT COUNT(*) FROM quiz_question LEFT JOIN question_option "
+                          "ON question_option.id = quiz_question.user_answer "
+                          "WHERE quiz_question.user_answer IS NOT NULL AND (question_option.question_id IS NULL "
+                          "OR question_option.question_id != quiz_question.id)").fetchone()[0] == 0
+        # expired quizzes stopped at an unanswered question
+        assert db.execute("SELECT COUNT(*) FROM quiz_state WHERE (SELECT COUNT(*) FROM quiz_question "
+                          "WHERE quiz_id = quiz_state.id) < 10").fetchone()[0] > 0
+
+        # the materialized scores match the answers
+        backfill_leaderboard(db)
+        assert _dump(db)['quiz_score'] == first['quiz_score']
+
+        _clear(db)
+    assert runner.invoke(args=args).exit_code == 0
+    with app.app_context():
+        assert _dump(get_db()) == first
+
+    username = next(row[1] for row in first['user'] if row[2])
+    assert client.post('/auth/login', data={'username': username, 'password': 'synthetic'}).status_code == 302
+    assert client.get('/').status_code == 200